@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""Measure the LMtoolbox commands end to end, against a local mock of the OpenAI API.
+
+Starts ``benchmarks/mock_server.py`` in the background, and runs each ``[project.scripts]``
+command of LMtoolbox in a fresh interpreter, in an isolated home directory, with its output
+piped (the same ``process_command`` path as ``summarize ... | less``). For each command,
+records:
+
+- the cold start: the time from the start of the process to the request received by the
+  server, on the first run (the templates are installed, nothing is cached);
+- the warm start: the same time on the next runs;
+- the time to the first byte of the response on ``stdout``, and the total latency;
+- the peak RSS of the process.
+
+Then runs ``--concurrency`` ``explain`` commands at the same time, and ``lmtoolbox batch``
+with as many workers, to record the throughput. The results can be written to JSON, and
+compared to the results of another commit with ``--compare``.
+
+Runs offline, but the ``tiktoken`` encodings must be in its cache (run any command once
+with network access).
+
+Usage::
+
+    python benchmarks/end_to_end.py --json results.json
+    python benchmarks/end_to_end.py --latency 0.5 --token-rate 50 --error-rate 0.1
+    python benchmarks/end_to_end.py --commands explain summarize --compare main.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from mock_server import ServerConfig, add_server_arguments, get_server_config, start_server
+from startup import get_entry_points
+
+SAMPLE_CODE = """def average(values):
+    total = 0
+    for value in values:
+        total += value
+    return total / len(values)
+"""
+
+
+@dataclass
+class Run:
+    """The measurements of one run of a command, in milliseconds and megabytes."""
+
+    start_ms: float | None
+    first_byte_ms: float | None
+    latency_ms: float
+    peak_rss_mb: float
+    returncode: int
+    requests: int
+
+
+def prepare_workspace(directory: Path, page_url: str) -> dict[str, tuple[list[str], str]]:
+    """
+    Creates the files the commands need, and returns the arguments and the `stdin` of each
+    command.
+    """
+    (directory / "sample.py").write_text(SAMPLE_CODE)
+
+    repository = directory / "repository"
+    repository.mkdir()
+    git = ["git", "-c", "user.name=Benchmark", "-c", "user.email=benchmark@example.com"]
+    subprocess.run([*git, "init", "-q"], cwd=repository, check=True)
+    (repository / "sample.py").write_text(SAMPLE_CODE)
+    subprocess.run([*git, "add", "sample.py"], cwd=repository, check=True)
+
+    jobs = directory / "jobs.jsonl"
+    jobs.write_text(
+        "".join(
+            json.dumps({"command": "translate", "input": f"Bonjour {index}"}) + "\n"
+            for index in range(8)
+        )
+    )
+
+    return {
+        "cheermeup": (["--no-cache", "tired"], ""),
+        "codereview": (["--no-cache", str(directory / "sample.py")], ""),
+        "commitgen": (["--no-cache"], ""),
+        "critique": (["--no-cache", "A short essay on benchmarks."], ""),
+        "define": (["--no-cache", "ephemeral"], ""),
+        "explain": (["--no-cache", "recursion"], ""),
+        "lessonize": (["--no-cache", "photosynthesis"], ""),
+        "life": (["--no-cache"], "Benchmark\n1990-01-01\n"),
+        "lmtoolbox": (["batch", "--no-cache", str(jobs)], ""),
+        "pathlearner": (["--no-cache", "Rust"], ""),
+        "proofread": (["--no-cache", "Their is a typo hear."], ""),
+        "study": (["--no-cache", "The French Revolution"], ""),
+        "summarize": (["--no-cache", page_url], ""),
+        "teachlib": (["--no-cache", "click"], ""),
+        "thesaurus": (["--no-cache", "happy"], ""),
+        "translate": (["--no-cache", "Bonjour"], ""),
+    }
+
+
+def make_environment(home: Path, base_url: str) -> dict[str, str]:
+    (home / ".config" / "lmt").mkdir(parents=True, exist_ok=True)
+    (home / ".config" / "lmt" / "key.env").write_text("sk-benchmark")
+    environment = {
+        key: value for key, value in os.environ.items() if not key.startswith(("OPENAI_", "XDG_"))
+    }
+    environment.update(
+        HOME=str(home),
+        OPENAI_BASE_URL=base_url,
+        OPENAI_API_KEY="sk-benchmark",
+        LMTOOLBOX_NO_DAEMON="1",
+    )
+    return environment
+
+
+def run_command(
+    name: str,
+    value: str,
+    args: list[str],
+    stdin: str,
+    environment: dict[str, str],
+    cwd: Path,
+    server,
+) -> Run:
+    """
+    Runs a console script in a fresh interpreter, and measures it.
+    """
+    module, attribute = value.split(":")
+    code = f"import sys\nfrom {module} import {attribute} as main\nsys.argv[0] = {name!r}\nmain()"
+    first_request = len(server.stats)
+
+    with tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-c", code, *args],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            cwd=cwd,
+            env=environment,
+        )
+        process.stdin.write(stdin.encode("utf-8"))
+        process.stdin.close()
+
+        first_byte_ms = None
+        if process.stdout.read(1):
+            first_byte_ms = (time.perf_counter() - start) * 1000
+            process.stdout.read()
+        process.stdout.close()
+
+        # `wait4()` gives the resource usage of this process only.
+        _, status, usage = os.wait4(process.pid, 0)
+        latency_ms = (time.perf_counter() - start) * 1000
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+    requests = server.stats.since(first_request)
+    # `ru_maxrss` is in kilobytes on Linux, and in bytes on macOS.
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    return Run(
+        start_ms=(requests[0].received - start) * 1000 if requests else None,
+        first_byte_ms=first_byte_ms,
+        latency_ms=latency_ms,
+        peak_rss_mb=usage.ru_maxrss * rss_unit / 2**20,
+        returncode=process.returncode,
+        requests=len(requests),
+    )
+
+
+def median(values: list[float | None]) -> float | None:
+    values = [value for value in values if value is not None]
+    return statistics.median(values) if values else None
+
+
+def summarize_runs(runs: list[Run]) -> dict:
+    cold, warm = runs[0], runs[1:] or runs
+    return {
+        "cold_start_ms": cold.start_ms,
+        "cold_latency_ms": cold.latency_ms,
+        "warm_start_ms": median([run.start_ms for run in warm]),
+        "first_byte_ms": median([run.first_byte_ms for run in warm]),
+        "latency_ms": median([run.latency_ms for run in warm]),
+        "peak_rss_mb": max(run.peak_rss_mb for run in runs),
+        "requests": sum(run.requests for run in runs),
+        "failed_runs": sum(run.returncode != 0 for run in runs),
+        "runs": [asdict(run) for run in runs],
+    }
+
+
+def measure_throughput(
+    name: str,
+    value: str,
+    args: list[str],
+    stdin: str,
+    processes: int,
+    environment: dict[str, str],
+    cwd: Path,
+    server,
+) -> dict:
+    """
+    Runs `processes` commands at the same time, and returns the requests and tokens
+    completed per second.
+    """
+    first_request = len(server.stats)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=processes) as executor:
+        runs = list(
+            executor.map(
+                lambda _: run_command(name, value, args, stdin, environment, cwd, server),
+                range(processes),
+            )
+        )
+    elapsed = time.perf_counter() - start
+    requests = [record for record in server.stats.since(first_request) if record.status == 200]
+    return {
+        "command": name if name != "lmtoolbox" else " ".join([name, args[0]]),
+        "processes": processes,
+        "elapsed_s": elapsed,
+        "requests_per_s": len(requests) / elapsed,
+        "output_tokens_per_s": sum(record.output_tokens for record in requests) / elapsed,
+        "latency_ms": median([run.latency_ms for run in runs]),
+        "failed_runs": sum(run.returncode != 0 for run in runs),
+    }
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_ms(value: float | None) -> str:
+    return f"{value:8.1f}" if value is not None else f"{'-':>8}"
+
+
+def print_results(results: dict, baseline: dict | None) -> None:
+    print(
+        f"{'command':<14} {'cold':>8} {'warm':>8} {'1st byte':>8} {'latency':>8}"
+        f" {'RSS MB':>7} {'failed':>6}"
+    )
+    for name, result in results["commands"].items():
+        line = (
+            f"{name:<14} {format_ms(result['cold_start_ms'])} {format_ms(result['warm_start_ms'])}"
+            f" {format_ms(result['first_byte_ms'])} {format_ms(result['latency_ms'])}"
+            f" {result['peak_rss_mb']:7.1f} {result['failed_runs']:>6}"
+        )
+        previous = (baseline or {}).get("commands", {}).get(name)
+        if previous and previous.get("latency_ms") and result["latency_ms"]:
+            change = result["latency_ms"] / previous["latency_ms"] - 1
+            line += f"  latency {change:+.0%} vs {(baseline.get('commit') or 'baseline')[:10]}"
+        print(line)
+
+    for throughput in results["throughput"]:
+        print(
+            f"{throughput['command']} x{throughput['processes']}:"
+            f" {throughput['requests_per_s']:.1f} requests/s,"
+            f" {throughput['output_tokens_per_s']:.0f} output tokens/s,"
+            f" median latency {format_ms(throughput['latency_ms']).strip()} ms"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command, the first cold.")
+    parser.add_argument(
+        "--commands", nargs="+", help="Only run these commands (default: all of them)."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Commands or batch workers run at the same time for the throughput.",
+    )
+    parser.add_argument("--json", type=Path, help="Also write the results to this JSON file.")
+    parser.add_argument(
+        "--compare", type=Path, help="Compare the latencies to the results in this JSON file."
+    )
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    entry_points = get_entry_points()
+    names = args.commands or sorted(entry_points)
+    unknown = sorted(set(names) - set(entry_points))
+    if unknown:
+        print(f"Unknown commands: {', '.join(unknown)}.", file=sys.stderr)
+        return 1
+
+    config: ServerConfig = get_server_config(args)
+    server = start_server(config)
+    host, port = server.server_address[:2]
+    results = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "server": asdict(config),
+        "commands": {},
+        "throughput": [],
+    }
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="lmtoolbox-benchmark-") as directory:
+            directory = Path(directory)
+            commands = prepare_workspace(directory, f"http://{host}:{port}/page.html")
+            for name in names:
+                # A fresh home per command, so that its first run is cold.
+                home = directory / f"home-{name}"
+                environment = make_environment(home, server.base_url)
+                cwd = directory / "repository" if name == "commitgen" else directory
+                command_args, stdin = commands[name]
+                runs = [
+                    run_command(
+                        name, entry_points[name], command_args, stdin, environment, cwd, server
+                    )
+                    for _ in range(args.runs)
+                ]
+                results["commands"][name] = summarize_runs(runs)
+
+            # Concurrent processes, then concurrent requests in one process.
+            environment = make_environment(directory / "home-throughput", server.base_url)
+            throughput_runs = [
+                ("explain", commands["explain"][0], args.concurrency),
+                ("lmtoolbox", [*commands["lmtoolbox"][0], "--workers", str(args.concurrency)], 1),
+            ]
+            for name, command_args, processes in throughput_runs:
+                if name in names:
+                    results["throughput"].append(
+                        measure_throughput(
+                            name,
+                            entry_points[name],
+                            command_args,
+                            "",
+                            processes,
+                            environment,
+                            directory,
+                            server,
+                        )
+                    )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_results(results, baseline)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+    failed = [name for name, result in results["commands"].items() if result["failed_runs"]]
+    if failed and not config.error_rate:
+        print(f"FAIL: {', '.join(failed)} exited with errors.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Measure the token reduction of the main-content extraction of web pages.
+
+For each saved HTML page of the fixture corpus (``tests/fixtures/html`` by default),
+counts the tokens of the text given by ``strip_tags`` and of the extracted main content,
+and records the best time of each over several runs. Runs offline.
+
+Usage::
+
+    python benchmarks/extraction.py
+    python benchmarks/extraction.py --corpus path/to/pages --model gpt-4o --json results.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from lmtoolbox import chunking, extraction
+
+DEFAULT_CORPUS = Path(__file__).parent.parent / "tests" / "fixtures" / "html"
+
+
+def best_time(function, runs: int) -> float:
+    """Return the best wall-clock time of `function()`, in milliseconds."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def measure_page(path: Path, model: str, runs: int) -> dict:
+    """Return the tokens and timings of `strip_tags` and of the extraction for a page."""
+    html = path.read_text(encoding="utf-8", errors="replace")
+    stripped = extraction.strip_all_tags(html)
+    extracted = extraction.extract_main_content(html)
+    stripped_tokens = chunking.count_tokens(stripped, model)
+    extracted_tokens = chunking.count_tokens(extracted, model)
+    return {
+        "page": path.name,
+        "bytes": len(html.encode("utf-8")),
+        "strip_tags_tokens": stripped_tokens,
+        "extracted_tokens": extracted_tokens,
+        "reduction": 1 - extracted_tokens / stripped_tokens if stripped_tokens else 0.0,
+        "strip_tags_ms": best_time(lambda: extraction.strip_all_tags(html), runs),
+        "extraction_ms": best_time(lambda: extraction.extract_main_content(html), runs),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--corpus", type=Path, default=DEFAULT_CORPUS, help="Directory of HTML pages."
+    )
+    parser.add_argument("--model", default="gpt-4o", help="Model whose tokenizer is used.")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per measurement.")
+    parser.add_argument("--json", type=Path, help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    pages = sorted(args.corpus.glob("*.html"))
+    if not pages:
+        print(f"No HTML pages in {args.corpus}.", file=sys.stderr)
+        return 1
+
+    results = [measure_page(path, args.model, args.runs) for path in pages]
+
+    print(f"{'page':<24} {'strip_tags':>10} {'extracted':>10} {'saved':>6} {'time':>10}")
+    for result in results:
+        print(
+            f"{result['page']:<24} {result['strip_tags_tokens']:>10} "
+            f"{result['extracted_tokens']:>10} {result['reduction']:>6.0%} "
+            f"{result['extraction_ms']:>7.2f} ms"
+        )
+    stripped_total = sum(result["strip_tags_tokens"] for result in results)
+    extracted_total = sum(result["extracted_tokens"] for result in results)
+    print(
+        f"{'total':<24} {stripped_total:>10} {extracted_total:>10} "
+        f"{1 - extracted_total / stripped_total if stripped_total else 0:>6.0%}"
+    )
+
+    if args.json:
+        args.json.write_text(json.dumps({"model": args.model, "pages": results}, indent=2))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""Serve a local stand-in for the OpenAI chat completions API.
+
+The server answers ``POST /v1/chat/completions``, streamed or not, with a canned response
+of ``--response-tokens`` words. The first token is sent after ``--latency`` seconds, and
+the next ones at ``--token-rate`` tokens per second. A share of the requests
+(``--error-rate``) fail with ``--error-status`` instead, to exercise the retries. It also
+serves a small HTML page at ``/page.html``, for ``summarize``.
+
+Point the commands to it with ``OPENAI_BASE_URL=http://127.0.0.1:<port>/v1``. Used by
+``benchmarks/end_to_end.py``; it can also be run on its own.
+
+Usage::
+
+    python benchmarks/mock_server.py --port 8000 --latency 0.2 --token-rate 200
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPONSE_TEXT = (
+    "the quick brown fox jumps over the lazy dog while the model writes a steady stream of"
+    " plausible tokens for the benchmark"
+)
+WORDS = RESPONSE_TEXT.split()
+
+PAGE = (
+    "<html><head><title>Benchmark page</title></head><body>"
+    "<nav><a href='/'>Home</a> <a href='/about'>About</a></nav>"
+    "<article><h1>A page to summarize</h1>"
+    + "".join(f"<p>{' '.join(WORDS)} (paragraph {index}).</p>" for index in range(40))
+    + "</article><footer>Copyright</footer></body></html>"
+)
+
+
+@dataclass
+class ServerConfig:
+    """How the server behaves: delays in seconds, rates in tokens per second."""
+
+    latency: float = 0.05
+    token_rate: float = 500.0
+    response_tokens: int = 100
+    error_rate: float = 0.0
+    error_status: int = 500
+    seed: int = 0
+
+
+@dataclass
+class RequestRecord:
+    """A request received by the server, with `time.perf_counter()` timestamps."""
+
+    path: str
+    received: float
+    finished: float = 0.0
+    status: int = 200
+    stream: bool = False
+    output_tokens: int = 0
+
+
+@dataclass
+class ServerStats:
+    records: list[RequestRecord] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, record: RequestRecord) -> None:
+        with self.lock:
+            self.records.append(record)
+
+    def since(self, index: int) -> list[RequestRecord]:
+        with self.lock:
+            return self.records[index:]
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.records)
+
+
+class MockServer(ThreadingHTTPServer):
+    """An OpenAI-compatible server with configurable latency, token rate and errors."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: ServerConfig):
+        super().__init__(address, MockHandler)
+        self.config = config
+        self.stats = ServerStats()
+        self._random = random.Random(config.seed)
+        self._random_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def should_fail(self) -> bool:
+        with self._random_lock:
+            return self._random.random() < self.config.error_rate
+
+    def start(self) -> threading.Thread:
+        """Serve in a daemon thread. Stop with `shutdown()`."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/page.html":
+            self.send_json(404, {"error": {"message": "Not found", "type": "not_found"}})
+            return
+        body = PAGE.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        record = RequestRecord(self.path, time.perf_counter())
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            body = {}
+        record.stream = bool(body.get("stream"))
+
+        try:
+            if not self.path.endswith("/chat/completions"):
+                record.status = 404
+                self.send_json(404, {"error": {"message": "Not found", "type": "not_found"}})
+            elif self.server.should_fail():
+                record.status = self.server.config.error_status
+                self.send_json(
+                    record.status,
+                    {"error": {"message": "Injected error", "type": "server_error"}},
+                )
+            elif record.stream:
+                record.output_tokens = self.stream_completion(body)
+            else:
+                record.output_tokens = self.send_completion(body)
+        except (BrokenPipeError, ConnectionResetError):
+            record.status = 499
+        finally:
+            record.finished = time.perf_counter()
+            self.server.stats.add(record)
+
+    def send_json(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def iter_tokens(self):
+        """Yield the tokens of the response, paced by the latency and the token rate."""
+        config = self.server.config
+        time.sleep(config.latency)
+        interval = 1 / config.token_rate if config.token_rate > 0 else 0
+        for index in range(config.response_tokens):
+            if index and interval:
+                time.sleep(interval)
+            yield WORDS[index % len(WORDS)] + " "
+
+    def usage(self, body: dict, output_tokens: int) -> dict:
+        # Four characters per token, as a rough count.
+        input_tokens = sum(
+            len(str(message.get("content", ""))) for message in body.get("messages", [])
+        )
+        input_tokens //= 4
+        return {
+            "prompt_tokens": input_tokens,
+            "completion_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def send_completion(self, body: dict) -> int:
+        content = "".join(self.iter_tokens())
+        tokens = self.server.config.response_tokens
+        self.send_json(
+            200,
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": self.usage(body, tokens),
+            },
+        )
+        return tokens
+
+    def stream_completion(self, body: dict) -> int:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "mock")
+
+        def send_chunk(choices: list, **extra) -> None:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": choices,
+                **extra,
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        tokens = 0
+        for token in self.iter_tokens():
+            delta = {"content": token} if tokens else {"role": "assistant", "content": token}
+            send_chunk([{"index": 0, "delta": delta, "finish_reason": None}])
+            tokens += 1
+        send_chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send_chunk([], usage=self.usage(body, tokens))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        return tokens
+
+
+def start_server(config: ServerConfig, host: str = "127.0.0.1", port: int = 0) -> MockServer:
+    """Start a server in a background thread, on a free port by default."""
+    server = MockServer((host, port), config)
+    server.start()
+    return server
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = ServerConfig()
+    parser.add_argument(
+        "--latency", type=float, default=defaults.latency, help="Seconds before the first token."
+    )
+    parser.add_argument(
+        "--token-rate", type=float, default=defaults.token_rate, help="Tokens per second."
+    )
+    parser.add_argument(
+        "--response-tokens",
+        type=int,
+        default=defaults.response_tokens,
+        help="Tokens per response.",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=defaults.error_rate,
+        help="Share of the requests that fail, from 0 to 1.",
+    )
+    parser.add_argument(
+        "--error-status",
+        type=int,
+        default=defaults.error_status,
+        help="HTTP status of the failed requests (e.g. 429 or 500).",
+    )
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="Seed of the errors.")
+
+
+def get_server_config(args: argparse.Namespace) -> ServerConfig:
+    return ServerConfig(
+        latency=args.latency,
+        token_rate=args.token_rate,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on.")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    config = get_server_config(args)
+    server = MockServer((args.host, args.port), config)
+    print(f"Serving on {server.base_url} with {json.dumps(asdict(config))}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
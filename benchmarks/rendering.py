@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""Measure the cost of rendering a streamed Markdown response in the terminal.
+
+Streams a synthetic response of several thousand lines (headings, paragraphs, lists and
+code blocks), in chunks of about one token, through two renderers writing to a terminal
+console on ``/dev/null``:
+
+- ``full``: what ``lmterminal`` does, re-parsing the whole response on each chunk and
+  re-rendering it at each refresh of the live display;
+- ``incremental``: ``lmtoolbox.rendering.MarkdownStream``, which renders each finished
+  block once and only re-renders the open block.
+
+The live display is refreshed every ``--chunks-per-refresh`` chunks (a model streaming 100
+tokens per second, with 25 refreshes per second, gives 4). The full renderer is quadratic,
+so it is only measured up to ``--full-max-lines``. Runs offline.
+
+Usage::
+
+    python benchmarks/rendering.py
+    python benchmarks/rendering.py --lines 1000 2000 5000 --json results.json
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+from rich.console import Console
+from rich.live import Live
+from rich.markdown import Markdown
+
+from lmtoolbox.rendering import MarkdownStream
+
+SECTION = """## Section {index}
+
+The renderer receives this paragraph one token at a time, as the model writes it. It wraps
+over several lines, with **bold** and `inline code`, like a paragraph of a long review.
+
+1. A first numbered point about the section {index}.
+2. A second point, with a [link](https://example.com/{index}).
+3. A third point.
+
+- A bullet
+- Another bullet
+  - A nested bullet
+
+```python
+def section_{index}(values):
+    total = 0
+    for value in values:
+        total += value
+    return total
+```
+
+> A quote to finish the section.
+
+"""
+
+
+def make_response(lines: int) -> str:
+    """Return a Markdown response of about `lines` lines."""
+    section_lines = SECTION.count("\n")
+    sections = [
+        SECTION.format(index=index) for index in range(max(1, round(lines / section_lines)))
+    ]
+    return "# Response\n\n" + "".join(sections)
+
+
+def split_chunks(text: str) -> list[str]:
+    """Split a response in chunks of about one token: a word and the spaces after it."""
+    return re.findall(r"\S*\s*", text)[:-1]
+
+
+def make_console(file) -> Console:
+    return Console(file=file, force_terminal=True, color_system="truecolor", width=100, height=50)
+
+
+def render_full(chunks: list[str], console: Console, chunks_per_refresh: int) -> list[float]:
+    """Render like `lmterminal`, and return the time of each chunk, in milliseconds."""
+    timings = []
+    buffer = ""
+    with Live(console=console, auto_refresh=False) as live:
+        for index, chunk in enumerate(chunks, 1):
+            start = time.perf_counter()
+            buffer += chunk
+            live.update(Markdown(buffer), refresh=index % chunks_per_refresh == 0)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def render_incremental(chunks: list[str], console: Console, chunks_per_refresh: int) -> list[float]:
+    """Render with a `MarkdownStream`, and return the time of each chunk, in milliseconds."""
+    timings = []
+    with MarkdownStream(console, refresh_per_second=None) as stream:
+        for index, chunk in enumerate(chunks, 1):
+            start = time.perf_counter()
+            stream.write(chunk)
+            if index % chunks_per_refresh == 0:
+                stream.refresh()
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings: list[float]) -> dict:
+    """Return the total time, and the mean time of the chunks of the last tenth."""
+    tail = timings[-max(1, len(timings) // 10) :]
+    return {
+        "total_ms": round(sum(timings), 1),
+        "last_chunks_ms": round(sum(tail) / len(tail), 3),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--lines",
+        type=int,
+        nargs="+",
+        default=[250, 500, 1000, 2000, 5000],
+        help="Lengths of the responses, in lines.",
+    )
+    parser.add_argument(
+        "--chunks-per-refresh", type=int, default=4, help="Chunks between two refreshes."
+    )
+    parser.add_argument(
+        "--full-max-lines",
+        type=int,
+        default=1000,
+        help="Longest response rendered with the full renderer.",
+    )
+    parser.add_argument("--json", type=Path, help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = []
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        for lines in args.lines:
+            chunks = split_chunks(make_response(lines))
+            result = {"lines": lines, "chunks": len(chunks)}
+            result["incremental"] = summarize(
+                render_incremental(chunks, make_console(devnull), args.chunks_per_refresh)
+            )
+            if lines <= args.full_max_lines:
+                result["full"] = summarize(
+                    render_full(chunks, make_console(devnull), args.chunks_per_refresh)
+                )
+            results.append(result)
+
+    print(
+        f"{'lines':>6} {'chunks':>7} {'full':>11} {'incremental':>11} {'speedup':>8}"
+        f" {'full/chunk':>11} {'incr/chunk':>11}"
+    )
+    for result in results:
+        incremental = result["incremental"]
+        full = result.get("full")
+        if full:
+            full_total = f"{full['total_ms']:.0f} ms"
+            speedup = f"{full['total_ms'] / incremental['total_ms']:.1f}x"
+            full_chunk = f"{full['last_chunks_ms']:.3f} ms"
+        else:
+            full_total = speedup = full_chunk = "-"
+        print(
+            f"{result['lines']:>6} {result['chunks']:>7} {full_total:>11}"
+            f" {incremental['total_ms']:>8.0f} ms {speedup:>8} {full_chunk:>11}"
+            f" {incremental['last_chunks_ms']:>8.3f} ms"
+        )
+    print("(per chunk: the mean time of the chunks of the last tenth of the response)")
+
+    if args.json:
+        args.json.write_text(
+            json.dumps({"chunks_per_refresh": args.chunks_per_refresh, "runs": results}, indent=2)
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Measure the cold start of the LMtoolbox console scripts.
+
+For each ``[project.scripts]`` entry point of LMtoolbox, runs ``<script> --help`` in a
+fresh interpreter and records the best wall-clock time over several runs. Also runs
+``python -X importtime -c "import lmtoolbox.cli"`` to report the cumulative import time
+and check that no heavy dependency is imported eagerly.
+
+Exits with a non-zero status when a budget is exceeded.
+
+Usage::
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --help-budget-ms 200 --import-budget-ms 60 --runs 10
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from importlib import metadata
+
+# Modules that must only be imported by the commands that need them.
+HEAVY_MODULES = (
+    "lmterminal.lib",
+    "lmterminal.templates",
+    "openai",
+    "requests",
+    "strip_tags",
+    "tiktoken",
+    "validators",
+    "yaml",
+    "youtube_transcript_api",
+)
+
+
+def get_entry_points() -> dict[str, str]:
+    """Return the console scripts provided by the `lmtoolbox` package."""
+    scripts = metadata.entry_points(group="console_scripts")
+    return {
+        entry_point.name: entry_point.value
+        for entry_point in scripts
+        if entry_point.value.startswith("lmtoolbox.")
+    }
+
+
+def time_help(name: str, value: str, runs: int) -> float:
+    """Return the best wall-clock time of `<script> --help`, in milliseconds."""
+    module, attribute = value.split(":")
+    code = f"import sys\nfrom {module} import {attribute} as main\nsys.argv[0] = {name!r}\nmain()"
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", code, "--help"],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def measure_import(runs: int) -> tuple[float, list[str]]:
+    """
+    Return the best cumulative import time of `lmtoolbox.cli`, in milliseconds,
+    and the heavy modules it imported.
+    """
+    timings = []
+    imported = set()
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import lmtoolbox.cli"],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            fields = line.removeprefix("import time:").split("|")
+            if len(fields) != 3 or not fields[1].strip().isdigit():
+                continue
+            module = fields[2].strip()
+            if module == "lmtoolbox.cli":
+                timings.append(int(fields[1]) / 1000)
+            if module in HEAVY_MODULES:
+                imported.add(module)
+    return min(timings), sorted(imported)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Runs per measurement.")
+    parser.add_argument(
+        "--help-budget-ms",
+        type=float,
+        default=300,
+        help="Maximum wall-clock time of `<script> --help`.",
+    )
+    parser.add_argument(
+        "--import-budget-ms",
+        type=float,
+        default=100,
+        help="Maximum cumulative import time of `lmtoolbox.cli`.",
+    )
+    args = parser.parse_args()
+
+    failures = []
+
+    import_ms, heavy_modules = measure_import(args.runs)
+    print(f"{'import lmtoolbox.cli':<24} {import_ms:8.1f} ms")
+    if import_ms > args.import_budget_ms:
+        failures.append(f"import lmtoolbox.cli: {import_ms:.1f} ms > {args.import_budget_ms} ms")
+    if heavy_modules:
+        failures.append(f"heavy modules imported eagerly: {', '.join(heavy_modules)}")
+
+    for name, value in sorted(get_entry_points().items()):
+        help_ms = time_help(name, value, args.runs)
+        print(f"{name + ' --help':<24} {help_ms:8.1f} ms")
+        if help_ms > args.help_budget_ms:
+            failures.append(f"{name} --help: {help_ms:.1f} ms > {args.help_budget_ms} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
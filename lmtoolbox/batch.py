@@ -0,0 +1,315 @@
+"""
+Batch runner: runs the template commands over a JSONL file of jobs.
+
+Each line of the input is a job:
+
+    {"command": "translate", "input": "Bonjour", "model": "gpt-5-nano", "temperature": 0.2}
+
+`command` is the name of a template (`translate`, `proofread`, `define`, `summarize`, ...) and
+`input` its prompt. `model` and `temperature` are optional, and default to the options of
+`lmtoolbox batch`. `model` accepts the same names and aliases as `--model`. Any `id` is copied
+to the result.
+
+The jobs run concurrently, and each result is written as a JSON line as soon as it can be:
+in the order of the input, or in the order of completion. The successful results are also
+appended to a checkpoint file, so that an interrupted run can be resumed without repeating
+them.
+"""
+
+import hashlib
+import json
+import math
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TextIO
+
+import click
+
+DEFAULT_WORKERS = 4
+
+
+@dataclass
+class Job:
+    """
+    A line of the input, parsed.
+    """
+
+    index: int
+    command: str
+    input: str
+    model: str
+    temperature: float
+    id: object = None
+    error: str | None = None
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Identifies the job in the checkpoint: its line number and its content.
+        """
+        job = [self.index, self.command, self.input, self.model, self.temperature, self.id]
+        return hashlib.sha256(json.dumps(job).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Result:
+    """
+    The outcome of a job.
+    """
+
+    job: Job
+    output: str | None = None
+    error: str | None = None
+    latency: float = 0.0
+    cached: bool = False
+
+    def to_dict(self) -> dict:
+        result = {"index": self.job.index}
+        if self.job.id is not None:
+            result["id"] = self.job.id
+        result.update(
+            command=self.job.command,
+            model=self.job.model,
+            output=self.output,
+            error=self.error,
+            latency=round(self.latency, 3),
+            cached=self.cached,
+        )
+        return result
+
+
+@dataclass
+class Summary:
+    """
+    Counters and latencies of a run.
+    """
+
+    succeeded: int = 0
+    failed: int = 0
+    resumed: int = 0
+    cached: int = 0
+    elapsed: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+
+    def add(self, result: Result) -> None:
+        if result.error is not None:
+            self.failed += 1
+            return
+        self.succeeded += 1
+        if result.cached:
+            self.cached += 1
+        else:
+            self.latencies.append(result.latency)
+
+    def format(self) -> str:
+        completed = self.succeeded + self.failed
+        lines = [
+            (
+                f"{completed} jobs in {self.elapsed:.1f}s"
+                f" ({completed / self.elapsed if self.elapsed else 0:.2f} jobs/s):"
+                f" {self.succeeded} succeeded ({self.cached} cached), {self.failed} failed,"
+                f" {self.resumed} resumed from the checkpoint."
+            )
+        ]
+        if self.latencies:
+            lines.append(
+                "Latency:"
+                f" p50 {percentile(self.latencies, 50):.2f}s,"
+                f" p95 {percentile(self.latencies, 95):.2f}s,"
+                f" max {max(self.latencies):.2f}s."
+            )
+        return "\n".join(lines)
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """
+    Returns the nearest-rank percentile of `values`.
+    """
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def parse_jobs(lines: Iterable[str], model: str, temperature: float) -> Iterator[Job]:
+    """
+    Parses the lines of a JSONL file of jobs. Blank lines are skipped.
+
+    A line that is not a valid job gives a job with an `error`, so that it is reported in the
+    results without stopping the run.
+    """
+    from lmterminal.cli import validate_model_name
+
+    for index, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+
+        try:
+            job = json.loads(line)
+        except json.JSONDecodeError as error:
+            yield Job(index, "", "", model, temperature, error=f"Invalid JSON: {error}")
+            continue
+        if not isinstance(job, dict):
+            yield Job(index, "", "", model, temperature, error="A job must be a JSON object.")
+            continue
+
+        command = job.get("command")
+        prompt_input = job.get("input")
+        job_model = job.get("model")
+        parsed = Job(
+            index,
+            command if isinstance(command, str) else "",
+            prompt_input if isinstance(prompt_input, str) else "",
+            str(job_model) if job_model else model,
+            job.get("temperature", temperature),
+            id=job.get("id"),
+        )
+        if not isinstance(command, str) or not command:
+            parsed.error = "Missing `command`."
+        elif not isinstance(prompt_input, str):
+            parsed.error = "Missing `input`."
+        elif not isinstance(parsed.temperature, int | float) or not 0 <= parsed.temperature <= 2:
+            parsed.error = "`temperature` must be a number between 0 and 2."
+        elif job_model:
+            # The same validation and aliases as the `--model` option.
+            try:
+                parsed.model = validate_model_name(None, None, parsed.model)
+            except click.BadParameter:
+                parsed.error = (
+                    f"Invalid `model`: {parsed.model}. To see the model names and their"
+                    " aliases, use: lmt models"
+                )
+        yield parsed
+
+
+class Checkpoint:
+    """
+    Append-only JSONL file of the successful results of a run, keyed on the job fingerprints.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.results: dict[str, dict] = {}
+        if path.exists():
+            with path.open(encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last line of an interrupted write.
+                        continue
+                    self.results[entry["fingerprint"]] = entry["result"]
+        self.file = path.open("a", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def get(self, job: Job) -> dict | None:
+        return self.results.get(job.fingerprint)
+
+    def add(self, result: Result) -> None:
+        entry = {"fingerprint": result.job.fingerprint, "result": result.to_dict()}
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+
+def run_job(job: Job, generate: Callable[[Job], tuple[str, bool]]) -> Result:
+    """
+    Runs a job, and catches its errors into the result.
+    """
+    if job.error is not None:
+        return Result(job, error=job.error)
+
+    start = time.perf_counter()
+    try:
+        output, cached = generate(job)
+    except click.ClickException as error:
+        return Result(job, error=error.format_message(), latency=time.perf_counter() - start)
+    except Exception as error:  # noqa: BLE001 - a failed job must not stop the other ones
+        return Result(
+            job, error=f"{type(error).__name__}: {error}", latency=time.perf_counter() - start
+        )
+    return Result(job, output=output, latency=time.perf_counter() - start, cached=cached)
+
+
+def run_batch(
+    jobs: Iterable[Job],
+    generate: Callable[[Job], tuple[str, bool]],
+    output: TextIO,
+    workers: int = DEFAULT_WORKERS,
+    order: str = "input",
+    checkpoint: Checkpoint | None = None,
+) -> Summary:
+    """
+    Runs the jobs with `workers` threads, and writes their results to `output` as JSON lines.
+
+    `generate` returns the output of a job, and whether it comes from a cache. The jobs are
+    read lazily: at most `4 * workers` are running or waiting for their turn to be written.
+    The jobs found in the checkpoint are not run again, but their results are written.
+    """
+    summary = Summary()
+    start = time.perf_counter()
+
+    running: dict[Future, Job] = {}
+    # Results waiting for the previous ones to be written, with `order="input"`.
+    finished: dict[int, dict] = {}
+    # Indexes of the jobs, in the input order, whose results are not written yet.
+    unwritten: deque[int] = deque()
+
+    def write(result: dict) -> None:
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output.flush()
+
+    def complete(index: int, result: dict) -> None:
+        if order == "completion":
+            write(result)
+            return
+        finished[index] = result
+        while unwritten and unwritten[0] in finished:
+            write(finished.pop(unwritten.popleft()))
+
+    def collect(futures) -> None:
+        for future in futures:
+            job = running.pop(future)
+            result = future.result()
+            summary.add(result)
+            if checkpoint is not None and result.error is None:
+                checkpoint.add(result)
+            complete(job.index, result.to_dict())
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for job in jobs:
+                previous = checkpoint.get(job) if checkpoint is not None else None
+                unwritten.append(job.index)
+                if previous is not None:
+                    summary.resumed += 1
+                    complete(job.index, previous)
+                    continue
+
+                while len(running) + len(finished) >= 4 * workers:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    collect(done)
+                running[executor.submit(run_job, job, generate)] = job
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                collect(done)
+        except KeyboardInterrupt:
+            # Keep the jobs that are already finished, and abandon the running ones.
+            collect([future for future in running if future.done()])
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            summary.elapsed = time.perf_counter() - start
+
+    return summary
@@ -0,0 +1,190 @@
+"""
+Preflight token budgeting: checks that a request fits in the context window of its model
+before it is sent, and fits it if it does not.
+
+The tokens of the system prompt and of the prompt are counted locally with the cached
+encoding of the model, and compared to its context window, minus the tokens reserved for the
+response. An input that does not fit is handled with a policy:
+
+- `fail`: stop with an error, without sending the request (the default).
+- `truncate-head`: drop the beginning of the input, and keep its end.
+- `truncate-tail`: drop the end of the input, and keep its beginning.
+- `chunk`: summarize the input in chunks that fit (see `summarization.map_reduce()`). Only
+  the summarizing templates (`CHUNKED_TEMPLATES`) can use it: the other ones need the whole
+  input, and a configured `chunk` policy falls back to `fail` for them.
+
+The policy, the reserved tokens and the context windows of other models can be configured in
+~/.config/lmt/config.json:
+
+    "context": {
+        "policy": "truncate-tail",
+        "reserved_tokens": 4096,
+        "windows": {"my-fine-tuned-model": 16385}
+    }
+"""
+
+from dataclasses import dataclass
+
+import click
+
+from . import chunking
+
+FAIL = "fail"
+TRUNCATE_HEAD = "truncate-head"
+TRUNCATE_TAIL = "truncate-tail"
+CHUNK = "chunk"
+POLICIES = (FAIL, TRUNCATE_HEAD, TRUNCATE_TAIL, CHUNK)
+
+DEFAULT_POLICY = FAIL
+# The templates whose input can be replaced by the summaries of its chunks.
+CHUNKED_TEMPLATES = ("summarize", "video_summarization", "lessonize", "study")
+# Tokens left for the response.
+DEFAULT_RESERVED_TOKENS = 1024
+
+# Context windows, in tokens, by model name prefix: the longest matching prefix wins.
+CONTEXT_WINDOWS = {
+    "chatgpt-4o": 128_000,
+    "gpt-3.5-turbo": 16_385,
+    "gpt-4": 8_192,
+    "gpt-4-32k": 32_768,
+    "gpt-4-0125": 128_000,
+    "gpt-4-1106": 128_000,
+    "gpt-4-turbo": 128_000,
+    "gpt-4.1": 1_047_576,
+    "gpt-4.5": 128_000,
+    "gpt-4o": 128_000,
+    "gpt-5": 400_000,
+    "o1": 200_000,
+    "o1-mini": 128_000,
+    "o1-preview": 128_000,
+    "o3": 200_000,
+    "o4-mini": 200_000,
+}
+
+
+class ContextWindowExceeded(click.ClickException):
+    """
+    A request does not fit in the context window of its model.
+    """
+
+
+@dataclass
+class Preflight:
+    """
+    The token count of a request, against the context window of its model.
+    """
+
+    model: str
+    # The whole request (system prompt, template and input), as counted by the provider.
+    prompt_tokens: int
+    input_tokens: int
+    context_window: int | None
+    reserved_tokens: int = DEFAULT_RESERVED_TOKENS
+
+    @property
+    def input_budget(self) -> int | None:
+        """
+        The maximum number of tokens of the input, or `None` if the context window is unknown.
+        """
+        if self.context_window is None:
+            return None
+        overhead = self.prompt_tokens - self.input_tokens
+        return self.context_window - self.reserved_tokens - overhead
+
+    @property
+    def fits(self) -> bool:
+        return self.input_budget is None or self.input_tokens <= self.input_budget
+
+    def format(self) -> str:
+        window = f"{self.context_window}" if self.context_window is not None else "unknown"
+        return (
+            f"{self.prompt_tokens} prompt tokens ({self.input_tokens} of input),"
+            f" {self.reserved_tokens} reserved for the response,"
+            f" context window of {self.model}: {window}"
+        )
+
+
+def get_context_window(model: str, config: dict | None = None) -> int | None:
+    """
+    Returns the context window of a model, or `None` if it is unknown.
+    """
+    windows = {**CONTEXT_WINDOWS, **(config or {}).get("context", {}).get("windows", {})}
+    if model in windows:
+        return windows[model]
+    prefixes = [prefix for prefix in windows if model.startswith(prefix)]
+    return windows[max(prefixes, key=len)] if prefixes else None
+
+
+def get_reserved_tokens(config: dict | None = None) -> int:
+    """
+    Returns the number of tokens reserved for the response.
+    """
+    return (config or {}).get("context", {}).get("reserved_tokens", DEFAULT_RESERVED_TOKENS)
+
+
+def get_chunk_tokens(model: str, config: dict | None = None) -> int | None:
+    """
+    Returns the number of tokens a chunk can use: the context window of the model minus the
+    tokens reserved for the response, or `None` if the context window is unknown.
+    """
+    context_window = get_context_window(model, config)
+    if context_window is None:
+        return None
+    return context_window - get_reserved_tokens(config)
+
+
+def get_policy(config: dict | None = None) -> str:
+    """
+    Returns the configured policy for the inputs that do not fit.
+    """
+    policy = (config or {}).get("context", {}).get("policy", DEFAULT_POLICY)
+    if policy not in POLICIES:
+        raise click.ClickException(
+            f"Invalid context policy in the config: {policy!r} (expected one of"
+            f" {', '.join(POLICIES)})."
+        )
+    return policy
+
+
+def preflight(
+    system: str, prompt: str, prompt_input: str, model: str, config: dict | None = None
+) -> Preflight:
+    """
+    Counts the tokens of a resolved request (`prompt` is the input formatted by the template),
+    and compares them to the context window of the model.
+    """
+    from .engine import Request
+
+    return Preflight(
+        model=model,
+        prompt_tokens=Request(system, prompt, model).estimate_tokens(),
+        input_tokens=chunking.count_tokens(prompt_input, model),
+        context_window=get_context_window(model, config),
+        reserved_tokens=get_reserved_tokens(config),
+    )
+
+
+def fit(prompt_input: str, check: Preflight, policy: str) -> str:
+    """
+    Truncates an input that does not fit according to the policy, or raises
+    `ContextWindowExceeded`.
+
+    The `chunk` policy is not handled here: it needs to send requests.
+    """
+    if check.fits:
+        return prompt_input
+
+    budget = check.input_budget
+    if policy in (TRUNCATE_HEAD, TRUNCATE_TAIL) and budget > 0:
+        if policy == TRUNCATE_TAIL:
+            head, _ = chunking.split_at_token(prompt_input, budget, check.model)
+            return head
+        _, tail = chunking.split_at_token(prompt_input, check.input_tokens - budget, check.model)
+        return tail
+
+    raise ContextWindowExceeded(
+        f"The prompt has {check.prompt_tokens} tokens, but {check.model} has a context window"
+        f" of {check.context_window} tokens, {check.reserved_tokens} of which are reserved for"
+        " the response. Shorten the input, use `--fit truncate-head`, `--fit truncate-tail` or"
+        " `--fit chunk`, or a model with a larger context window."
+    )
@@ -0,0 +1,392 @@
+"""
+Persistent caches of the model responses and of the YouTube transcripts.
+
+The responses are stored in a SQLite database under ~/.cache/lmtoolbox, keyed on everything
+that determines the request: the template and its system prompt, the model, the temperature,
+the emoji flag and the prompt. Entries expire after a per-template TTL, and the least recently
+used ones are evicted once the cache exceeds its maximum size.
+
+The TTLs and the maximum size can be configured in ~/.config/lmt/config.json:
+
+    "cache": {
+        "max_size_mb": 100,
+        "ttl": {"summarize": 86400, "cheermeup": 0}
+    }
+
+A TTL of 0 disables the cache for a template.
+
+The transcripts are cached in a separate database, keyed on the video and the requested
+languages. The videos without transcripts are cached for a short time too.
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+
+from .storage import get_cache_dir
+
+DAY = 24 * 60 * 60
+
+DEFAULT_TTL = 30 * DAY
+DEFAULT_MAX_SIZE_MB = 100
+
+# Templates whose answers are expected to differ between runs are not cached.
+DEFAULT_TTLS = {
+    "cheermeup": 0,
+    "summarize": 7 * DAY,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    template TEXT NOT NULL,
+    model TEXT NOT NULL,
+    content TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+DEFAULT_TRANSCRIPT_TTL = 30 * DAY
+# Transcripts may become available later (e.g. automatic captions of a recent video).
+DEFAULT_TRANSCRIPT_NEGATIVE_TTL = 60 * 60
+DEFAULT_TRANSCRIPT_MAX_SIZE_MB = 50
+
+TRANSCRIPTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    key TEXT PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    language TEXT,
+    data BLOB,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_accessed_at ON transcripts (accessed_at);
+"""
+
+
+def get_cache_path() -> Path:
+    """
+    Returns the path to the SQLite database of the response cache.
+    """
+    return get_cache_dir() / "responses.sqlite3"
+
+
+def make_key(
+    template: str,
+    system: str,
+    model: str,
+    temperature: float,
+    emoji: bool,
+    prompt_input: str,
+) -> str:
+    """
+    Returns the cache key of a request.
+    """
+    request = {
+        "template": template,
+        "system": hashlib.sha256(system.encode("utf-8")).hexdigest(),
+        "model": model,
+        "temperature": temperature,
+        "emoji": emoji,
+        "prompt": hashlib.sha256(prompt_input.encode("utf-8")).hexdigest(),
+    }
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of the model responses, with per-template TTLs.
+    """
+
+    def __init__(self, path: Path | None = None, config: dict | None = None):
+        config = (config or {}).get("cache", {})
+        self.ttls = {**DEFAULT_TTLS, **config.get("ttl", {})}
+        self.max_size = int(config.get("max_size_mb", DEFAULT_MAX_SIZE_MB) * 1024 * 1024)
+
+        self.connection = sqlite3.connect(path or get_cache_path(), timeout=10)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def get_ttl(self, template: str) -> float:
+        """
+        Returns the time to live of the responses of a template, in seconds.
+        """
+        return self.ttls.get(template, DEFAULT_TTL)
+
+    def is_enabled(self, template: str) -> bool:
+        return self.get_ttl(template) > 0
+
+    def get(self, key: str, template: str) -> str | None:
+        """
+        Returns the cached response, or `None` if there is none or it has expired.
+        """
+        row = self.connection.execute(
+            "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        content, created_at = row
+        now = time.time()
+        if now - created_at > self.get_ttl(template):
+            with self.connection:
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+
+        with self.connection:
+            self.connection.execute(
+                "UPDATE responses SET accessed_at = ?, hits = hits + 1 WHERE key = ?",
+                (now, key),
+            )
+        return content
+
+    def set(self, key: str, template: str, model: str, content: str) -> None:
+        """
+        Stores a response, then evicts the least recently used ones if the cache is too big.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses"
+                " (key, template, model, content, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, template, model, content, len(content.encode("utf-8")), now, now),
+            )
+        self.evict(self.max_size)
+
+    def evict(self, max_size: int) -> int:
+        """
+        Deletes the least recently used entries until the cache fits in `max_size` bytes.
+
+        Returns the number of deleted entries.
+        """
+        (total,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= max_size:
+            return 0
+
+        to_delete = []
+        rows = self.connection.execute("SELECT key, size FROM responses ORDER BY accessed_at")
+        for key, size in rows:
+            if total <= max_size:
+                break
+            to_delete.append((key,))
+            total -= size
+
+        with self.connection:
+            self.connection.executemany("DELETE FROM responses WHERE key = ?", to_delete)
+        return len(to_delete)
+
+    def prune(self, clear: bool = False) -> int:
+        """
+        Deletes the expired entries (or all of them), and enforces the maximum size.
+
+        Returns the number of deleted entries.
+        """
+        if clear:
+            with self.connection:
+                return self.connection.execute("DELETE FROM responses").rowcount
+
+        now = time.time()
+        deleted = 0
+        templates = self.connection.execute("SELECT DISTINCT template FROM responses").fetchall()
+        with self.connection:
+            for (template,) in templates:
+                deleted += self.connection.execute(
+                    "DELETE FROM responses WHERE template = ? AND created_at < ?",
+                    (template, now - self.get_ttl(template)),
+                ).rowcount
+        deleted += self.evict(self.max_size)
+
+        self.connection.execute("VACUUM")
+        return deleted
+
+    def stats(self) -> dict:
+        """
+        Returns the number of entries, their size and their hits, in total and per template.
+        """
+        rows = self.connection.execute(
+            "SELECT template, COUNT(*), SUM(size), SUM(hits) FROM responses"
+            " GROUP BY template ORDER BY template"
+        ).fetchall()
+        templates = {
+            template: {"entries": entries, "size": size, "hits": hits}
+            for template, entries, size, hits in rows
+        }
+        return {
+            "entries": sum(stats["entries"] for stats in templates.values()),
+            "size": sum(stats["size"] for stats in templates.values()),
+            "hits": sum(stats["hits"] for stats in templates.values()),
+            "max_size": self.max_size,
+            "templates": templates,
+        }
+
+
+def get_transcripts_path() -> Path:
+    """
+    Returns the path to the SQLite database of the transcript cache.
+    """
+    return get_cache_dir() / "transcripts.sqlite3"
+
+
+class TranscriptCache:
+    """
+    Size-bounded LRU cache of the YouTube transcripts, including the videos without any.
+
+    The lines of a transcript are stored as a compressed JSON array of
+    `[start, duration, text]` triples.
+    """
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        ttl: float = DEFAULT_TRANSCRIPT_TTL,
+        negative_ttl: float = DEFAULT_TRANSCRIPT_NEGATIVE_TTL,
+        max_size_mb: float = DEFAULT_TRANSCRIPT_MAX_SIZE_MB,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = int(max_size_mb * 1024 * 1024)
+
+        self.connection = sqlite3.connect(path or get_transcripts_path(), timeout=10)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(TRANSCRIPTS_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @staticmethod
+    def make_key(video_id: str, languages: list[str]) -> str:
+        return f"{video_id}:{','.join(languages)}"
+
+    def get(self, video_id: str, languages: list[str]) -> tuple[bool, list[dict] | None]:
+        """
+        Returns whether the video is cached, and its transcript (`None` if it has none).
+        """
+        key = self.make_key(video_id, languages)
+        row = self.connection.execute(
+            "SELECT data, created_at FROM transcripts WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return False, None
+
+        data, created_at = row
+        now = time.time()
+        if now - created_at > (self.ttl if data is not None else self.negative_ttl):
+            with self.connection:
+                self.connection.execute("DELETE FROM transcripts WHERE key = ?", (key,))
+            return False, None
+
+        with self.connection:
+            self.connection.execute(
+                "UPDATE transcripts SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        if data is None:
+            return True, None
+        lines = json.loads(zlib.decompress(data))
+        return True, [
+            {"text": text, "start": start, "duration": duration} for start, duration, text in lines
+        ]
+
+    def set(
+        self,
+        video_id: str,
+        languages: list[str],
+        transcript: list[dict] | None,
+        language: str | None = None,
+    ) -> None:
+        """
+        Stores the transcript of a video (`None` if it has none), in the `language` it was
+        found in.
+        """
+        data = None
+        if transcript is not None:
+            lines = [
+                [line.get("start", 0.0), line.get("duration", 0.0), line["text"]]
+                for line in transcript
+            ]
+            data = zlib.compress(json.dumps(lines, separators=(",", ":")).encode("utf-8"))
+
+        now = time.time()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO transcripts"
+                " (key, video_id, language, data, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.make_key(video_id, languages),
+                    video_id,
+                    language,
+                    data,
+                    len(data or b""),
+                    now,
+                    now,
+                ),
+            )
+        self.evict(self.max_size)
+
+    def evict(self, max_size: int) -> int:
+        """
+        Deletes the least recently used transcripts until the cache fits in `max_size` bytes.
+
+        Returns the number of deleted transcripts.
+        """
+        (total,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM transcripts"
+        ).fetchone()
+        if total <= max_size:
+            return 0
+
+        to_delete = []
+        rows = self.connection.execute("SELECT key, size FROM transcripts ORDER BY accessed_at")
+        for key, size in rows:
+            if total <= max_size:
+                break
+            to_delete.append((key,))
+            total -= size
+
+        with self.connection:
+            self.connection.executemany("DELETE FROM transcripts WHERE key = ?", to_delete)
+        return len(to_delete)
+
+    def prune(self, clear: bool = False) -> int:
+        """
+        Deletes the expired transcripts (or all of them), and enforces the maximum size.
+
+        Returns the number of deleted transcripts.
+        """
+        now = time.time()
+        with self.connection:
+            if clear:
+                return self.connection.execute("DELETE FROM transcripts").rowcount
+            deleted = self.connection.execute(
+                "DELETE FROM transcripts"
+                " WHERE (data IS NOT NULL AND created_at < ?)"
+                " OR (data IS NULL AND created_at < ?)",
+                (now - self.ttl, now - self.negative_ttl),
+            ).rowcount
+        return deleted + self.evict(self.max_size)
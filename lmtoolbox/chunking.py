@@ -0,0 +1,168 @@
+"""
+Token counting and token-budgeted splitting of long inputs.
+"""
+
+import re
+from collections.abc import Iterable, Iterator
+from functools import cache
+
+from . import profiling
+
+FALLBACK_ENCODING = "cl100k_base"
+
+# Beyond this size, a streamed paragraph is cut at its last line break.
+MAX_PARAGRAPH_CHARS = 256 * 1024
+
+PARAGRAPH_SEPARATOR = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class ApproximateEncoding:
+    """
+    Stand-in for a `tiktoken` encoding when none can be loaded (e.g. offline, as `tiktoken`
+    downloads the encodings on first use). Counts about four characters per token.
+
+    Its tokens cannot be decoded: the text is split by characters instead.
+    """
+
+    chars_per_token = 4
+
+    def encode(self, text: str, **kwargs) -> list[int]:
+        return [0] * -(-len(text) // self.chars_per_token)
+
+
+@cache
+def get_encoding(model: str):
+    """
+    Returns the `tiktoken` encoding of a model, loaded once per process.
+    """
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except (OSError, ValueError):
+        return ApproximateEncoding()
+
+    try:
+        return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except (OSError, ValueError):
+        return ApproximateEncoding()
+
+
+@profiling.traced("token_counting")
+def count_tokens(text: str, model: str) -> int:
+    """
+    Returns the number of tokens of `text` for `model`.
+    """
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+
+def split_paragraphs(text: str) -> list[str]:
+    """
+    Splits a text on blank lines, or on line breaks if it has no paragraphs.
+    """
+    paragraphs = [paragraph for paragraph in PARAGRAPH_SEPARATOR.split(text) if paragraph.strip()]
+    if len(paragraphs) <= 1:
+        paragraphs = [line for line in text.splitlines() if line.strip()]
+    return paragraphs
+
+
+def iter_paragraphs(blocks: Iterable[str]) -> Iterator[str]:
+    """
+    Splits a stream of text blocks on blank lines, holding at most one paragraph in memory.
+
+    Paragraphs longer than `MAX_PARAGRAPH_CHARS` are cut at their last line break, if any.
+    """
+    buffer = ""
+    for block in blocks:
+        buffer += block
+        *paragraphs, buffer = PARAGRAPH_SEPARATOR.split(buffer)
+        yield from (paragraph for paragraph in paragraphs if paragraph.strip())
+
+        if len(buffer) > MAX_PARAGRAPH_CHARS:
+            cut = buffer.rfind("\n") + 1 or len(buffer)
+            if buffer[:cut].strip():
+                yield buffer[:cut]
+            buffer = buffer[cut:]
+
+    if buffer.strip():
+        yield buffer
+
+
+def split_at_token(text: str, max_tokens: int, model: str) -> tuple[str, str]:
+    """
+    Splits `text` after its first `max_tokens` tokens.
+    """
+    encoding = get_encoding(model)
+    if isinstance(encoding, ApproximateEncoding):
+        cut = max_tokens * encoding.chars_per_token
+        return text[:cut], text[cut:]
+
+    head = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    if not text.startswith(head):
+        # The cut fell inside a multi-byte character: drop the partial character.
+        head = head.rstrip("\ufffd")
+        if not text.startswith(head):
+            head = text[: len(head)]
+    return head, text[len(head) :]
+
+
+def split_into_chunks(
+    segments: Iterable[str], max_tokens: int, model: str, separator: str = "\n\n"
+) -> Iterator[str]:
+    """
+    Packs consecutive segments (paragraphs, transcript lines, ...) into chunks of at most
+    `max_tokens` tokens, joined with `separator`.
+
+    A segment that is larger than `max_tokens` on its own is split on sentences, and then on
+    token boundaries as a last resort.
+    """
+    separator_tokens = count_tokens(separator, model)
+    chunk: list[str] = []
+    chunk_tokens = 0
+
+    for segment in segments:
+        for piece, piece_tokens in _fit_segment(segment, max_tokens, model):
+            added_tokens = piece_tokens + (separator_tokens if chunk else 0)
+            if chunk and chunk_tokens + added_tokens > max_tokens:
+                yield separator.join(chunk)
+                chunk, chunk_tokens = [], 0
+                added_tokens = piece_tokens
+            chunk.append(piece)
+            chunk_tokens += added_tokens
+
+    if chunk:
+        yield separator.join(chunk)
+
+
+def _fit_segment(segment: str, max_tokens: int, model: str) -> Iterator[tuple[str, int]]:
+    """
+    Yields the segment, or pieces of it if it is too large, with their number of tokens.
+    """
+    tokens = count_tokens(segment, model)
+    if tokens <= max_tokens:
+        yield segment, tokens
+        return
+
+    sentences = SENTENCE_END.split(segment)
+    if len(sentences) > 1:
+        yield from (
+            (chunk, count_tokens(chunk, model))
+            for chunk in split_into_chunks(sentences, max_tokens, model, separator=" ")
+        )
+        return
+
+    encoding = get_encoding(model)
+    if isinstance(encoding, ApproximateEncoding):
+        step = max_tokens * encoding.chars_per_token
+        for start in range(0, len(segment), step):
+            piece = segment[start : start + step]
+            yield piece, count_tokens(piece, model)
+        return
+
+    encoded = encoding.encode(segment, disallowed_special=())
+    for start in range(0, len(encoded), max_tokens):
+        window = encoded[start : start + max_tokens]
+        yield encoding.decode(window), len(window)
@@ -1,86 +1,369 @@
-import json
+import functools
 import os
-import shutil
 import subprocess
 import sys
 import tempfile
+from collections.abc import Iterable
 from datetime import datetime
-from functools import wraps
-from pathlib import Path
 
 import click
-import requests
-import validators
-import yaml
-from lmterminal.cli import validate_model_name, validate_temperature
-from lmterminal.lib import DEFAULT_MODEL, prepare_and_generate_response
-from lmterminal.templates import TEMPLATES_DIR, get_template_content
-from strip_tags.lib import strip_tags
 
-from . import video_summarization
+from . import budget, daemon, metrics, profiling, summarization
+from .templates import (
+    ensure_templates,
+    get_description,
+    get_descriptions,
+    get_template,
+    list_template_names,
+    sync_templates,
+    template_exists,
+)
 
+# Heavy dependencies (`lmterminal.lib` and the OpenAI client, `requests`, `yaml`, ...) are
+# imported inside the commands that use them, so that `--help` and the commands that do not
+# need them start fast. `tests/startup_test.py` guards against eager imports.
 
-def install_templates():
+
+# Subcommands of `lmtoolbox` that always run in-process.
+LOCAL_COMMANDS = ("serve",)
+
+
+class ForwardingCommand(click.Command):
     """
-    Installs the templates in ~/.config/lmt/templates.
+    A command that runs in the `lmtoolbox serve` daemon when one is running.
     """
-    dest_path = Path.home() / ".config/lmt/templates"
-    dest_path.mkdir(parents=True, exist_ok=True)
 
-    config_file = Path.home() / ".config/lmt/config.json"
-    config_file.touch(exist_ok=True)
+    def main(self, args=None, prog_name=None, **extra):
+        # Only forward console script invocations: the daemon passes `args` explicitly. The
+        # profiled commands run in-process.
+        if args is None and not profiling.is_requested() and self.is_forwardable(sys.argv[1:]):
+            exit_code = daemon.forward(
+                self.name, sys.argv[1:], prog_name or os.path.basename(sys.argv[0])
+            )
+            if exit_code is not None:
+                sys.exit(exit_code)
+        return super().main(args, prog_name, **extra)
+
+    def is_forwardable(self, args: list[str]) -> bool:
+        return True
+
+    def invoke(self, ctx):
+        if isinstance(self, click.Group):
+            return super().invoke(ctx)
 
-    # Load existing config if it exists, else create an empty config
-    with config_file.open("r") as file:
+        # The metrics of the command are written when it ends, if it sent requests.
+        metrics.start(self.name)
+        failed = True
         try:
-            config = json.load(file)
-        except json.JSONDecodeError:
-            click.echo(click.style("Installing templates...", fg="yellow"))
-            config = {}
+            result = super().invoke(ctx)
+            failed = False
+            return result
+        except (SystemExit, click.exceptions.Exit) as exit:
+            code = exit.code if isinstance(exit, SystemExit) else exit.exit_code
+            failed = code not in (0, None)
+            raise
+        finally:
+            metrics.finish(error=failed)
+
+
+class ForwardingGroup(ForwardingCommand, click.Group):
+    """
+    A group whose console script and commands run in the daemon when one is running.
+    """
 
-    # Create the 'tools' key if it does not exist
-    if "tools" not in config:
-        config["tools"] = {}
+    command_class = ForwardingCommand
 
-    src_path = Path(__file__).parent / "tools/templates"
-    for file in src_path.glob("*.yaml"):
-        destination = dest_path / file.name
+    def is_forwardable(self, args: list[str]) -> bool:
+        return not (args and args[0] in LOCAL_COMMANDS)
 
-        # Only copy file if it does not exist
-        if not destination.exists():
-            shutil.copy2(file, dest_path)
 
-            # Update the config file with the copied template
-            template_name = file.stem
-            config["tools"][template_name] = str(dest_path / file.name)
-            click.echo(click.style(f"Installed `{template_name}` template.", fg="green"))
+class TemplateGroup(ForwardingGroup):
+    """
+    The `lmtoolbox` group, with a command for each installed template.
 
-    # Write the updated config back to the file
-    with config_file.open("w") as file:
-        json.dump(config, file, indent=4)
+    The commands of the templates are built when they are looked up: listing them for `--help`
+    or the shell completion only reads the names and the descriptions of the templates from the
+    compiled index, and running one only builds its own command.
+    """
 
+    def list_commands(self, ctx):
+        names = {*super().list_commands(ctx), *TEMPLATE_COMMANDS, *list_template_names()}
+        return sorted(names.difference(INTERNAL_TEMPLATES))
+
+    def get_command(self, ctx, cmd_name):
+        command = super().get_command(ctx, cmd_name)
+        if command is not None or cmd_name in INTERNAL_TEMPLATES:
+            return command
+        if cmd_name in TEMPLATE_COMMANDS or template_exists(cmd_name):
+            return make_template_command(cmd_name)
+        return None
+
+    def format_commands(self, ctx, formatter):
+        commands = self.get_visible_commands(ctx)
+        limit = formatter.width - 6 - max((len(name) for name, _ in commands), default=0)
+        rows = [(name, command.get_short_help_str(limit)) for name, command in commands]
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+    def shell_complete(self, ctx, incomplete):
+        from click.shell_completion import CompletionItem
+
+        results = [
+            CompletionItem(name, help=command.get_short_help_str())
+            for name, command in self.get_visible_commands(ctx)
+            if name.startswith(incomplete)
+        ]
+        # The completion of the options.
+        results.extend(click.Command.shell_complete(self, ctx, incomplete))
+        return results
+
+    def get_visible_commands(self, ctx) -> list[tuple[str, click.Command]]:
+        """
+        Returns the commands to list in the help and the shell completion. The commands of the
+        templates are only stand-ins with their help, read from the index at once, instead of
+        building each command with its options.
+        """
+        try:
+            descriptions = get_descriptions()
+        except click.ClickException:
+            descriptions = {}
+
+        commands = []
+        for name in self.list_commands(ctx):
+            command = self.commands.get(name)
+            if command is None:
+                help_text = (
+                    TEMPLATE_COMMANDS[name][1]
+                    if name in TEMPLATE_COMMANDS
+                    else descriptions.get(name, TEMPLATE_HELP.format(name=name))
+                )
+                command = click.Command(name, help=help_text)
+            if not command.hidden:
+                commands.append((name, command))
+        return commands
 
-install_templates()
 
+def enable_profiling(ctx, param, value):
+    """
+    Starts profiling for `--profile` and `--profile-output`, and prints the profile when the
+    command ends.
+    """
+    if not value:
+        return
+    from pathlib import Path
 
-@click.group()
-@click.pass_context
+    profiler = profiling.enable()
+    if param.name == "profile_output":
+        profiler.set_output(Path(value))
+    ctx.call_on_close(profiling.finish)
+
+
+def profile_options(function):
+    """
+    Options to profile a command.
+    """
+    function = click.option(
+        "--profile-output",
+        type=click.Path(dir_okay=False, writable=True),
+        envvar=profiling.PROFILE_OUTPUT_ENV,
+        expose_value=False,
+        callback=enable_profiling,
+        help=(
+            "Also write the profile to this file: a Chrome trace if it ends with .json, a"
+            " pstats dump otherwise."
+        ),
+    )(function)
+    return click.option(
+        "--profile",
+        is_flag=True,
+        envvar=profiling.PROFILE_ENV,
+        expose_value=False,
+        callback=enable_profiling,
+        help="Print the time spent in each phase of the command on stderr.",
+    )(function)
+
+
+@click.group(cls=TemplateGroup)
 @click.version_option()
+@profile_options
 def cli():
     pass
 
 
+@cli.group()
+def cache():
+    """
+    Manage the cache of the responses, transcripts and web pages in ~/.cache/lmtoolbox.
+    """
+
+
+@cache.command("stats")
+def cache_stats():
+    """
+    Show the number of cached responses, their size, and the cache hits per template.
+    """
+    from lmterminal.lib import load_config
+
+    from .cache import ResponseCache
+
+    with ResponseCache(config=load_config()) as response_cache:
+        summary = response_cache.stats()
+
+    for template, template_stats in summary["templates"].items():
+        click.echo(
+            f"{click.style(template, fg='blue')}: {template_stats['entries']} entries,"
+            f" {template_stats['size'] / 1024:.1f} KiB, {template_stats['hits']} hits"
+        )
+    click.echo(
+        f"Total: {summary['entries']} entries,"
+        f" {summary['size'] / 1024:.1f} KiB of {summary['max_size'] / 1024**2:.0f} MiB,"
+        f" {summary['hits']} hits"
+    )
+
+
+@cache.command("prune")
+@click.option("--all", "clear", is_flag=True, help="Delete all the cached responses and web pages.")
+def cache_prune(clear):
+    """
+    Delete the expired responses, and the least recently used responses and web pages beyond
+    the maximum size.
+    """
+    from lmterminal.lib import load_config
+
+    from .cache import ResponseCache, TranscriptCache
+    from .fetch import HTTPCache
+
+    with ResponseCache(config=load_config()) as response_cache:
+        deleted = response_cache.prune(clear=clear)
+    click.echo(f"Deleted {deleted} cached responses.")
+
+    with TranscriptCache() as transcript_cache:
+        deleted = transcript_cache.prune(clear=clear)
+    click.echo(f"Deleted {deleted} cached transcripts.")
+
+    http_cache = HTTPCache()
+    deleted = http_cache.clear() if clear else http_cache.evict(http_cache.max_size)
+    click.echo(f"Deleted {deleted} cached web pages.")
+
+
+@cli.command()
+@click.option(
+    "--workers",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of commands that can run at the same time.",
+)
+def serve(workers):
+    """
+    Run a daemon that keeps LMtoolbox warm, to make the commands start instantly.
+
+    While it runs, the commands are executed by the daemon instead of a new Python process.
+    Set LMTOOLBOX_NO_DAEMON=1 to bypass it.
+
+    Example usage: lmtoolbox serve &
+    """
+    daemon.serve(workers=workers)
+
+
+@cli.command()
+@click.option(
+    "--days",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Only count the invocations of the last N days.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["table", "openmetrics"]),
+    default="table",
+    show_default=True,
+    help="Print a table, or the metrics in the OpenMetrics text format (e.g. for Prometheus).",
+)
+def stats(days, output_format):
+    """
+    Show the latency percentiles, the tokens and the cache hits of the commands, per model.
+
+    The metrics are read from ~/.cache/lmtoolbox/metrics.jsonl, where each command that
+    sends requests records its invocations.
+
+    Example usage: lmtoolbox stats --days 7
+    """
+    import time
+
+    since = time.time() - days * 86400 if days else None
+    records = metrics.iter_records(metrics.get_log_paths(metrics.get_metrics_path()), since)
+    aggregates = metrics.aggregate(records)
+
+    if output_format == "openmetrics":
+        click.echo(metrics.format_openmetrics(aggregates))
+    elif not aggregates:
+        click.echo("No invocation recorded yet.", err=True)
+    else:
+        click.echo(metrics.format_table(aggregates))
+
+
+@cli.group()
+def templates():
+    """
+    Manage the templates installed in ~/.config/lmt/templates.
+    """
+
+
+@templates.command()
+@click.option("--force", is_flag=True, help="Overwrite the templates modified locally.")
+def sync(force):
+    """
+    Install the missing templates and update the outdated ones.
+    """
+    changed = sync_templates(force=force)
+    if not changed:
+        click.echo("Templates are up to date.")
+
+
+def validate_model_name(ctx, param, value):
+    """
+    Validates the model name, and resolves the default model.
+    """
+    if value is None:
+        from lmterminal.lib import DEFAULT_MODEL
+
+        return DEFAULT_MODEL
+
+    from lmterminal.cli import validate_model_name
+
+    return validate_model_name(ctx, param, value)
+
+
+def validate_temperature(ctx, param, value):
+    """
+    Validates the temperature.
+    """
+    from lmterminal.cli import validate_temperature
+
+    return validate_temperature(ctx, param, value)
+
+
+def store_in_meta(ctx, param, value):
+    """
+    Stores the value of an option in `ctx.meta`, where `process_command()` reads it.
+    """
+    ctx.meta[f"lmtoolbox.{param.name}"] = value
+    return value
+
+
 def common_options(function):
     """
     Common options for all commands.
     """
 
-    @wraps(function)
+    @functools.wraps(function)
     @click.option("--emoji", is_flag=True, help="Add emotions and emojis.")
     @click.option(
         "-m",
         "--model",
-        default=DEFAULT_MODEL,
+        default=None,
         help="The model to use for the requests.",
         callback=validate_model_name,
     )
@@ -116,6 +399,39 @@ def common_options(function):
         default=False,
         help="Print debug information.",
     )
+    @click.option(
+        "--max-input-tokens",
+        type=click.IntRange(min=1),
+        expose_value=False,
+        callback=store_in_meta,
+        help="Stop reading stdin or files after this number of tokens.",
+    )
+    @click.option(
+        "--fit",
+        type=click.Choice(budget.POLICIES),
+        expose_value=False,
+        callback=store_in_meta,
+        help=(
+            "What to do with a prompt that exceeds the context window of the model: fail (the"
+            " default), drop the beginning or the end of the input, or summarize it in chunks"
+            " (summarize, lessonize and study only)."
+        ),
+    )
+    @click.option(
+        "--no-cache",
+        is_flag=True,
+        expose_value=False,
+        callback=store_in_meta,
+        help="Do not read or write the response cache.",
+    )
+    @click.option(
+        "--refresh",
+        is_flag=True,
+        expose_value=False,
+        callback=store_in_meta,
+        help="Ignore the cached response, and cache the new one.",
+    )
+    @profile_options
     def wrapper(*args, **kwargs):
         return function(*args, **kwargs)
 
@@ -123,103 +439,236 @@ def common_options(function):
 
 
 @cli.command()
-@click.argument("words", nargs=-1, required=False)
-@click.pass_context
-@common_options
-def thesaurus(ctx, model, emoji, words, temperature, tokens, no_stream, raw, debug):
+@click.argument("jobs_file", type=click.File("r", encoding="utf-8"))
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("w", encoding="utf-8", lazy=False),
+    default="-",
+    help="Write the results to this JSONL file instead of `stdout`.",
+)
+@click.option(
+    "--workers",
+    default=4,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of jobs to run at the same time.",
+)
+@click.option(
+    "--order",
+    type=click.Choice(["input", "completion"]),
+    default="input",
+    show_default=True,
+    help="Write the results in the order of the jobs, or as soon as they complete.",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Record the finished jobs in this file, and skip them when the run is resumed.",
+)
+@click.option(
+    "-m",
+    "--model",
+    default=None,
+    help="The model of the jobs that do not set one.",
+    callback=validate_model_name,
+)
+@click.option(
+    "--temperature",
+    callback=validate_temperature,
+    default=1,
+    type=float,
+    help="The temperature of the jobs that do not set one.",
+    show_default=True,
+)
+@click.option("--no-cache", is_flag=True, help="Do not read or write the response cache.")
+@click.option("--refresh", is_flag=True, help="Ignore the cached responses, and update them.")
+def batch(jobs_file, output, workers, order, checkpoint, model, temperature, no_cache, refresh):
     """
-    This is the thesaurus command. It requires a word as input, either as an argument or from stdin.
-    The command will use the given word to find synonyms and antonyms.
+    Run template commands over a JSONL file of jobs, concurrently.
+
+    Each line is a job such as {"command": "translate", "input": "Bonjour"}, with an optional
+    "model", "temperature" and "id". The results are written as JSON lines, and a summary of
+    the run on `stderr`.
 
-    Example usage: thesaurus [word]
+    Example usage: lmtoolbox batch jobs.jsonl -o results.jsonl --checkpoint jobs.checkpoint
     """
-    process_command(
-        ctx,
-        "thesaurus",
-        model,
-        emoji,
-        words,
-        temperature,
-        tokens,
-        no_stream,
-        raw,
-        debug,
-    )
+    from pathlib import Path
 
+    from lmterminal.lib import load_config
 
-@cli.command()
-@click.argument("sentence", nargs=-1, required=False)
-@click.pass_context
-@common_options
-def translate(ctx, model, emoji, sentence, temperature, tokens, no_stream, raw, debug):
+    from . import batch as batch_runner
+    from .cache import ResponseCache, make_key
+    from .generation import generate_content, resolve_request
+
+    ensure_templates()
+    config = load_config()
+
+    def generate(job):
+        # The name comes from the jobs file: it must not point outside of the templates.
+        if not template_exists(job.command):
+            raise click.ClickException(f"The template '{job.command}' does not exist.")
+
+        system, prompt_input, job_model = resolve_request(
+            job.command, "", job.input, job.model, emoji=False
+        )
+        if no_cache:
+            return generate_content(system, prompt_input, job_model, job.temperature), False
+
+        # One connection per job: SQLite connections cannot be shared between threads.
+        with ResponseCache(config=config) as response_cache:
+            if not response_cache.is_enabled(job.command):
+                return generate_content(system, prompt_input, job_model, job.temperature), False
+
+            key = make_key(job.command, system, job_model, job.temperature, False, prompt_input)
+            content = None if refresh else response_cache.get(key, job.command)
+            if content is not None:
+                metrics.add_request(job_model, cached=True)
+                return content, True
+
+            content = generate_content(system, prompt_input, job_model, job.temperature)
+            if content.strip():
+                response_cache.set(key, job.command, job_model, content)
+            return content, False
+
+    jobs = batch_runner.parse_jobs(jobs_file, model, temperature)
+    checkpoint_file = batch_runner.Checkpoint(Path(checkpoint)) if checkpoint else None
+    try:
+        summary = batch_runner.run_batch(
+            jobs, generate, output, workers=workers, order=order, checkpoint=checkpoint_file
+        )
+    except KeyboardInterrupt:
+        click.echo("\nInterrupted.", err=True)
+        if checkpoint:
+            click.echo(f"Resume with: --checkpoint {checkpoint}", err=True)
+        sys.exit(130)
+    finally:
+        if checkpoint_file is not None:
+            checkpoint_file.close()
+
+    click.echo(summary.format(), err=True)
+    if summary.failed:
+        sys.exit(1)
+
+
+# The commands of the bundled templates that send their input to the template as is: the name
+# of their argument, and their help. Any other installed template, like one added to
+# ~/.config/lmt/templates, is a command too, documented by the `description` of the template.
+TEMPLATE_COMMANDS = {
+    "cheermeup": ("mood", "Cheer you up based on your mood."),
+    "critique": ("work_to_critique", "Generate a critique for a given piece of work."),
+    "define": ("word", "Get a definition for a word."),
+    "explain": ("concept", "Explain a concept."),
+    "lessonize": ("topic", "Create a lesson from a piece of text."),
+    "pathlearner": ("topic", "Provide a study plan for a given topic."),
+    "proofread": ("text", "Proofread a piece of text."),
+    "study": (
+        "study_material",
+        "Generate study material for a topic or from the content of the content of a file.",
+    ),
+    "teachlib": ("library_name", "Teach a library."),
+    "thesaurus": (
+        "words",
+        (
+            "This is the thesaurus command. It requires a word as input, either as an argument"
+            " or from stdin.\nThe command will use the given word to find synonyms and"
+            " antonyms.\n\nExample usage: thesaurus [word]"
+        ),
+    ),
+    "translate": ("sentence", "Translate a word or sentence."),
+}
+
+# The installed templates used by another command, which are not commands themselves.
+INTERNAL_TEMPLATES = ("video_summarization",)
+
+# The help of the commands of the templates without a `description`.
+TEMPLATE_HELP = "Send the input, from the arguments or stdin, to the `{name}` template."
+
+
+def make_template_command(name: str) -> ForwardingCommand:
     """
-    Translate a word or sentence.
+    Builds the command of a template, which sends its arguments, or stdin, to the template.
     """
-    process_command(
-        ctx,
-        "translate",
-        model,
-        emoji,
-        sentence,
-        temperature,
-        tokens,
-        no_stream,
-        raw,
-        debug,
+    argument, help_text = TEMPLATE_COMMANDS.get(name, ("input", None))
+
+    @click.pass_context
+    def send_to_template(ctx, model, emoji, temperature, tokens, no_stream, raw, debug, **kwargs):
+        process_command(
+            ctx, name, model, emoji, kwargs[argument], temperature, tokens, no_stream, raw, debug
+        )
+
+    return ForwardingCommand(
+        name,
+        callback=send_to_template,
+        params=[click.Argument([argument], nargs=-1, required=False), *get_common_params()],
+        help=help_text or get_template_help(name),
     )
 
 
-@cli.command()
-@click.argument("word", nargs=-1, required=False)
-@click.pass_context
-@common_options
-def define(ctx, model, emoji, word, temperature, tokens, no_stream, raw, debug):
+@functools.cache
+def get_common_params() -> list[click.Parameter]:
     """
-    Get a definition for a word.
+    Returns the options of `common_options()`, built once for all the template commands.
     """
-    process_command(ctx, "define", model, emoji, word, temperature, tokens, no_stream, raw, debug)
 
+    @click.command()
+    @common_options
+    def prototype(**kwargs):
+        pass
 
-@cli.command()
-@click.argument("text", nargs=-1, required=False)
-@click.pass_context
-@common_options
-def proofread(ctx, model, emoji, text, temperature, tokens, no_stream, raw, debug):
-    """
-    Proofread a piece of text.
-    """
-    process_command(
-        ctx, "proofread", model, emoji, text, temperature, tokens, no_stream, raw, debug
-    )
+    return prototype.params
 
 
-@cli.command()
-@click.argument("topic", nargs=-1, required=False)
-@click.pass_context
-@common_options
-def lessonize(ctx, model, emoji, topic, temperature, tokens, no_stream, raw, debug):
+def get_template_help(name: str) -> str:
     """
-    Create a lesson from a piece of text.
+    Returns the help of the command of an installed template: the `description` of the
+    template, if it has one.
     """
-    process_command(
-        ctx,
-        "lessonize",
-        model,
-        emoji,
-        topic,
-        temperature,
-        tokens,
-        no_stream,
-        raw,
-        debug,
-    )
+    try:
+        description = get_description(get_template(name))
+    except click.ClickException:
+        description = None
+    return description or TEMPLATE_HELP.format(name=name)
+
+
+def __getattr__(name: str):
+    # The console scripts of the template commands, like `lmtoolbox.cli:define`.
+    if name in TEMPLATE_COMMANDS:
+        return make_template_command(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 @cli.command()
 @click.argument("file", type=click.File("r"), required=False)
+@click.option(
+    "--max-diff-tokens",
+    type=click.IntRange(min=500),
+    default=8000,
+    show_default=True,
+    help="Token budget of the diff. The largest file diffs beyond it are summarized first.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Number of file diffs read and summarized concurrently.",
+)
 @click.pass_context
 @common_options
-def commitgen(ctx, model, emoji, file, temperature, tokens, no_stream, raw, debug):
+def commitgen(
+    ctx,
+    model,
+    emoji,
+    file,
+    temperature,
+    tokens,
+    no_stream,
+    raw,
+    debug,
+    max_diff_tokens,
+    workers,
+):
     """
     This is the commitgen command. It is used in a git repository.
 
@@ -227,8 +676,18 @@ def commitgen(ctx, model, emoji, file, temperature, tokens, no_stream, raw, debu
 
     Optionally, it can take entire files to provide more context.
 
+    The diffs of binary, lock and generated files are left out, and only their line counts
+    are given. If the other diffs exceed `--max-diff-tokens`, the largest ones are summarized
+    concurrently, file by file.
+
+    The message is cached: running it again on the same staged changes offers the same message
+    at once. `--refresh` generates a new one.
+
     Example usage: commitgen myfile.py
     """
+    from . import diffs
+    from .generation import generate_content, replay_response, resolve_request
+
     # Check if we are in a git repository
     try:
         subprocess.check_output(["git", "rev-parse", "--is-inside-work-tree"])
@@ -238,23 +697,89 @@ def commitgen(ctx, model, emoji, file, temperature, tokens, no_stream, raw, debu
 
     # Check if there are staged changes
     try:
-        diff_output = subprocess.check_output(["git", "diff", "--staged"]).decode("utf-8")
+        fingerprint = diffs.fingerprint_staged_changes()
     except subprocess.CalledProcessError as error:
         click.echo(click.style(f"Error occurred: {error}", fg="red"), err=True)
         sys.exit(1)
+    if fingerprint is None:
+        click.echo("No staged changes to commit.")
+        sys.exit(0)
+
+    file_content = ""
+    if file:
+        file_content = read_input_file(file, ctx.meta.get("lmtoolbox.max_input_tokens"), model)
+
+    ensure_templates()
+    system, _, notes_model = resolve_request("commitgen", "", "", model, False)
+
+    # The message generated for the same staged changes, file and options is offered again.
+    use_cache = not tokens and not ctx.meta.get("lmtoolbox.no_cache")
+    key = get_commit_message_key(fingerprint, file_content, system, notes_model, temperature, emoji)
+    cached_message = None
+    if use_cache and not ctx.meta.get("lmtoolbox.refresh"):
+        cached_message = get_cached_commit_message(key)
+
+    if cached_message is not None:
+        click.echo(
+            click.style("Reusing", fg="yellow")
+            + " the commit message generated for the same staged changes"
+            " (--refresh to generate a new one).",
+            err=True,
+        )
+        if sys.stdout.isatty():
+            click.echo("---\n\n")
+        metrics.add_request(notes_model, cached=True)
+        replay_response(cached_message, no_stream=no_stream, raw=raw)
+        if not sys.stdout.isatty():
+            sys.exit(0)
+        commit_message = cached_message
     else:
+
+        def summarize_diff(prompt: str) -> str:
+            return generate_content(diffs.NOTES_SYSTEM_PROMPT, prompt, notes_model, temperature)
+
+        try:
+            # `--tokens` counts the tokens of the diffs, without paying for their summaries.
+            diff_output = diffs.describe_changes(
+                ["--staged"],
+                None if tokens else summarize_diff,
+                notes_model,
+                max_diff_tokens,
+                workers,
+            )
+        except subprocess.CalledProcessError as error:
+            click.echo(click.style(f"Error occurred: {error}", fg="red"), err=True)
+            sys.exit(1)
         if not diff_output:
             click.echo("No staged changes to commit.")
             sys.exit(0)
 
-    if file:
-        file_content = file.read()
-        prompt_input = diff_output + "\n---\n" + file_content
-    else:
-        prompt_input = str(diff_output)
+        if file:
+            prompt_input = diff_output + "\n---\n" + file_content
+        else:
+            prompt_input = str(diff_output)
+
+        # If *not* in an interactive shell, just generate the commit message and exit
+        if not sys.stdout.isatty():
+            commit_message = process_command(
+                ctx,
+                template="commitgen",
+                emoji=emoji,
+                model=model,
+                prompt_input=prompt_input,
+                temperature=temperature,
+                tokens=tokens,
+                no_stream=no_stream,
+                raw=raw,
+                debug=debug,
+            )
+            if use_cache and commit_message and commit_message[0]:
+                cache_commit_message(key, notes_model, commit_message[0].strip())
+            sys.exit(0)
+
+        # If in an interactive shell, ask the user if they want to use the generated commit message
+        click.echo("Generating commit message...\n---\n\n")
 
-    # If *not* in an interactive shell, just generate the commit message and exit
-    if not sys.stdout.isatty():
         commit_message = process_command(
             ctx,
             template="commitgen",
@@ -263,37 +788,23 @@ def commitgen(ctx, model, emoji, file, temperature, tokens, no_stream, raw, debu
             prompt_input=prompt_input,
             temperature=temperature,
             tokens=tokens,
-            no_stream=True,
+            no_stream=no_stream,
             raw=raw,
             debug=debug,
         )
-        sys.exit(0)
 
-    # If in an interactive shell, ask the user if they want to use the generated commit message
-    click.echo("Generating commit message...\n---\n\n")
-
-    commit_message = process_command(
-        ctx,
-        template="commitgen",
-        emoji=emoji,
-        model=model,
-        prompt_input=prompt_input,
-        temperature=temperature,
-        tokens=tokens,
-        no_stream=no_stream,
-        raw=raw,
-        debug=debug,
-    )
+        # Get only the content of the ChatGPT request
+        try:
+            commit_message = commit_message[0].strip()
+        except IndexError as error:
+            click.echo(click.style(f"Error occurred: {error}", fg="red"), err=True)
+            return
+        except TypeError:
+            click.echo("No commit message generated. Aborting commit.")
+            return
 
-    # Get only the content of the ChatGPT request
-    try:
-        commit_message = commit_message[0].strip()
-    except IndexError as error:
-        click.echo(click.style(f"Error occurred: {error}", fg="red"), err=True)
-        return
-    except TypeError:
-        click.echo("No commit message generated. Aborting commit.")
-        return
+        if use_cache and commit_message:
+            cache_commit_message(key, notes_model, commit_message)
 
     # Clean `^M` characters
     commit_message = commit_message.replace("\r", "")
@@ -338,22 +849,162 @@ def commitgen(ctx, model, emoji, file, temperature, tokens, no_stream, raw, debu
         os.remove(tmp_path)
 
 
+def get_commit_message_key(
+    fingerprint: str,
+    file_content: str,
+    system: str,
+    model: str,
+    temperature: float,
+    emoji: bool,
+) -> str:
+    """
+    Returns the cache key of the commit message of the staged changes.
+    """
+    import hashlib
+
+    from .cache import make_key
+
+    file_hash = hashlib.sha256(file_content.encode("utf-8")).hexdigest()
+    return make_key(
+        "commitgen", system, model, temperature, emoji, f"staged {fingerprint} file {file_hash}"
+    )
+
+
+def get_cached_commit_message(key: str) -> str | None:
+    from lmterminal.lib import load_config
+
+    from .cache import ResponseCache
+
+    with ResponseCache(config=load_config()) as response_cache:
+        if not response_cache.is_enabled("commitgen"):
+            return None
+        return response_cache.get(key, "commitgen")
+
+
+def cache_commit_message(key: str, model: str, commit_message: str) -> None:
+    from lmterminal.lib import load_config
+
+    from .cache import ResponseCache
+
+    with ResponseCache(config=load_config()) as response_cache:
+        if response_cache.is_enabled("commitgen"):
+            response_cache.set(key, "commitgen", model, commit_message)
+
+
 @cli.command()
-@click.argument("file_to_review", type=click.File("r"), required=False)
+@click.argument("paths", nargs=-1, required=False)
+@click.option(
+    "--include",
+    "patterns",
+    multiple=True,
+    help=(
+        "Only review the files of the directories and revision ranges that match this glob"
+        " pattern (e.g. '*.py'). Can be repeated."
+    ),
+)
+@click.option(
+    "--chunk-tokens",
+    type=click.IntRange(min=500),
+    default=6000,
+    show_default=True,
+    help="Maximum number of tokens per request. Larger files are reviewed in parts.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Number of files reviewed concurrently.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help=(
+        "Review the files function by function (or hunk by hunk), and only the parts that"
+        " changed since their last review. The reviews of the other parts are reused."
+    ),
+)
 @click.pass_context
 @common_options
-def codereview(ctx, model, emoji, file_to_review, temperature, tokens, no_stream, raw, debug):
+def codereview(
+    ctx,
+    model,
+    emoji,
+    paths,
+    temperature,
+    tokens,
+    no_stream,
+    raw,
+    debug,
+    patterns,
+    chunk_tokens,
+    workers,
+    incremental,
+):
     """
-    Generate a code review for a given file.
+    Generate a code review for the given files, directories, or git revision range.
+
+    Several files, the files of a directory (filtered with `--include`), or the changes of
+    a revision range such as `main..HEAD` are reviewed concurrently, file by file. Each review
+    is printed as soon as it is done, followed by an overview of all of them.
+
+    With `--incremental`, the files are reviewed block by block (functions and classes, or
+    hunks of lines), and only the blocks that changed since their last review are sent.
 
     Example usage: cat file.py | codereview --emoji
+
+    Example usage: codereview main..HEAD --include '*.py'
+
+    Example usage: codereview --incremental lmtoolbox/cli.py
     """
+    from . import chunking, review
+
+    prompt_input = ""
+    if paths == ("-",):
+        paths = ()
+
+    if incremental and not paths:
+        raise click.UsageError("--incremental needs files or directories to review.")
+
+    if len(paths) == 1 and os.path.isfile(paths[0]) and not incremental:
+        with click.open_file(paths[0]) as file_to_review:
+            prompt_input = read_input_file(
+                file_to_review, ctx.meta.get("lmtoolbox.max_input_tokens"), model
+            )
+        if chunking.count_tokens(prompt_input, model) > chunk_tokens and not tokens:
+            paths = (paths[0],)
+        else:
+            paths = ()
+
+    if paths:
+        if tokens:
+            raise click.UsageError("--tokens does not support several files.")
+        try:
+            targets = review.collect_targets(paths, patterns)
+        except (review.ReviewError, OSError, subprocess.CalledProcessError) as error:
+            click.echo(click.style("Error occurred:", fg="red") + f" {error}", err=True)
+            sys.exit(1)
+        if not targets:
+            click.echo("No files to review.")
+            return
+        if incremental:
+            if any(target.revisions for target in targets):
+                raise click.UsageError("--incremental does not support revision ranges.")
+            review_targets_incrementally(
+                ctx, targets, model, emoji, temperature, no_stream, raw, workers
+            )
+            return
+        review_targets(
+            ctx, targets, model, emoji, temperature, no_stream, raw, debug, chunk_tokens, workers
+        )
+        return
+
     process_command(
         ctx,
         "codereview",
         model,
         emoji,
-        file_to_review,
+        prompt_input,
         temperature,
         tokens,
         no_stream,
@@ -362,41 +1013,317 @@ def codereview(ctx, model, emoji, file_to_review, temperature, tokens, no_stream
     )
 
 
+def review_targets(
+    ctx,
+    targets: list,
+    model: str,
+    emoji: bool,
+    temperature: float,
+    no_stream: bool,
+    raw: bool,
+    debug: bool,
+    chunk_tokens: int,
+    workers: int,
+):
+    """
+    Reviews files concurrently, prints each review as soon as it is done, then an overview.
+    """
+    from . import review
+    from .generation import complete, replay_response
+
+    ensure_templates()
+
+    items = [
+        item for target in targets for item in review.split_target(target, chunk_tokens, model)
+    ]
+    click.echo(
+        f"Reviewing {len(items)} files or parts with {min(workers, len(items))} workers.",
+        err=True,
+    )
+
+    reviews = {}
+    failed = False
+    for index, (item, content, error) in enumerate(
+        review.review_items(
+            items,
+            reviewer=lambda prompt: complete("codereview", prompt, model, temperature, emoji),
+            workers=workers,
+        )
+    ):
+        if index:
+            click.echo()
+        click.echo(click.style(item.name, fg="blue", bold=True))
+        if error is not None:
+            failed = True
+            message = error.format_message() if isinstance(error, click.ClickException) else error
+            click.echo(click.style("Error occurred:", fg="red") + f" {message}", err=True)
+            continue
+        reviews[item.name] = content
+        replay_response(content, no_stream=no_stream, raw=raw)
+
+    if len(reviews) > 1:
+        click.echo()
+        click.echo(click.style("Overview", fg="blue", bold=True))
+        # In the order of the files, not of the completion.
+        ordered = [
+            f"## {item.name}\n\n{reviews[item.name]}" for item in items if item.name in reviews
+        ]
+        process_command(
+            ctx,
+            "codereview",
+            model,
+            emoji,
+            review.OVERVIEW_PROMPT.format(reviews="\n\n".join(ordered)),
+            temperature,
+            False,
+            no_stream,
+            raw,
+            debug,
+        )
+
+    if failed:
+        sys.exit(1)
+
+
+def review_targets_incrementally(
+    ctx,
+    targets: list,
+    model: str,
+    emoji: bool,
+    temperature: float,
+    no_stream: bool,
+    raw: bool,
+    workers: int,
+):
+    """
+    Reviews the blocks of the files that changed since their last review, and prints the
+    review of each file, merged with the reviews of its unchanged blocks.
+    """
+    from lmterminal.lib import load_config
+
+    from . import review
+    from .cache import ResponseCache
+    from .generation import complete, replay_response, resolve_request
+
+    ensure_templates()
+    system, _, resolved_model = resolve_request("codereview", "", "", model, emoji)
+
+    def review_blocks(index):
+        return review.review_changed_blocks(
+            targets,
+            reviewer=lambda prompt: complete("codereview", prompt, model, temperature, emoji),
+            index=index,
+            workers=workers,
+        )
+
+    with ResponseCache(config=load_config()) as response_cache:
+        if ctx.meta.get("lmtoolbox.no_cache") or not response_cache.is_enabled("codereview"):
+            files = review_blocks(None)
+        else:
+            files = review_blocks(
+                review.ReviewIndex(
+                    response_cache,
+                    system,
+                    resolved_model,
+                    temperature,
+                    emoji,
+                    refresh=ctx.meta.get("lmtoolbox.refresh", False),
+                )
+            )
+
+    block_reviews = [block_review for _, reviews in files for block_review in reviews]
+    cached = sum(block_review.cached for block_review in block_reviews)
+    for _ in range(cached):
+        metrics.add_request(resolved_model, cached=True)
+    click.echo(
+        f"Reviewed {len(block_reviews) - cached} changed blocks of {len(block_reviews)}"
+        f" ({cached} from the index).",
+        err=True,
+    )
+
+    failed = False
+    for index, (target, reviews) in enumerate(files):
+        if index:
+            click.echo()
+        click.echo(click.style(target.path, fg="blue", bold=True))
+        for block_review in reviews:
+            if block_review.error is not None:
+                failed = True
+                error = block_review.error
+                message = (
+                    error.format_message() if isinstance(error, click.ClickException) else error
+                )
+                click.echo(
+                    click.style("Error occurred:", fg="red")
+                    + f" {block_review.block.name}: {message}",
+                    err=True,
+                )
+        content = review.format_block_reviews(reviews)
+        if content:
+            replay_response(content, no_stream=no_stream, raw=raw)
+
+    if failed:
+        sys.exit(1)
+
+
 @cli.command()
 @click.argument("source", nargs=-1, required=False)
+@click.option(
+    "--chunk-tokens",
+    type=click.IntRange(min=100),
+    default=None,
+    show_default="the context window of the model, minus the reserved tokens",
+    help="Maximum number of tokens per request. Longer inputs are summarized in chunks.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=summarization.DEFAULT_WORKERS,
+    show_default=True,
+    help="Number of chunks summarized concurrently.",
+)
+@click.option(
+    "--max-page-size",
+    type=click.IntRange(min=1),
+    default=5 * 1024 * 1024,
+    show_default=True,
+    help="Maximum size of a web page, in bytes. Longer pages are truncated.",
+)
+@click.option(
+    "--no-extract",
+    is_flag=True,
+    help="Summarize the whole text of web pages, not only their main content.",
+)
+@click.option(
+    "--digest",
+    is_flag=True,
+    help="With several sources, combine their summaries into a single one.",
+)
 @click.pass_context
 @common_options
-def summarize(ctx, model, emoji, source, temperature, tokens, no_stream, raw, debug):
+def summarize(
+    ctx,
+    model,
+    emoji,
+    source,
+    temperature,
+    tokens,
+    no_stream,
+    raw,
+    debug,
+    chunk_tokens,
+    workers,
+    max_page_size,
+    no_extract,
+    digest,
+):
     """
-    Summarize the text, the content of a given file, or a webpage (provided as URL).
+    Summarize the text, the content of a given file, a webpage or a YouTube video (provided as
+    URL).
+
+    Inputs longer than `--chunk-tokens` (by default, what fits in the context window of the
+    model) are split into chunks, which are summarized concurrently and then combined.
+
+    Only the main content of web pages is summarized, without their navigation, sidebars,
+    footers, ... unless `--no-extract` is given.
+
+    Several files and URLs are fetched and summarized concurrently, and their summaries are
+    printed in order. YouTube playlists and channels, and files that list YouTube videos (one
+    URL per line), are summarized video by video. `--digest` combines them into a single
+    summary.
     """
+    from . import chunking, inputs, sources, video_summarization
+    from .generation import complete
+
+    chunk_tokens = chunk_tokens or get_chunk_tokens(model)
+
+    if all(sources.classify(argument) for argument in source) and (
+        len(source) > 1 or (source and sources.is_collection(source[0]))
+    ):
+        if tokens:
+            raise click.UsageError("--tokens does not support several sources.")
+        summarize_sources(
+            ctx,
+            source,
+            model,
+            emoji,
+            temperature,
+            no_stream,
+            raw,
+            debug,
+            chunk_tokens,
+            workers,
+            max_page_size,
+            not no_extract,
+            digest,
+        )
+        return
+
     template = "summarize"
     source_str: str = " ".join(source)
+    max_input_tokens = ctx.meta.get("lmtoolbox.max_input_tokens")
 
     prompt_input: str = ""
+    segments: Iterable[str] | None = None
+    is_streamed = False
+    separator = "\n\n"
+    kind = "document"
 
     # Determine what kind of source we are dealing with
-    if video_summarization.is_youtube_video(source_str):  # YouTube video
-        # Fetch the transcript of the YouTube video
-        transcript: list[dict] = video_summarization.get_transcript(source_str)
-        # Format the transcript
-        prompt_input = video_summarization.format_transcript(transcript)
-        # Use the video summarization template for the prompt
-        template = "video_summarization"
-    elif validators.url(source_str):  # Webpage (hopefully)
+    if source and sources.classify(source_str):  # YouTube video, webpage or file
         try:
-            # Fetch the content of the webpage
-            source_content = requests.get(source_str, timeout=5).text
-        except requests.RequestException as error:
+            loaded = sources.load_source(source_str, max_page_size, extract=not no_extract)
+        except sources.SourceError as error:
+            if isinstance(error.__cause__, video_summarization.TranscriptUnavailable):
+                video_summarization.exit_transcripts_disabled()
             click.echo(click.style("Error occurred:", fg="red") + f" {error}", err=True)
             sys.exit(1)
-        else:
-            prompt_input = strip_tags(input=source_content, minify=True)
+        if loaded.truncated:
+            warn_truncated_page(max_page_size)
+        if debug and loaded.html is not None:
+            report_extraction(loaded.html, loaded.text, model)
+        prompt_input = loaded.text
+        segments = loaded.segments
+        separator = loaded.separator
+        kind = loaded.kind
+        template = loaded.template
     else:
-        # Read the content from `stdin`
         if source:
             content = "".join(source)
             prompt_input += content
+        elif not sys.stdin.isatty():
+            # Read `stdin` incrementally: beyond one chunk, it is summarized as it is read.
+            blocks = inputs.truncate_blocks(
+                inputs.iter_text_blocks(sys.stdin),
+                max_input_tokens,
+                model,
+                on_truncate=lambda read_tokens: click.echo(
+                    click.style("Warning:", fg="yellow")
+                    + f" the input was truncated to {read_tokens} tokens (--max-input-tokens).",
+                    err=True,
+                ),
+            )
+            bounded = inputs.read_bounded(blocks, chunk_tokens, model)
+            prompt_input = bounded.text
+            if not bounded.exhausted:
+                if tokens:
+                    prompt_input = bounded.read_all()
+                else:
+                    segments = chunking.iter_paragraphs(bounded.iter_blocks())
+                    is_streamed = True
+        prompt_input = read_prompt_input(template, prompt_input, max_input_tokens, model)
+
+    if not tokens and (is_streamed or chunking.count_tokens(prompt_input, model) > chunk_tokens):
+        ensure_templates()
+        prompt_input = summarization.map_reduce(
+            segments or chunking.split_paragraphs(prompt_input),
+            summarizer=lambda chunk: complete(template, chunk, model, temperature),
+            model=model,
+            chunk_tokens=chunk_tokens,
+            workers=workers,
+            kind=kind,
+            separator=separator,
+        )
 
     process_command(
         ctx,
@@ -412,127 +1339,158 @@ def summarize(ctx, model, emoji, source, temperature, tokens, no_stream, raw, de
     )
 
 
-@cli.command()
-@click.argument("work_to_critique", nargs=-1, required=False)
-@click.pass_context
-@common_options
-def critique(ctx, model, emoji, work_to_critique, temperature, tokens, no_stream, raw, debug):
+def get_chunk_tokens(model: str) -> int:
     """
-    Generate a critique for a given piece of work.
+    Returns the default number of tokens per request of `summarize`: the context window of the
+    model minus the tokens reserved for the response, if the context window is known.
     """
-    process_command(
-        ctx,
-        "critique",
-        model,
-        emoji,
-        work_to_critique,
-        temperature,
-        tokens,
-        no_stream,
-        raw,
-        debug,
-    )
+    from lmterminal.lib import load_config
 
+    return budget.get_chunk_tokens(model, load_config()) or summarization.DEFAULT_CHUNK_TOKENS
 
-@cli.command()
-@click.argument("topic", nargs=-1, required=False)
-@click.pass_context
-@common_options
-def pathlearner(ctx, model, emoji, topic, temperature, tokens, no_stream, raw, debug):
-    """
-    Provide a study plan for a given topic.
-    """
-    process_command(
-        ctx,
-        "pathlearner",
-        model,
-        emoji,
-        topic,
-        temperature,
-        tokens,
-        no_stream,
-        raw,
-        debug,
+
+def warn_truncated_page(max_page_size: int) -> None:
+    click.echo(
+        click.style("Warning:", fg="yellow")
+        + f" the page was truncated to {max_page_size} bytes (--max-page-size).",
+        err=True,
     )
 
 
-@cli.command()
-@click.argument("concept", nargs=-1, required=False)
-@click.pass_context
-@common_options
-def explain(ctx, model, emoji, concept, temperature, tokens, no_stream, raw, debug):
-    """
-    Explain a concept.
-    """
-    process_command(
-        ctx,
-        "explain",
-        model,
-        emoji,
-        concept,
-        temperature,
-        tokens,
-        no_stream,
-        raw,
-        debug,
+def report_extraction(html: str, text: str, model: str) -> None:
+    from .extraction import token_reduction
+
+    stripped_tokens, extracted_tokens = token_reduction(html, text, model)
+    reduction = 1 - extracted_tokens / stripped_tokens if stripped_tokens else 0.0
+    click.echo(
+        f"Main content: {extracted_tokens} tokens, against {stripped_tokens} for the whole"
+        f" page ({reduction:.0%} fewer).",
+        err=True,
     )
 
 
-@cli.command()
-@click.argument("mood", nargs=-1, required=False)
-@click.pass_context
-@common_options
-def cheermeup(ctx, model, emoji, mood, temperature, tokens, no_stream, raw, debug):
+def summarize_sources(
+    ctx,
+    arguments: tuple[str, ...],
+    model: str,
+    emoji: bool,
+    temperature: float,
+    no_stream: bool,
+    raw: bool,
+    debug: bool,
+    chunk_tokens: int,
+    workers: int,
+    max_page_size: int,
+    extract: bool,
+    digest: bool,
+):
     """
-    Cheer you up based on your mood.
+    Summarizes several sources concurrently, and prints the summaries in the order of the
+    arguments, optionally followed by a digest of all of them.
+
+    A status line is printed on `stderr` as each source is done.
     """
-    process_command(
-        ctx, "cheermeup", model, emoji, mood, temperature, tokens, no_stream, raw, debug
-    )
+    import threading
+
+    from . import chunking, sources
+    from .generation import complete, replay_response
+
+    ensure_templates()
+
+    def summarize_source(argument: str) -> str:
+        source = sources.load_source(argument, max_page_size, extract)
+        if source.truncated:
+            warn_truncated_page(max_page_size)
+        if debug and source.html is not None:
+            report_extraction(source.html, source.text, model)
+
+        prompt_input = source.text
+        if chunking.count_tokens(prompt_input, model) > chunk_tokens:
+            prompt_input = summarization.map_reduce(
+                source.segments or chunking.split_paragraphs(prompt_input),
+                summarizer=lambda chunk: complete(source.template, chunk, model, temperature),
+                model=model,
+                chunk_tokens=chunk_tokens,
+                workers=workers,
+                kind=source.kind,
+                separator=source.separator,
+            )
+        return complete(source.template, prompt_input, model, temperature, emoji=emoji)
+
+    arguments, errors = sources.expand_sources(arguments)
+    for argument, error in errors:
+        click.echo(click.style("Error occurred:", fg="red") + f" {error}", err=True)
+
+    status_lock = threading.Lock()
+    done = 0
+
+    def print_status(argument: str, error: Exception | None, elapsed: float) -> None:
+        nonlocal done
+        with status_lock:
+            done += 1
+            status = click.style("failed", fg="red") if error else click.style("done", fg="green")
+            click.echo(f"[{done}/{len(arguments)}] {status} {argument} ({elapsed:.1f}s)", err=True)
+
+    summaries = {}
+    failed = bool(errors)
+    for index, (argument, summary, error) in enumerate(
+        sources.map_in_order(summarize_source, arguments, workers, on_done=print_status)
+    ):
+        if index:
+            click.echo()
+        click.echo(click.style(argument, fg="blue", bold=True))
+        if error is not None:
+            failed = True
+            message = error.format_message() if isinstance(error, click.ClickException) else error
+            click.echo(click.style("Error occurred:", fg="red") + f" {message}", err=True)
+            continue
+        summaries[argument] = summary
+        replay_response(summary, no_stream=no_stream, raw=raw)
+
+    if digest and len(summaries) > 1:
+        click.echo()
+        click.echo(click.style("Digest", fg="blue", bold=True))
+        prompt_input = summarization.DIGEST_PROMPT.format(
+            summaries="\n\n".join(
+                f"Source: {argument}\n\n{summary}" for argument, summary in summaries.items()
+            )
+        )
+        process_command(
+            ctx, "summarize", model, emoji, prompt_input, temperature, False, no_stream, raw, debug
+        )
 
+    if failed:
+        sys.exit(1)
 
-@cli.command()
-@click.argument("study_material", nargs=-1, required=False)
-@click.pass_context
-@common_options
-def study(ctx, model, emoji, study_material, temperature, tokens, no_stream, raw, debug):
+
+def get_life_state_path():
     """
-    Generate study material for a topic or from the content of the content of a file.
+    Returns the path to the name and the date of birth saved by `life`.
     """
-    process_command(
-        ctx,
-        "study",
-        model,
-        emoji,
-        study_material,
-        temperature,
-        tokens,
-        no_stream,
-        raw,
-        debug,
-    )
+    from .storage import get_config_dir
 
+    return get_config_dir() / "lmtoolbox-life.json"
 
-@cli.command()
-@click.argument("library_name", nargs=-1, required=False)
-@click.pass_context
-@common_options
-def teachlib(ctx, model, emoji, library_name, temperature, tokens, no_stream, raw, debug):
+
+def load_life_state() -> dict:
+    import json
+
+    try:
+        state = json.loads(get_life_state_path().read_bytes())
+    except (OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}
+
+
+def save_life_state(state: dict) -> None:
     """
-    Teach a library.
+    Saves the state of `life` atomically.
     """
-    process_command(
-        ctx,
-        "teachlib",
-        model,
-        emoji,
-        library_name,
-        temperature,
-        tokens,
-        no_stream,
-        raw,
-        debug,
-    )
+    import json
+
+    from .storage import atomic_write_text
+
+    atomic_write_text(get_life_state_path(), json.dumps(state, indent=4))
 
 
 @cli.command()
@@ -543,38 +1501,43 @@ def life(ctx, reset, model, emoji, temperature, tokens, no_stream, raw, debug):
     """
     Comment on the remaining lifespan of a person.
     """
-    template_file = get_template_content("life")
+    from .generation import generate_response, resolve_request
+
+    ensure_templates()
+    template_file = get_template("life")
     user_info = template_file["user_info"]
 
-    if user_info["name"] is None or reset:
+    # The name and the date of birth used to be saved in the template itself.
+    state = load_life_state()
+    user_name = None if reset else state.get("name") or user_info.get("name")
+    date_of_birth_str = (
+        None if reset else state.get("date_of_birth") or user_info.get("date_of_birth")
+    )
+
+    if user_name is None:
         user_name = click.prompt("What is your name?", type=str)
-    else:
-        user_name = user_info["name"]
 
     while True:
         try:
-            if user_info["date_of_birth"] is None or reset:
+            if date_of_birth_str is None:
                 date_of_birth_str = click.prompt(
                     "What is your date of birth? (YYYY-MM-DD)", type=str
                 )
-            else:
-                date_of_birth_str = user_info["date_of_birth"]
             date_of_birth = datetime.strptime(date_of_birth_str, "%Y-%m-%d")
 
         except ValueError:
             click.echo("Please enter a valid date.")
+            date_of_birth_str = None
         else:
             break
 
     life_expectancy = user_info["life_expectancy"]
     system = template_file["system"]
 
-    # Update the template file
-    template_file["user_info"]["name"] = user_name
-    template_file["user_info"]["date_of_birth"] = date_of_birth_str
-    template_path = TEMPLATES_DIR / "life.yaml"
-    with open(template_path, "w", encoding="UTF-8") as file:
-        yaml.dump(template_file, file, default_flow_style=False)
+    # Only written when it changes, so that the template is never rewritten.
+    new_state = {"name": user_name, "date_of_birth": date_of_birth_str}
+    if new_state != state:
+        save_life_state(new_state)
 
     remaining_days = life_expectancy - (datetime.now() - date_of_birth).days
     percentage = f"{(remaining_days / life_expectancy) * 100:.2f}"
@@ -583,18 +1546,9 @@ def life(ctx, reset, model, emoji, temperature, tokens, no_stream, raw, debug):
         user_name=user_name, remaining_days=remaining_days, percentage=percentage
     )
 
-    prepare_and_generate_response(
-        system=system,
-        template="",  # No template for this command
-        model=model,
-        emoji=True,
-        prompt_input="",
-        temperature=temperature,
-        tokens=tokens,
-        no_stream=no_stream,
-        raw=raw,
-        debug=debug,
-    )
+    # No template for this command.
+    system, prompt_input, model = resolve_request("", system, "", model, emoji=True)
+    generate_response(system, prompt_input, model, temperature, tokens, no_stream, raw, debug)
 
 
 def process_command(
@@ -612,14 +1566,118 @@ def process_command(
     """
     Process a given command using a specific template and optional lines.
     """
-    if template in ["summarize", "commitgen", "video_summarization"]:
+    with profiling.span("read_input"):
+        prompt_input = read_prompt_input(
+            template, prompt_input, ctx.meta.get("lmtoolbox.max_input_tokens"), model
+        )
+
+    # When `stdout` is a pipe or a file, stream raw text instead of rendering Markdown.
+    to_pipe = not sys.stdout.isatty() and not no_stream and not tokens
+    if not sys.stdout.isatty():
+        no_stream = True
+
+    ensure_templates()
+    prompt_input = fit_to_context_window(
+        template, model, emoji, prompt_input, temperature, ctx.meta.get("lmtoolbox.fit"), debug
+    )
+
+    return generate_with_cache(
+        template=template,
+        model=model,
+        emoji=emoji,
+        prompt_input=prompt_input,
+        temperature=temperature,
+        no_stream=no_stream,
+        raw=raw,
+        debug=debug,
+        refresh=ctx.meta.get("lmtoolbox.refresh", False),
+        to_pipe=to_pipe,
+        use_cache=not tokens and not ctx.meta.get("lmtoolbox.no_cache"),
+        tokens=tokens,
+    )
+
+
+def fit_to_context_window(
+    template: str,
+    model: str,
+    emoji: bool,
+    prompt_input: str,
+    temperature: float,
+    policy: str | None,
+    debug: bool,
+) -> str:
+    """
+    Checks that the request fits in the context window of the model before it is sent, and
+    applies the policy (`--fit`, or the configured one) to an input that does not.
+    """
+    import time
+
+    from lmterminal.lib import load_config
+
+    from . import chunking
+    from .generation import complete, resolve_request
+
+    if policy == budget.CHUNK and template not in budget.CHUNKED_TEMPLATES:
+        raise click.UsageError(
+            f"`--fit chunk` summarizes the input, but the `{template}` template needs all of"
+            " it. Use `--fit truncate-head` or `--fit truncate-tail` instead."
+        )
+
+    start = time.perf_counter()
+    config = load_config()
+    system, prompt, resolved_model = resolve_request(template, "", prompt_input, model, emoji)
+    check = budget.preflight(system, prompt, prompt_input, resolved_model, config)
+    if debug:
+        elapsed = (time.perf_counter() - start) * 1000
+        click.echo(f"Preflight: {check.format()} ({elapsed:.1f} ms).", err=True)
+
+    if check.fits:
+        return prompt_input
+
+    policy = policy or budget.get_policy(config)
+    if policy == budget.CHUNK and template not in budget.CHUNKED_TEMPLATES:
+        # The configured policy only applies to the templates that can be chunked.
+        policy = budget.FAIL
+    if policy == budget.CHUNK and check.input_budget > 0:
+        click.echo(
+            click.style("Warning:", fg="yellow")
+            + f" the input exceeds the context window of {resolved_model}: it is processed in"
+            " chunks.",
+            err=True,
+        )
+        return summarization.map_reduce(
+            chunking.split_paragraphs(prompt_input),
+            summarizer=lambda chunk: complete(template, chunk, model, temperature),
+            model=resolved_model,
+            chunk_tokens=check.input_budget,
+        )
+
+    fitted = budget.fit(prompt_input, check, policy)
+    click.echo(
+        click.style("Warning:", fg="yellow")
+        + f" the input was truncated to {check.input_budget} tokens to fit in the context window"
+        f" of {resolved_model} (--fit {policy}).",
+        err=True,
+    )
+    return fitted
+
+
+def read_prompt_input(template: str, prompt_input, max_tokens: int | None, model: str) -> str:
+    """
+    Joins the arguments of a command into the prompt, or reads it from `stdin` if there are none.
+
+    `stdin` is read incrementally, and only up to `max_tokens` tokens.
+    """
+    if isinstance(prompt_input, str):
+        prompt_input = prompt_input.strip()
+    elif template in ["summarize", "commitgen", "video_summarization"]:
         prompt_input = "".join(prompt_input).strip()
     else:
         prompt_input = " ".join(prompt_input).strip()
 
     if not prompt_input:
         if not sys.stdin.isatty():
-            prompt_input = sys.stdin.read()
+            prompt_input = read_input_file(sys.stdin, max_tokens, model)
         elif sys.stdin.isatty():
             click.echo(
                 click.style(
@@ -631,24 +1689,83 @@ def process_command(
                 )
                 + "\n---"
             )
-            prompt_input = sys.stdin.read().strip()
+            prompt_input = read_input_file(sys.stdin, max_tokens, model).strip()
             click.echo()
 
-    if not sys.stdout.isatty():
-        no_stream = True
+    return prompt_input
 
-    return prepare_and_generate_response(
-        system=None,
-        template=template,
-        model=model,
-        prompt_input=prompt_input,
-        emoji=emoji,
-        temperature=temperature,
-        tokens=tokens,
-        no_stream=no_stream,
-        raw=raw,
-        debug=debug,
-    )
+
+def read_input_file(file, max_tokens: int | None, model: str) -> str:
+    """
+    Reads a file (or `stdin`) incrementally, and warns if it is truncated to `max_tokens`.
+    """
+    from . import inputs
+
+    bounded = inputs.read_file(file, max_tokens, model)
+    if not bounded.exhausted:
+        click.echo(
+            click.style("Warning:", fg="yellow")
+            + f" the input was truncated to {bounded.tokens} tokens (--max-input-tokens).",
+            err=True,
+        )
+    return bounded.text
+
+
+def generate_with_cache(
+    template: str,
+    model: str,
+    emoji: bool,
+    prompt_input: str,
+    temperature: float,
+    no_stream: bool,
+    raw: bool,
+    debug: bool,
+    refresh: bool,
+    to_pipe: bool = False,
+    use_cache: bool = True,
+    tokens: bool = False,
+):
+    """
+    Replays the cached response of an identical request, or generates and caches a new one.
+
+    The response is rendered as it is generated, or streamed as raw text with `to_pipe`.
+    With `tokens`, the token count and the cost of the prompt are shown first.
+
+    Returns the same `(content, response_time, response)` tuple as
+    `prepare_and_generate_response()`; `response` is `None` for a cached response.
+    """
+    from lmterminal.lib import load_config
+
+    from .cache import ResponseCache, make_key
+    from .generation import generate_response, replay_response, resolve_request
+
+    system, prompt_input, model = resolve_request(template, "", prompt_input, model, emoji)
+
+    def generate():
+        return generate_response(
+            system, prompt_input, model, temperature, tokens, no_stream, raw, debug, to_pipe
+        )
+
+    if not use_cache:
+        return generate()
+
+    with ResponseCache(config=load_config()) as cache:
+        if not cache.is_enabled(template):
+            return generate()
+
+        key = make_key(template, system, model, temperature, emoji, prompt_input)
+        content = None if refresh else cache.get(key, template)
+        if content is not None:
+            if debug:
+                click.echo(click.style("Cached response:", fg="yellow") + f" {key}", err=True)
+            metrics.add_request(model, cached=True)
+            replay_response(content, no_stream=no_stream, raw=raw)
+            return content, 0.0, None
+
+        content, response_time, response = generate()
+        if content.strip():
+            cache.set(key, template, model, content)
+        return content, response_time, response
 
 
 if __name__ == "__main__":
@@ -0,0 +1,372 @@
+"""
+Resident daemon for the LMtoolbox commands.
+
+`lmtoolbox serve` keeps the modules imported, the templates parsed, and the OpenAI client
+(and its connection pool) alive, and listens on a Unix domain socket.
+
+The console scripts are thin clients: when a daemon is running, they pass their argv, working
+directory, environment and standard streams (as file descriptors) to it, and wait for the
+exit status. The command then reads and writes the client's terminal or pipes directly, so
+streaming, colors and interactive prompts behave as if the command ran in-process.
+
+When no daemon is running, the commands run in-process as usual.
+
+The client side of this module must stay cheap to import: it only uses the standard library.
+"""
+
+import json
+import os
+import socket
+import struct
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+# Set `LMTOOLBOX_NO_DAEMON=1` to always run the commands in-process.
+NO_DAEMON_ENV = "LMTOOLBOX_NO_DAEMON"
+
+_HEADER = struct.Struct("!I")
+_STATUS = struct.Struct("!i")
+
+
+def get_socket_path() -> Path:
+    """
+    Returns the path to the Unix domain socket of the daemon.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "lmtoolbox.sock"
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "lmtoolbox" / "daemon.sock"
+
+
+def forward(command: str, args: list[str], prog_name: str) -> int | None:
+    """
+    Runs the command in the daemon, if one is running.
+
+    Returns the exit status of the command, or `None` if no daemon is available, in which
+    case the command must run in-process.
+    """
+    if os.environ.get(NO_DAEMON_ENV) or not hasattr(socket, "send_fds"):
+        return None
+
+    socket_path = get_socket_path()
+    if not socket_path.exists():
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(str(socket_path))
+    except OSError:
+        client.close()
+        return None
+
+    request = json.dumps(
+        {
+            "command": command,
+            "args": args,
+            "prog_name": prog_name,
+            "cwd": os.getcwd(),
+            "env": dict(os.environ),
+            "encoding": getattr(sys.stdout, "encoding", None),
+        }
+    ).encode("utf-8")
+
+    with client:
+        try:
+            streams = [sys.stdin.fileno(), sys.stdout.fileno(), sys.stderr.fileno()]
+            sys.stdout.flush()
+            sys.stderr.flush()
+            socket.send_fds(client, [_HEADER.pack(len(request))], streams)
+            client.sendall(request)
+        except (OSError, ValueError):
+            # The daemon went away before accepting the request: nothing has run yet.
+            return None
+
+        try:
+            status = _receive_exactly(client, _STATUS.size)
+        except KeyboardInterrupt:
+            # Closing the connection interrupts the command in the daemon.
+            return 130
+
+    if status is None:
+        sys.stderr.write("Error: the lmtoolbox daemon closed the connection.\n")
+        return 1
+    return _STATUS.unpack(status)[0]
+
+
+def _receive_exactly(connection: socket.socket, size: int) -> bytes | None:
+    """
+    Receives exactly `size` bytes. Returns `None` if the connection is closed before.
+    """
+    data = b""
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def serve(workers: int = 1) -> None:
+    """
+    Runs the daemon in the foreground until it is interrupted.
+
+    With several workers, each one is a forked process accepting connections on the same
+    socket, and handles one command at a time.
+    """
+    import signal
+
+    import click
+
+    socket_path = get_socket_path()
+    socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    if socket_path.exists():
+        if _is_listening(socket_path):
+            raise click.ClickException(f"A daemon is already listening on {socket_path}.")
+        socket_path.unlink()
+
+    _warm_up()
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        listener.bind(str(socket_path))
+    finally:
+        os.umask(old_umask)
+    listener.listen(64)
+
+    click.echo(f"Listening on {socket_path} with {workers} worker(s).", err=True)
+
+    children = []
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        if workers <= 1:
+            _accept_forever(listener)
+        else:
+            for _ in range(workers):
+                pid = os.fork()
+                if pid == 0:
+                    signal.signal(signal.SIGINT, signal.SIG_DFL)
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    try:
+                        _accept_forever(listener)
+                    finally:
+                        os._exit(0)
+                children.append(pid)
+            for pid in children:
+                os.waitpid(pid, 0)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        listener.close()
+        try:
+            socket_path.unlink()
+        except FileNotFoundError:
+            pass
+        click.echo("Daemon stopped.", err=True)
+
+
+def _is_listening(socket_path: Path) -> bool:
+    """
+    Checks whether a daemon is accepting connections on `socket_path`.
+    """
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(socket_path))
+    except OSError:
+        return False
+    finally:
+        probe.close()
+    return True
+
+
+def _warm_up() -> None:
+    """
+    Imports the heavy dependencies, and loads the compiled index of the templates.
+    """
+    import lmterminal.cli
+    import lmterminal.lib  # noqa: F401
+    import requests  # noqa: F401
+    import strip_tags.lib  # noqa: F401
+    import validators  # noqa: F401
+    import youtube_transcript_api  # noqa: F401
+
+    from .templates import ensure_templates, list_templates
+
+    ensure_templates()
+    # The index stays in memory until its file changes.
+    list_templates()
+
+
+def _accept_forever(listener: socket.socket) -> None:
+    """
+    Accepts and handles the connections one at a time.
+    """
+    while True:
+        connection, _ = listener.accept()
+        with connection:
+            try:
+                _handle(connection)
+            except KeyboardInterrupt:
+                # Late interruption from a client that disconnected.
+                pass
+            except Exception as error:  # noqa: BLE001 - keep serving the other clients
+                sys.stderr.write(f"Error: failed to handle a request: {error}\n")
+
+
+def _check_peer(connection: socket.socket) -> bool:
+    """
+    Checks that the client runs as the same user as the daemon, where the OS tells us.
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return True
+    credentials = connection.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", credentials)
+    return uid == os.getuid()
+
+
+def _handle(connection: socket.socket) -> None:
+    """
+    Runs one command with the standard streams, directory and environment of the client.
+    """
+    import threading
+    import time
+
+    message, fds, _, _ = socket.recv_fds(connection, _HEADER.size, 3)
+    try:
+        if len(fds) != 3 or len(message) != _HEADER.size or not _check_peer(connection):
+            return
+        payload = _receive_exactly(connection, _HEADER.unpack(message)[0])
+        if payload is None:
+            return
+        request = json.loads(payload)
+
+        done = threading.Event()
+        watcher = threading.Thread(
+            target=_interrupt_on_disconnect, args=(connection, done), daemon=True
+        )
+        watcher.start()
+
+        start = time.perf_counter()
+        try:
+            with _client_context(fds, request):
+                status = _run(request["command"], request["args"], request["prog_name"])
+        except KeyboardInterrupt:
+            status = 130
+        done.set()
+
+        elapsed = (time.perf_counter() - start) * 1000
+        sys.stderr.write(
+            f"{request['prog_name']} {' '.join(request['args'])} -> {status} ({elapsed:.0f} ms)\n"
+        )
+        try:
+            connection.sendall(_STATUS.pack(status))
+        except OSError:
+            pass
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def _interrupt_on_disconnect(connection: socket.socket, done) -> None:
+    """
+    Interrupts the running command if the client disconnects (e.g. on Ctrl+C).
+    """
+    import _thread
+
+    try:
+        connection.recv(1)
+    except OSError:
+        pass
+    if not done.is_set():
+        _thread.interrupt_main()
+
+
+@contextmanager
+def _client_context(fds: list[int], request: dict):
+    """
+    Temporarily swaps the standard streams, working directory and environment of the process
+    for the ones of the client.
+    """
+    saved_fds = [os.dup(fd) for fd in (0, 1, 2)]
+    saved_streams = (sys.stdin, sys.stdout, sys.stderr)
+    saved_cwd = os.getcwd()
+    saved_env = dict(os.environ)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    # Subprocesses (e.g. `git commit` in `commitgen`) inherit the descriptors directly.
+    for fd, target in zip(fds, (0, 1, 2)):
+        os.dup2(fd, target)
+
+    # The streams stay open for the whole command: they are flushed and dropped below.
+    encoding = request.get("encoding")
+    sys.stdin = open(0, encoding=encoding, closefd=False)  # noqa: SIM115
+    sys.stdout = open(1, "w", encoding=encoding, closefd=False)  # noqa: SIM115
+    sys.stderr = open(  # noqa: SIM115
+        2, "w", encoding=encoding, errors="backslashreplace", closefd=False
+    )
+
+    os.environ.clear()
+    os.environ.update(request["env"])
+    try:
+        os.chdir(request["cwd"])
+        yield
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except (OSError, ValueError):
+                pass
+
+        sys.stdin, sys.stdout, sys.stderr = saved_streams
+        for fd, target in zip(saved_fds, (0, 1, 2)):
+            os.dup2(fd, target)
+            os.close(fd)
+
+        os.chdir(saved_cwd)
+        os.environ.clear()
+        os.environ.update(saved_env)
+
+
+def _run(command_name: str, args: list[str], prog_name: str) -> int:
+    """
+    Runs a command of `lmtoolbox.cli` like Click would in a console script.
+    """
+    import traceback
+
+    import click
+
+    from . import cli
+
+    if command_name == cli.cli.name:
+        command = cli.cli
+    else:
+        # The commands of the templates are only built when they are looked up.
+        command = cli.cli.get_command(click.Context(cli.cli), command_name)
+    if command is None:
+        sys.stderr.write(f"Error: unknown command `{command_name}`.\n")
+        return 1
+
+    try:
+        command.main(args=args, prog_name=prog_name)
+    except SystemExit as error:
+        if error.code is None:
+            return 0
+        if isinstance(error.code, int):
+            return error.code
+        sys.stderr.write(f"{error.code}\n")
+        return 1
+    except Exception:  # noqa: BLE001 - report like an uncaught exception would
+        traceback.print_exc()
+        return 1
+    return 0
@@ -0,0 +1,295 @@
+"""
+Partitioning of git diffs by file, so that large diffs fit in the prompt of `commitgen`.
+
+The changed files are listed with `git diff --numstat`, and the diff of each file is read on
+its own. The binary files, the lock files and the generated files (minified assets, vendored
+code, protobuf stubs, files with a `@generated` header, ...) are only described by their line
+counts, and listed on stderr. If the other diffs still exceed the token budget, the largest
+ones are replaced by notes that summarize them, generated concurrently.
+"""
+
+import hashlib
+import itertools
+import re
+import subprocess
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+
+import click
+
+from . import chunking, summarization
+
+DEFAULT_MAX_DIFF_TOKENS = 8000
+DEFAULT_WORKERS = 4
+
+# The hash of the tree without files.
+EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+LOCK_FILES = frozenset(
+    {
+        "Cargo.lock",
+        "Gemfile.lock",
+        "Pipfile.lock",
+        "composer.lock",
+        "go.sum",
+        "package-lock.json",
+        "pdm.lock",
+        "pnpm-lock.yaml",
+        "poetry.lock",
+        "uv.lock",
+        "yarn.lock",
+    }
+)
+GENERATED_SUFFIXES = (".min.js", ".min.css", ".map", "_pb2.py", "_pb2_grpc.py", ".pb.go")
+GENERATED_DIRECTORIES = frozenset({"dist", "node_modules", "third_party", "vendor"})
+# The conventional header of generated code (`// Code generated by protoc. DO NOT EDIT.`,
+# `# @generated by ...`): a comment that starts with the marker, in the first lines of the file.
+GENERATED_HEADER = re.compile(
+    r"^\s*(?:#|//|/?\*|--|;|<!--)\s*(?:Code generated .* DO NOT EDIT|@generated\b)"
+)
+GENERATED_HEADER_LINES = 5
+# A hunk that starts at the first line of the new file.
+FIRST_HUNK = re.compile(r"^@@ -\d+(?:,\d+)? \+1(?:,\d+)? @@")
+
+# Rough size of the note that replaces a summarized diff.
+NOTE_TOKENS = 200
+
+NOTES_SYSTEM_PROMPT = (
+    "You describe the changes of a diff of a single file, for the author of the commit message."
+    " List what changed and why it seems to have changed in a few short bullet points, without"
+    " repeating the code."
+)
+NOTES_PROMPT = "Diff of `{path}`:\n\n{diff}"
+
+
+@dataclass
+class FileChange:
+    """
+    A changed file, with its line counts from `git diff --numstat`.
+    """
+
+    path: str
+    # `None` for binary files.
+    added: int | None
+    deleted: int | None
+    old_path: str | None = None
+    diff: str = ""
+    skip_reason: str | None = None
+    note: str | None = None
+
+    @property
+    def binary(self) -> bool:
+        return self.added is None
+
+    def format_stat(self) -> str:
+        path = f"{self.old_path} => {self.path}" if self.old_path else self.path
+        lines = "binary" if self.binary else f"+{self.added} -{self.deleted}"
+        return f"{path} ({lines})"
+
+
+def git(*args: str, quiet: bool = False) -> str:
+    """
+    Runs a git command and returns its output. Raises `subprocess.CalledProcessError`.
+    """
+    output = subprocess.check_output(["git", *args], stderr=subprocess.DEVNULL if quiet else None)
+    return output.decode("utf-8", errors="replace")
+
+
+def fingerprint_staged_changes() -> str | None:
+    """
+    Returns a fingerprint of the staged changes, or `None` if nothing is staged.
+
+    The fingerprint is made of the tree of `HEAD` and of the tree of the index (written with
+    `git write-tree`), which only change with the staged changes. When the index cannot be
+    written (e.g. during a merge with conflicts), it is the hash of the staged diff.
+    """
+    try:
+        tree = git("write-tree", quiet=True).strip()
+    except subprocess.CalledProcessError:
+        diff = git("diff", "--staged", "--no-ext-diff")
+        return hashlib.sha256(diff.encode("utf-8")).hexdigest() if diff else None
+
+    try:
+        head = git("rev-parse", "--verify", "--quiet", "HEAD^{tree}", quiet=True).strip()
+    except subprocess.CalledProcessError:
+        # No commit yet.
+        head = EMPTY_TREE
+    return f"{head}..{tree}" if tree != head else None
+
+
+def get_changes(diff_args: Sequence[str]) -> list[FileChange]:
+    """
+    Lists the files changed by `git diff <diff_args>`, e.g. `["--staged"]`.
+    """
+    output = git("diff", "--numstat", "-z", *diff_args)
+    fields = output.split("\0")
+    changes = []
+    index = 0
+    while index < len(fields) and fields[index]:
+        added, deleted, path = fields[index].split("\t", 2)
+        old_path = None
+        if not path:
+            # A rename: the old and the new paths follow, in their own fields.
+            old_path, path = fields[index + 1], fields[index + 2]
+            index += 2
+        index += 1
+        changes.append(
+            FileChange(
+                path,
+                int(added) if added != "-" else None,
+                int(deleted) if deleted != "-" else None,
+                old_path,
+            )
+        )
+    return changes
+
+
+def get_skip_reason(change: FileChange) -> str | None:
+    """
+    Returns why the diff of a file is not worth showing, from its path, or `None`.
+    """
+    if change.binary:
+        return "binary"
+    return get_path_skip_reason(change.path)
+
+
+def get_path_skip_reason(path: str) -> str | None:
+    """
+    Returns "lock file" or "generated" for the paths of such files, `None` otherwise.
+    """
+    path = PurePosixPath(path)
+    if path.name in LOCK_FILES:
+        return "lock file"
+    if path.name.endswith(GENERATED_SUFFIXES) or GENERATED_DIRECTORIES.intersection(
+        path.parts[:-1]
+    ):
+        return "generated"
+    return None
+
+
+def is_generated(diff: str) -> bool:
+    """
+    Checks whether the diff of a file shows the header of generated code in its first lines.
+
+    The markers are only looked for in a comment that starts with them, so that a file that
+    mentions them elsewhere (in a docstring, a test, ...) is not taken for a generated one.
+    """
+    lines = iter(diff.splitlines())
+    for line in lines:
+        if line.startswith("@@"):
+            if not FIRST_HUNK.match(line):
+                return False
+            break
+    else:
+        return False
+
+    header = itertools.islice(
+        (line for line in lines if not line.startswith("-")), GENERATED_HEADER_LINES
+    )
+    return any(GENERATED_HEADER.match(line[1:]) for line in header)
+
+
+def get_file_diff(change: FileChange, diff_args: Sequence[str]) -> str:
+    paths = [change.old_path, change.path] if change.old_path else [change.path]
+    return git("diff", "--no-ext-diff", *diff_args, "--", *paths)
+
+
+def select_diffs_to_summarize(changes: list[FileChange], max_tokens: int, model: str) -> set[int]:
+    """
+    Returns the indexes of the largest diffs to replace by notes, so that the others fit in
+    `max_tokens` tokens.
+    """
+    tokens = {
+        index: chunking.count_tokens(change.diff, model) for index, change in enumerate(changes)
+    }
+    total = sum(tokens.values())
+    selected = set()
+    for index in sorted(tokens, key=tokens.get, reverse=True):
+        if total <= max_tokens:
+            break
+        selected.add(index)
+        total -= tokens[index] - NOTE_TOKENS
+    return selected
+
+
+def describe_changes(
+    diff_args: Sequence[str],
+    summarizer: Callable[[str], str] | None,
+    model: str,
+    max_tokens: int = DEFAULT_MAX_DIFF_TOKENS,
+    workers: int = DEFAULT_WORKERS,
+) -> str | None:
+    """
+    Returns the changes of `git diff <diff_args>` in at most about `max_tokens` tokens, or
+    `None` if there are none.
+
+    `summarizer` generates a note from a prompt, with `NOTES_SYSTEM_PROMPT`. Without it, no
+    diff is summarized, whatever its size.
+    """
+    changes = get_changes(diff_args)
+    if not changes:
+        return None
+
+    for change in changes:
+        change.skip_reason = get_skip_reason(change)
+    shown = [change for change in changes if change.skip_reason is None]
+
+    def read_diff(change: FileChange) -> None:
+        change.diff = get_file_diff(change, diff_args)
+        if is_generated(change.diff):
+            change.skip_reason = "generated"
+
+    def summarize_diff(change: FileChange) -> None:
+        prompt = summarization.map_reduce(
+            change.diff.splitlines(),
+            summarizer,
+            model=model,
+            chunk_tokens=max_tokens,
+            workers=1,
+            kind=f"diff of `{change.path}`",
+            separator="\n",
+        )
+        change.note = summarizer(NOTES_PROMPT.format(path=change.path, diff=prompt))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(read_diff, shown))
+        shown = [change for change in shown if change.skip_reason is None]
+        if summarizer is not None:
+            large = select_diffs_to_summarize(shown, max_tokens, model)
+            list(executor.map(summarize_diff, [shown[index] for index in large]))
+
+    skipped = [change for change in changes if change.skip_reason is not None]
+    if skipped:
+        click.echo(
+            click.style("Left out", fg="yellow")
+            + " the diffs of "
+            + ", ".join(f"{change.path} ({change.skip_reason})" for change in skipped)
+            + ".",
+            err=True,
+        )
+    return format_changes(changes)
+
+
+def format_changes(changes: list[FileChange]) -> str:
+    """
+    Formats the diffs, the notes of the summarized diffs and the stats of the skipped files.
+    """
+    parts = []
+    for change in changes:
+        if change.note is not None:
+            parts.append(
+                f"Summary of the diff of {change.format_stat()}, too large to be shown:\n"
+                f"{change.note.strip()}\n"
+            )
+        elif change.skip_reason is None:
+            parts.append(change.diff)
+
+    skipped = [change for change in changes if change.skip_reason is not None]
+    if skipped:
+        parts.append(
+            "Other changed files, whose diff is not shown:\n"
+            + "".join(f"- {change.format_stat()}: {change.skip_reason}\n" for change in skipped)
+        )
+    return "\n".join(parts)
@@ -0,0 +1,301 @@
+"""
+Asyncio engine for the requests to the OpenAI API, with client-side rate limiting.
+
+The engine sends many requests at once, while keeping under the rate limits of the provider:
+a token bucket for the requests per minute, and one for the tokens per minute, per model.
+The tokens of each request are estimated with `tiktoken` before it is sent, and corrected with
+the actual usage once it completes. Responses with a 429 status are retried with exponential
+backoff, honoring the `Retry-After` header.
+
+The limits can be configured in ~/.config/lmt/config.json:
+
+    "rate_limits": {
+        "requests_per_minute": 500,
+        "tokens_per_minute": 200000,
+        "max_concurrency": 16
+    }
+
+The commands are synchronous: they use the engine through `Engine`, which runs the event loop
+in a background thread, and can be called from any thread.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections.abc import Iterable
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+from . import chunking
+from .generation import can_stream
+
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200_000
+DEFAULT_MAX_CONCURRENCY = 16
+
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Overhead of the chat format: per message, and for the priming of the reply.
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+@dataclass
+class RateLimits:
+    """
+    Client-side limits, per model.
+    """
+
+    requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE
+    tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+
+    @classmethod
+    def from_config(cls, config: dict | None) -> "RateLimits":
+        limits = (config or {}).get("rate_limits", {})
+        return cls(
+            requests_per_minute=limits.get("requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE),
+            tokens_per_minute=limits.get("tokens_per_minute", DEFAULT_TOKENS_PER_MINUTE),
+            max_concurrency=limits.get("max_concurrency", DEFAULT_MAX_CONCURRENCY),
+        )
+
+
+@dataclass
+class Request:
+    """
+    A resolved request (see `generation.resolve_request()`).
+    """
+
+    system: str
+    prompt_input: str
+    model: str
+    temperature: float = 1.0
+
+    @property
+    def messages(self) -> list[dict]:
+        """
+        The messages of the request. The models that reject the system messages (see
+        `generation.can_stream()`) get the system prompt at the start of the user message.
+        """
+        if not can_stream(self.model):
+            content = f"{self.system}\n\n{self.prompt_input}" if self.system else self.prompt_input
+            return [{"role": "user", "content": content}]
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.prompt_input},
+        ]
+
+    @property
+    def parameters(self) -> dict:
+        """
+        The parameters of the API call. The `temperature` is left out for the models that
+        reject it, i.e. the same ones as the system messages.
+        """
+        parameters = {"messages": self.messages, "model": self.model}
+        if can_stream(self.model):
+            parameters["temperature"] = self.temperature
+        return parameters
+
+    def estimate_tokens(self) -> int:
+        """
+        Estimates the number of tokens of the prompt, as counted by the provider.
+        """
+        tokens = sum(
+            TOKENS_PER_MESSAGE + chunking.count_tokens(message["content"], self.model)
+            for message in self.messages
+        )
+        return tokens + TOKENS_PER_REPLY
+
+
+class TokenBucket:
+    """
+    A bucket of `capacity` tokens, refilled continuously at `capacity` per `period` seconds.
+
+    Waiters are served in order, so that a large request is not starved by small ones.
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float) -> None:
+        """
+        Waits until `amount` tokens are available, and takes them.
+
+        An amount larger than the capacity waits for a full bucket.
+        """
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def adjust(self, amount: float) -> None:
+        """
+        Takes (or gives back, if negative) tokens after the fact, e.g. to account for the
+        actual usage of a request. The bucket can go into debt.
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class AsyncEngine:
+    """
+    Sends chat completion requests concurrently, under the rate limits.
+    """
+
+    def __init__(
+        self,
+        client,
+        limits: RateLimits | None = None,
+        max_retries: int = MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE,
+    ):
+        self.client = client
+        self.limits = limits or RateLimits()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._buckets: dict[str, tuple[TokenBucket, TokenBucket]] = {}
+        self._semaphore = asyncio.Semaphore(self.limits.max_concurrency)
+
+    def get_buckets(self, model: str) -> tuple[TokenBucket, TokenBucket]:
+        """
+        Returns the request and token buckets of a model.
+        """
+        if model not in self._buckets:
+            self._buckets[model] = (
+                TokenBucket(self.limits.requests_per_minute),
+                TokenBucket(self.limits.tokens_per_minute),
+            )
+        return self._buckets[model]
+
+    async def generate(self, request: Request) -> str:
+        """
+        Sends a request, waiting for the rate limits and retrying on 429, and returns the
+        content of the response.
+        """
+        import openai
+
+        requests_bucket, tokens_bucket = self.get_buckets(request.model)
+        estimate = request.estimate_tokens()
+
+        attempt = 0
+        while True:
+            await requests_bucket.acquire(1)
+            await tokens_bucket.acquire(estimate)
+            try:
+                async with self._semaphore:
+                    response = await self.client.chat.completions.create(**request.parameters)
+            except openai.RateLimitError as error:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self.get_backoff(attempt, error))
+                attempt += 1
+                continue
+
+            usage = getattr(response, "usage", None)
+            if usage is not None and usage.total_tokens:
+                tokens_bucket.adjust(usage.total_tokens - estimate)
+            return response.choices[0].message.content or ""
+
+    async def generate_many(self, requests: Iterable[Request]) -> list[str | BaseException]:
+        """
+        Sends all the requests at once, and returns their contents (or errors) in order.
+        """
+        return await asyncio.gather(
+            *(self.generate(request) for request in requests), return_exceptions=True
+        )
+
+    def get_backoff(self, attempt: int, error) -> float:
+        """
+        Returns the delay before retrying a rate-limited request: the `Retry-After` header if
+        the provider sent one, or an exponential backoff with jitter.
+        """
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+        delay = min(self.backoff_base * 2**attempt, BACKOFF_MAX)
+        return delay * random.uniform(0.5, 1.0)
+
+
+class Engine:
+    """
+    Synchronous facade of `AsyncEngine`, whose event loop runs in a background thread.
+
+    Thread-safe: the rate limits are shared by all the threads of the process.
+    """
+
+    def __init__(self, api_key: str, limits: RateLimits | None = None, client=None):
+        self.api_key = api_key
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="lmtoolbox-engine", daemon=True
+        )
+        self._thread.start()
+
+        async def create_engine():
+            nonlocal client
+            if client is None:
+                import openai
+
+                # The engine retries the rate-limited requests itself.
+                client = openai.AsyncOpenAI(api_key=api_key, max_retries=0)
+            return AsyncEngine(client, limits)
+
+        self.engine: AsyncEngine = self._run(create_engine()).result()
+
+    def _run(self, coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def submit(self, request: Request) -> Future:
+        """
+        Sends a request, and returns a future of its content.
+        """
+        return self._run(self.engine.generate(request))
+
+    def generate(self, request: Request) -> str:
+        return self.submit(request).result()
+
+    def generate_many(self, requests: Iterable[Request]) -> list[str | BaseException]:
+        return self._run(self.engine.generate_many(requests)).result()
+
+    def close(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+_engine: Engine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(api_key: str) -> Engine:
+    """
+    Returns the engine of the process, created on first use with the configured rate limits.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None or _engine.api_key != api_key:
+            from lmterminal.lib import load_config
+
+            if _engine is not None:
+                _engine.close()
+            _engine = Engine(api_key, RateLimits.from_config(load_config()))
+        return _engine
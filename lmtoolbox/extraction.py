@@ -0,0 +1,376 @@
+"""
+Extraction of the main content of a web page.
+
+Navigation, headers, footers, sidebars, cookie banners and the like are dropped, so that only
+the article ends up in the prompt of `summarize`.
+
+The page is parsed as a stream (it can be fed while it is downloaded) into text blocks: the
+paragraphs, headings, list items, cells, ... The blocks are then classified on their length
+and their link density, in the spirit of jusText:
+
+- The subtrees that are boilerplate by nature (`<nav>`, `<footer>`, `<script>`, ...) or by
+  their class or id (`cookie-banner`, `sidebar`, `share-buttons`, ...) are skipped.
+- The long blocks with few links are content; the blocks that are mostly links are not.
+- The short blocks (e.g. headings, short paragraphs, table rows) are content when they are
+  between content blocks, or close to one, and not on their own. A heading is content when
+  content follows it.
+- If the page has an `<article>` or a `<main>` with enough content, the blocks outside of it
+  are dropped.
+"""
+
+import bisect
+import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
+
+from . import profiling
+
+# Subtrees that never contain the main content.
+SKIPPED_TAGS = frozenset(
+    {
+        "aside",
+        "button",
+        "canvas",
+        "dialog",
+        "footer",
+        "form",
+        "head",
+        "iframe",
+        "nav",
+        "noscript",
+        "object",
+        "script",
+        "select",
+        "style",
+        "svg",
+        "template",
+        "textarea",
+    }
+)
+
+# Tags that delimit the text blocks. A table row is one block, whose cells are separated by
+# " | ".
+BLOCK_TAGS = frozenset(
+    {
+        "address",
+        "article",
+        "blockquote",
+        "body",
+        "br",
+        "dd",
+        "details",
+        "div",
+        "dl",
+        "dt",
+        "figcaption",
+        "figure",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+        "header",
+        "hr",
+        "li",
+        "main",
+        "ol",
+        "p",
+        "pre",
+        "section",
+        "summary",
+        "table",
+        "tr",
+        "ul",
+    }
+)
+
+# Their classes often describe the layout of the page (e.g. `has-sidebar`).
+ROOT_TAGS = frozenset({"html", "body", "main", "article"})
+
+CELL_TAGS = frozenset({"td", "th"})
+HEADING_TAGS = frozenset({"h1", "h2", "h3", "h4", "h5", "h6"})
+MAIN_TAGS = frozenset({"article", "main"})
+
+# Elements that cannot have content, so have no end tag.
+VOID_TAGS = frozenset(
+    {
+        "area",
+        "base",
+        "br",
+        "col",
+        "embed",
+        "hr",
+        "img",
+        "input",
+        "link",
+        "meta",
+        "param",
+        "source",
+        "track",
+        "wbr",
+    }
+)
+
+BOILERPLATE_PATTERN = re.compile(
+    r"\b(ad|ads|advert\w*|banner|breadcrumbs?|comments?|consent|cookies?\w*|footer|masthead"
+    r"|menu|modal|nav\w*|newsletter|popup|promo\w*|related|share|sharing|sidebar|social"
+    r"|sponsor\w*|subscribe|subscription|toolbar|widget)\b",
+    re.IGNORECASE,
+)
+
+WHITESPACE = re.compile(r"\s+")
+
+# Classification thresholds, in words and in the share of the text that is in links.
+LONG_BLOCK_WORDS = 25
+SHORT_BLOCK_WORDS = 7
+MAX_LINK_DENSITY = 0.33
+MAX_SHORT_LINK_DENSITY = 0.2
+# Number of blocks after or before a content block where short blocks are kept.
+NEIGHBORHOOD = 2
+# Words of content needed in an `<article>` or `<main>` to drop everything outside of it.
+MIN_MAIN_WORDS = 50
+# Below this length, the extraction has probably missed the content (e.g. a page rendered
+# by JavaScript, or an unusual layout), and the whole text of the page is used instead.
+MIN_EXTRACTED_CHARS = 200
+
+
+@dataclass
+class Block:
+    """
+    A text block: a paragraph, heading, list item, ...
+    """
+
+    text: str
+    link_chars: int
+    tag: str
+    in_main: bool
+    preformatted: bool = False
+
+    @property
+    def words(self) -> int:
+        return len(self.text.split())
+
+    @property
+    def link_density(self) -> float:
+        return self.link_chars / len(self.text) if self.text else 0.0
+
+    @property
+    def is_heading(self) -> bool:
+        return self.tag in HEADING_TAGS
+
+
+class MainContentParser(HTMLParser):
+    """
+    Streaming HTML parser that splits a page into text blocks, skipping the boilerplate
+    subtrees. Feed it with `feed()`, then call `close()` and `main_content()`.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks: list[Block] = []
+        # Open elements, with whether they are skipped, a link, in `<article>`/`<main>`.
+        self._stack: list[tuple[str, bool, bool, bool]] = []
+        self._skip_depth = 0
+        self._link_depth = 0
+        self._main_depth = 0
+        self._pre_depth = 0
+        self._parts: list[str] = []
+        self._link_chars = 0
+        self._block_tag = "body"
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            if tag in ("br", "hr") and not self._skip_depth:
+                self._flush_block(tag)
+            return
+
+        attributes = dict(attrs)
+        skipped = tag in SKIPPED_TAGS or (tag not in ROOT_TAGS and self._is_boilerplate(attributes))
+        is_link = tag == "a"
+        is_main = tag in MAIN_TAGS
+
+        if tag in BLOCK_TAGS and not self._skip_depth:
+            self._flush_block(tag)
+        elif tag in CELL_TAGS and not self._skip_depth and "".join(self._parts).strip():
+            self._parts.append(" | ")
+
+        self._stack.append((tag, skipped, is_link, is_main))
+        self._skip_depth += skipped
+        self._link_depth += is_link
+        self._main_depth += is_main
+        self._pre_depth += tag == "pre"
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS or not any(open_tag == tag for open_tag, *_ in self._stack):
+            return
+
+        # Close the elements left open inside this one (e.g. `<p>` without `</p>`).
+        while self._stack:
+            open_tag, skipped, is_link, is_main = self._stack.pop()
+            if open_tag in BLOCK_TAGS and not self._skip_depth:
+                self._flush_block(open_tag)
+            self._skip_depth -= skipped
+            self._link_depth -= is_link
+            self._main_depth -= is_main
+            self._pre_depth -= open_tag == "pre"
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self._skip_depth or not data:
+            return
+        self._parts.append(data)
+        if self._link_depth:
+            self._link_chars += len(data.strip())
+
+    def close(self):
+        super().close()
+        self._flush_block("body")
+
+    def _is_boilerplate(self, attributes: dict) -> bool:
+        if attributes.get("hidden") is not None or attributes.get("aria-hidden") == "true":
+            return True
+        if attributes.get("role") in ("navigation", "banner", "contentinfo", "complementary"):
+            return True
+        names = f"{attributes.get('id') or ''} {attributes.get('class') or ''}"
+        # `-` and `_` separate words in class names (e.g. `cookie-banner`).
+        return bool(BOILERPLATE_PATTERN.search(names.replace("-", " ").replace("_", " ")))
+
+    def _flush_block(self, next_tag: str) -> None:
+        text = "".join(self._parts)
+        preformatted = self._pre_depth > 0 or self._block_tag == "pre"
+        # The whitespace is collapsed once per block, as a run of it can span several chunks.
+        text = text.strip("\n") if preformatted else WHITESPACE.sub(" ", text).strip()
+        if text.strip():
+            self.blocks.append(
+                Block(text, self._link_chars, self._block_tag, self._main_depth > 0, preformatted)
+            )
+        self._parts = []
+        self._link_chars = 0
+        self._block_tag = self._current_block_tag(next_tag)
+
+    def _current_block_tag(self, next_tag: str) -> str:
+        if next_tag in BLOCK_TAGS and next_tag not in ("br", "hr", "body"):
+            return next_tag
+        for open_tag, *_ in reversed(self._stack):
+            if open_tag in BLOCK_TAGS:
+                return open_tag
+        return "body"
+
+    def main_content(self) -> str:
+        """
+        Returns the text of the main content, one block per paragraph.
+        """
+        return "\n\n".join(block.text for block in select_main_blocks(self.blocks))
+
+    def all_content(self) -> str:
+        """
+        Returns the text of all the blocks outside the boilerplate subtrees.
+        """
+        return "\n\n".join(block.text for block in self.blocks)
+
+
+def classify_block(block: Block) -> str:
+    """
+    Returns "good", "bad" or "short" (to decide from the context) for a block.
+    """
+    if block.preformatted:
+        return "good" if block.link_density <= MAX_LINK_DENSITY else "bad"
+    if block.link_density > MAX_LINK_DENSITY:
+        return "bad"
+    if block.words >= LONG_BLOCK_WORDS:
+        return "good"
+    if block.words < SHORT_BLOCK_WORDS and block.link_density > MAX_SHORT_LINK_DENSITY:
+        return "bad"
+    return "short"
+
+
+def select_main_blocks(blocks: list[Block]) -> list[Block]:
+    """
+    Returns the blocks of the main content, in order.
+    """
+    main_words = sum(block.words for block in blocks if block.in_main)
+    if main_words >= MIN_MAIN_WORDS:
+        blocks = [block for block in blocks if block.in_main]
+
+    classes = [classify_block(block) for block in blocks]
+    good = [index for index, cls in enumerate(classes) if cls == "good"]
+    if not good:
+        # No block is long enough to be sure: keep everything that is not mostly links.
+        return [block for block, cls in zip(blocks, classes) if cls != "bad"]
+
+    # The class of the closest block that is not short, before and after each block.
+    previous = _closest_classes(classes)
+    following = _closest_classes(classes[::-1])[::-1]
+
+    def is_content(index: int, block: Block, cls: str) -> bool:
+        if cls != "short":
+            return cls == "good"
+        return (
+            previous[index] == following[index] == "good"
+            or (block.is_heading and following[index] == "good")
+            or _is_near_good(index, good)
+        )
+
+    return [
+        block
+        for index, (block, cls) in enumerate(zip(blocks, classes))
+        if is_content(index, block, cls)
+    ]
+
+
+def _closest_classes(classes: list[str]) -> list[str | None]:
+    closest = []
+    last = None
+    for cls in classes:
+        closest.append(last)
+        if cls != "short":
+            last = cls
+    return closest
+
+
+def _is_near_good(index: int, good: list[int]) -> bool:
+    """
+    Checks whether a block is within `NEIGHBORHOOD` blocks of a content block, and not before
+    the first one.
+    """
+    if not good[0] <= index <= good[-1] + NEIGHBORHOOD:
+        return False
+    position = bisect.bisect_left(good, index)
+    return any(
+        abs(good[i] - index) <= NEIGHBORHOOD for i in (position - 1, position) if 0 <= i < len(good)
+    )
+
+
+def extract_main_content(html: str) -> str:
+    """
+    Returns the text of the main content of an HTML document.
+    """
+    parser = MainContentParser()
+    parser.feed(html)
+    parser.close()
+    return parser.main_content()
+
+
+@profiling.traced("strip_tags")
+def strip_all_tags(html: str) -> str:
+    """
+    Returns the text of an HTML document with `strip_tags`, i.e. without extraction.
+    """
+    from strip_tags.lib import strip_tags
+
+    return strip_tags(input=html, minify=True)
+
+
+def token_reduction(html: str, extracted: str, model: str) -> tuple[int, int]:
+    """
+    Returns the number of tokens of the document with `strip_tags`, and of its extracted
+    main content.
+    """
+    from . import chunking
+
+    return (
+        chunking.count_tokens(strip_all_tags(html), model),
+        chunking.count_tokens(extracted, model),
+    )
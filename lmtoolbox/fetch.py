@@ -0,0 +1,331 @@
+"""
+HTTP fetching of the web pages to summarize.
+
+The pages are fetched with a shared `requests.Session` (keep-alive, gzip and, when `brotli` is
+installed, br), streamed up to a maximum size, and abandoned as soon as the headers show that
+they are not text.
+
+The pages that have an `ETag` or a `Last-Modified` header are cached under
+~/.cache/lmtoolbox/http, and revalidated with a conditional GET: a page that has not changed
+costs a 304 response, without a body.
+"""
+
+import codecs
+import hashlib
+import json
+import os
+import re
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from functools import cache
+from pathlib import Path
+
+from . import metrics, profiling
+from .storage import atomic_write_bytes, atomic_write_text, get_cache_dir
+
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_MAX_CACHE_BYTES = 50 * 1024 * 1024
+# Connection and read timeouts, in seconds.
+DEFAULT_TIMEOUT = (5, 30)
+
+CHUNK_SIZE = 64 * 1024
+USER_AGENT = "lmtoolbox"
+
+TEXT_TYPES = ("application/xhtml+xml", "application/xml", "application/json")
+
+# The byte order marks, the UTF-32 ones first: they start with the UTF-16 ones.
+BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+# The charsets declared in a document: `<meta charset>`, `<meta http-equiv>` and the XML
+# declaration (the patterns of `requests.utils.get_encodings_from_content()`, for bytes).
+DECLARED_CHARSET = re.compile(
+    rb"""<meta[^>]*?charset=["']*([\w.:-]+)|^<\?xml[^>]*?encoding=["']*([\w.:-]+)""",
+    re.IGNORECASE,
+)
+
+
+class FetchError(Exception):
+    """
+    The page could not be fetched, or is not a text document.
+    """
+
+
+@dataclass
+class Page:
+    """
+    A fetched page.
+    """
+
+    url: str
+    text: str
+    content_type: str
+    from_cache: bool = False
+    truncated: bool = False
+
+
+@cache
+def get_session():
+    """
+    Returns the HTTP session of the process, whose connections are reused between requests.
+    """
+    import requests
+
+    session = requests.Session()
+    session.headers.update(
+        {
+            "User-Agent": USER_AGENT,
+            "Accept-Encoding": requests.utils.DEFAULT_ACCEPT_ENCODING,
+        }
+    )
+    return session
+
+
+def get_http_cache_dir() -> Path:
+    """
+    Returns the path to the directory of the HTTP cache.
+    """
+    return get_cache_dir() / "http"
+
+
+def is_text(content_type: str) -> bool:
+    """
+    Checks whether a media type (without its parameters) is a text document.
+    """
+    return (
+        content_type.startswith("text/")
+        or content_type in TEXT_TYPES
+        or content_type.endswith(("+xml", "+json"))
+    )
+
+
+def parse_content_type(header: str) -> tuple[str, str | None]:
+    """
+    Returns the media type and the charset of a `Content-Type` header.
+    """
+    media_type, *parameters = header.split(";")
+    charset = None
+    for parameter in parameters:
+        name, _, value = parameter.partition("=")
+        if name.strip().lower() == "charset":
+            charset = value.strip().strip("\"'") or None
+    return media_type.strip().lower(), charset
+
+
+def lookup_codec(charset: str | None) -> str | None:
+    """
+    Returns the name of the codec of a charset, or `None` if it is missing or unknown.
+    """
+    try:
+        return codecs.lookup(charset).name if charset else None
+    except LookupError:
+        return None
+
+
+def get_codec(charset: str | None, head: bytes = b"") -> str:
+    """
+    Returns a codec for a document, from its byte order mark, the charset of its
+    `Content-Type`, or else from its `head` (first bytes): the charset it declares, or the one
+    guessed like `response.apparent_encoding` does if it is not UTF-8. Defaults to UTF-8.
+    """
+    for bom, codec in BOMS:
+        if head.startswith(bom):
+            return codec
+
+    codec = lookup_codec(charset)
+    if codec is None and head:
+        match = DECLARED_CHARSET.search(head[:CHUNK_SIZE])
+        if match:
+            codec = lookup_codec((match[1] or match[2]).decode("ascii"))
+    if codec is None and head:
+        try:
+            # Without `final`, a character cut at the end of the head is not an error.
+            codecs.getincrementaldecoder("utf-8")().decode(head)
+        except UnicodeDecodeError:
+            from requests.compat import chardet
+
+            codec = lookup_codec(chardet.detect(head)["encoding"])
+    return codec or "utf-8"
+
+
+class HTTPCache:
+    """
+    On-disk cache of the validated responses: a JSON file of metadata and a file of the
+    (decoded) body per URL.
+    """
+
+    def __init__(self, path: Path | None = None, max_size: int = DEFAULT_MAX_CACHE_BYTES):
+        self.path = path or get_http_cache_dir()
+        self.max_size = max_size
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.path / f"{name}.json", self.path / f"{name}.body"
+
+    def get(self, url: str) -> tuple[dict, bytes] | None:
+        """
+        Returns the metadata and the body cached for `url`, if any.
+        """
+        metadata_path, body_path = self._paths(url)
+        try:
+            metadata = json.loads(metadata_path.read_text(encoding="utf-8"))
+            body = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None
+        if metadata.get("url") != url:
+            return None
+        return metadata, body
+
+    def set(self, url: str, metadata: dict, body: bytes) -> None:
+        metadata_path, body_path = self._paths(url)
+        # The body first: a metadata file is only visible with its body.
+        atomic_write_bytes(body_path, body)
+        atomic_write_text(metadata_path, json.dumps({**metadata, "url": url}))
+        self.evict(self.max_size)
+
+    def touch(self, url: str) -> None:
+        """
+        Marks an entry as recently used.
+        """
+        for path in self._paths(url):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def evict(self, max_size: int) -> int:
+        """
+        Deletes the least recently used entries until the cache fits in `max_size` bytes.
+
+        Returns the number of deleted entries.
+        """
+        entries = []
+        total = 0
+        for body_path in self.path.glob("*.body"):
+            try:
+                stat = body_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, body_path))
+            total += stat.st_size
+
+        deleted = 0
+        for _, size, body_path in sorted(entries):
+            if total <= max_size:
+                break
+            for path in (body_path.with_suffix(".json"), body_path):
+                path.unlink(missing_ok=True)
+            total -= size
+            deleted += 1
+        return deleted
+
+    def clear(self) -> int:
+        """
+        Deletes all the entries. Returns their number.
+        """
+        return self.evict(0)
+
+
+@profiling.traced("fetch")
+def fetch(
+    url: str,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    timeout: float | tuple[float, float] = DEFAULT_TIMEOUT,
+    http_cache: HTTPCache | None = None,
+    feed: Callable[[str], None] | None = None,
+) -> Page:
+    """
+    Fetches a text document, revalidating the cached copy if there is one.
+
+    The body is read up to `max_bytes` bytes (after decompression): a longer document is
+    truncated. Raises `FetchError` if the document cannot be fetched or is not text.
+
+    `feed` is called with each decoded chunk of the text as soon as it is received, e.g. to
+    parse the document while it is downloaded.
+    """
+    import requests
+
+    cached = http_cache.get(url) if http_cache is not None else None
+    headers = {}
+    if cached is not None:
+        metadata, _ = cached
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+
+    try:
+        with get_session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304 and cached is not None:
+                metadata, body = cached
+                http_cache.touch(url)
+                text = body.decode("utf-8")
+                if feed is not None:
+                    feed(text)
+                return Page(url, text, metadata.get("content_type", ""), from_cache=True)
+            response.raise_for_status()
+
+            content_type, charset = parse_content_type(response.headers.get("Content-Type", ""))
+            if content_type and not is_text(content_type):
+                raise FetchError(f"{url} is not a text document ({content_type}).")
+
+            text, truncated = _read_text(response, max_bytes, charset, feed)
+    except requests.RequestException as error:
+        raise FetchError(str(error)) from error
+
+    validators = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    cache_control = response.headers.get("Cache-Control", "").lower()
+    if (
+        http_cache is not None
+        and any(validators.values())
+        and not truncated
+        and "no-store" not in cache_control
+    ):
+        http_cache.set(
+            url,
+            {**validators, "content_type": content_type, "fetched_at": time.time()},
+            text.encode("utf-8"),
+        )
+
+    return Page(url, text, content_type, truncated=truncated)
+
+
+def _read_text(
+    response, max_bytes: int, charset: str | None, feed: Callable[[str], None] | None = None
+) -> tuple[str, bool]:
+    """
+    Reads and decodes the body of a streamed response, up to `max_bytes` bytes, with the codec
+    given by its charset and its first chunk (see `get_codec()`).
+
+    Returns the text, and whether it was truncated.
+    """
+    decoder = None
+    parts = []
+
+    def append(part: str) -> None:
+        parts.append(part)
+        if feed is not None and part:
+            feed(part)
+
+    size = 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder(get_codec(charset, chunk))(errors="replace")
+        if size + len(chunk) > max_bytes:
+            append(decoder.decode(chunk[: max_bytes - size]))
+            metrics.add_fetched_bytes(max_bytes)
+            return "".join(parts), True
+        append(decoder.decode(chunk))
+        size += len(chunk)
+    if decoder is not None:
+        append(decoder.decode(b"", final=True))
+    metrics.add_fetched_bytes(size)
+    return "".join(parts), False
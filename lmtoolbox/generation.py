@@ -0,0 +1,280 @@
+"""
+Helpers around `lmterminal.lib.prepare_and_generate_response()`.
+"""
+
+import sys
+import time
+
+from . import metrics, profiling
+
+
+def resolve_request(
+    template: str, system: str, prompt_input: str, model: str, emoji: bool
+) -> tuple[str, str, str]:
+    """
+    Resolves the system prompt, the prompt and the model of a request, like
+    `prepare_and_generate_response()` does.
+
+    The result can be passed back to `prepare_and_generate_response()` with an empty template
+    and `emoji=False`. The template is read from the compiled index (see
+    `templates.get_template()`), instead of being parsed again.
+    """
+    from lmterminal.lib import DEFAULT_MODEL, add_emoji
+
+    from .templates import get_template
+
+    system = system or ""
+
+    if template:
+        template_content = get_template(template)
+        system = (template_content.get("system") or "").rstrip() + system
+        prompt_input = (template_content.get("user") or "").rstrip() + (prompt_input or "")
+        # A model given in the options bypasses the model of the template.
+        if model == DEFAULT_MODEL:
+            model = template_content.get("model") or model
+
+    if emoji:
+        system = add_emoji(system)
+
+    return system, prompt_input, model
+
+
+def open_markdown_stream():
+    """
+    Returns a `rendering.MarkdownStream` with the code themes of the configuration.
+    """
+    from lmterminal.lib import get_markdown_code_block_theme, get_markdown_inline_code_theme
+    from rich.console import Console
+    from rich.theme import Theme
+
+    from .rendering import MarkdownStream
+
+    console = Console(theme=Theme({"markdown.code": get_markdown_inline_code_theme()}))
+    return MarkdownStream(console, code_theme=get_markdown_code_block_theme())
+
+
+@profiling.traced("rendering")
+def replay_response(content: str, no_stream: bool, raw: bool) -> None:
+    """
+    Prints a response that was not generated now (e.g. from the cache), with the same
+    formatting as a generated one.
+    """
+    if not content.endswith("\n"):
+        content += "\n"
+
+    if raw or no_stream or not sys.stdout.isatty():
+        print(content, end="")
+        return
+
+    from lmterminal.lib import get_markdown_code_block_theme, get_markdown_inline_code_theme
+    from rich.console import Console
+    from rich.markdown import Markdown
+    from rich.theme import Theme
+
+    console = Console(theme=Theme({"markdown.code": get_markdown_inline_code_theme()}))
+    console.print(Markdown(content, code_theme=get_markdown_code_block_theme()))
+
+
+def generate_response(
+    system: str,
+    prompt_input: str,
+    model: str,
+    temperature: float,
+    tokens: bool = False,
+    no_stream: bool = False,
+    raw: bool = False,
+    debug: bool = False,
+    to_pipe: bool = False,
+) -> tuple[str, float, object]:
+    """
+    Generates and prints a response to a resolved request, and records it in the metrics.
+
+    The streamed responses are rendered incrementally (see `rendering.MarkdownStream`), or
+    written as raw text with `to_pipe`. The other ones, and the requests to the models that
+    cannot stream, go through `prepare_and_generate_response()`, which also shows the token
+    count with `tokens`.
+    """
+    if can_stream(model) and (to_pipe or not (tokens or no_stream or raw)):
+        result = stream_response(
+            system, prompt_input, model, temperature, debug=debug, markdown=not to_pipe
+        )
+    else:
+        from lmterminal.lib import prepare_and_generate_response
+
+        # The template and the emojis are already applied to the system prompt. The
+        # response is printed as it arrives, so the wait and the printing are one phase.
+        with profiling.span("generation"):
+            result = prepare_and_generate_response(
+                system=system,
+                template="",
+                model=model,
+                prompt_input=prompt_input,
+                emoji=False,
+                temperature=temperature,
+                tokens=tokens,
+                no_stream=no_stream or not can_stream(model),
+                raw=raw,
+                debug=debug,
+            )
+    record_request(system, prompt_input, model, result[0])
+    return result
+
+
+def can_stream(model: str) -> bool:
+    """
+    Checks whether a model accepts streamed requests. The `o1` models reject them, as well as
+    the system messages, which `prepare_and_generate_response()` leaves out for them.
+    """
+    return "o1" not in model
+
+
+def stream_response(
+    system: str,
+    prompt_input: str,
+    model: str,
+    temperature: float,
+    debug: bool = False,
+    markdown: bool = False,
+) -> tuple[str, float, object]:
+    """
+    Streams a response to a resolved request as raw text, flushing `stdout` after each chunk.
+
+    Used when `stdout` is a pipe or a file, so that the next stage of a pipeline receives the
+    response as it is generated. With `markdown`, the response is rendered in the terminal
+    instead, one finished block at a time. Returns the same
+    `(content, response_time, response)` tuple as `prepare_and_generate_response()`, and
+    reports the rate limit and authentication errors with the same guidance.
+
+    The models that cannot stream (see `can_stream()`) are not supported.
+    """
+    import contextlib
+    import os
+
+    import click
+    import openai
+    from lmterminal.gpt_integration import (
+        chatgpt_request,
+        format_prompt,
+        handle_authentication_error,
+        handle_rate_limit_error,
+    )
+    from lmterminal.lib import display_debug_information, get_api_key
+
+    api_key = get_api_key()
+    if not api_key:
+        raise click.ClickException(
+            "You need to set your OpenAI API key. You can do so by running: lmt key set"
+        )
+
+    prompt = format_prompt(system, prompt_input)
+    if debug:
+        display_debug_information(prompt, model, temperature)
+
+    renderer = open_markdown_stream() if markdown else contextlib.nullcontext()
+    started = time.perf_counter()
+    first_chunk_at = None
+
+    def write(chunk: str) -> None:
+        nonlocal first_chunk_at
+        if chunk:
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+                profiling.record("first_token", started, first_chunk_at)
+                metrics.mark_first_token()
+            if markdown:
+                renderer.write(chunk)
+            else:
+                sys.stdout.write(chunk)
+                sys.stdout.flush()
+
+    try:
+        with renderer:
+            content, response_time, response = chatgpt_request(
+                api_key=api_key,
+                prompt=prompt,
+                model=model,
+                stream=True,
+                temperature=temperature,
+                update_markdown_stream=write,
+            )
+            if not content.endswith("\n"):
+                content += "\n"
+                write("\n")
+        profiling.record("streaming", first_chunk_at or started)
+    except openai.RateLimitError as error:
+        click.echo(f"{click.style('Error:', fg='red')} {error}", err=True)
+        handle_rate_limit_error()
+        sys.exit(1)
+    except openai.AuthenticationError:
+        handle_authentication_error()
+        sys.stderr.write(
+            f"\nYou can set your API key by running: {click.style('lmt key set', fg='blue')}\n"
+        )
+        sys.exit(1)
+    except openai.OpenAIError as error:
+        raise click.ClickException(str(error)) from error
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`): silence the final flush of `stdout`.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+        sys.exit(1)
+    return content, response_time, response
+
+
+def complete(
+    template: str, prompt_input: str, model: str, temperature: float, emoji: bool = False
+) -> str:
+    """
+    Generates a response without printing it, and returns its content.
+
+    Used for intermediate steps (e.g. summarizing the chunks of a long document), whose
+    output is not shown to the user. Safe to call from several threads.
+    """
+    system, prompt_input, model = resolve_request(template, "", prompt_input, model, emoji)
+    return generate_content(system, prompt_input, model, temperature)
+
+
+@profiling.traced("request")
+def generate_content(system: str, prompt_input: str, model: str, temperature: float) -> str:
+    """
+    Generates a response to a resolved request (see `resolve_request()`) without printing it.
+
+    The request goes through the engine of the process, so that the concurrent requests stay
+    under the rate limits.
+    """
+    import click
+    import openai
+    from lmterminal.lib import get_api_key
+
+    from .engine import Request, get_engine
+
+    api_key = get_api_key()
+    if not api_key:
+        raise click.ClickException(
+            "You need to set your OpenAI API key. You can do so by running: lmt key set"
+        )
+
+    try:
+        content = get_engine(api_key).generate(Request(system, prompt_input, model, temperature))
+    except openai.OpenAIError as error:
+        raise click.ClickException(str(error)) from error
+    record_request(system, prompt_input, model, content)
+    return content
+
+
+def record_request(system: str, prompt_input: str, model: str, content: str) -> None:
+    """
+    Records the tokens of a request to a resolved prompt in the metrics of the command.
+    """
+    if not metrics.is_recording():
+        return
+
+    from . import chunking
+    from .engine import Request
+
+    metrics.add_request(
+        model,
+        input_tokens=Request(system, prompt_input, model).estimate_tokens(),
+        output_tokens=chunking.count_tokens(content or "", model),
+    )
@@ -0,0 +1,144 @@
+"""
+Incremental reading of the inputs (stdin and files) under a token budget.
+
+The inputs are read block by block, memory-mapping regular files, and their tokens are counted
+as they are read. Reading stops as soon as the budget is reached, so that large inputs are never
+fully loaded in memory: the caller gets the text within the budget, and the unread blocks for
+chunked processing.
+"""
+
+import codecs
+import io
+import itertools
+import mmap
+import os
+import stat
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+from typing import TextIO
+
+from . import chunking
+
+BLOCK_SIZE = 64 * 1024
+
+
+@dataclass
+class BoundedInput:
+    """
+    The beginning of an input, up to a token budget.
+    """
+
+    text: str
+    tokens: int | None
+    exhausted: bool
+    remaining: Iterator[str] = field(default_factory=lambda: iter(()))
+
+    def iter_blocks(self) -> Iterator[str]:
+        """
+        Yields the text read so far, then the rest of the input.
+        """
+        yield self.text
+        yield from self.remaining
+
+    def read_all(self) -> str:
+        """
+        Returns the whole input, reading the rest of it.
+        """
+        return "".join(self.iter_blocks())
+
+
+def iter_text_blocks(file: TextIO, block_size: int = BLOCK_SIZE) -> Iterator[str]:
+    """
+    Yields the content of a text file (or `stdin`) in blocks of about `block_size` characters.
+
+    Regular files are memory-mapped and decoded incrementally, from the current position.
+    """
+    try:
+        fd = file.fileno()
+        file_stat = os.fstat(fd)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fd = None
+
+    if fd is None or not stat.S_ISREG(file_stat.st_mode) or file_stat.st_size == 0:
+        while block := file.read(block_size):
+            yield block
+        return
+
+    decoder = codecs.getincrementaldecoder(getattr(file, "encoding", None) or "utf-8")(
+        errors=getattr(file, "errors", None) or "strict"
+    )
+    try:
+        # Accounts for what the file object has already buffered.
+        start = file.tell()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        start = os.lseek(fd, 0, os.SEEK_CUR)
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+        for offset in range(start, len(mapped), block_size):
+            block = decoder.decode(mapped[offset : offset + block_size])
+            if block:
+                yield block
+        if tail := decoder.decode(b"", final=True):
+            yield tail
+    try:
+        file.seek(0, os.SEEK_END)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        os.lseek(fd, 0, os.SEEK_END)
+
+
+def read_bounded(blocks: Iterable[str], max_tokens: int | None, model: str) -> BoundedInput:
+    """
+    Reads blocks of text until `max_tokens` tokens are read. `None` means no budget.
+    """
+    blocks = iter(blocks)
+    if max_tokens is None:
+        return BoundedInput("".join(blocks), tokens=None, exhausted=True)
+
+    parts = []
+    tokens = 0
+    for block in blocks:
+        block_tokens = chunking.count_tokens(block, model)
+        if tokens + block_tokens > max_tokens:
+            head, tail = chunking.split_at_token(block, max_tokens - tokens, model)
+            parts.append(head)
+            tokens += chunking.count_tokens(head, model)
+            return BoundedInput(
+                "".join(parts),
+                tokens=tokens,
+                exhausted=False,
+                remaining=itertools.chain([tail], blocks),
+            )
+        parts.append(block)
+        tokens += block_tokens
+
+    return BoundedInput("".join(parts), tokens=tokens, exhausted=True)
+
+
+def truncate_blocks(
+    blocks: Iterable[str], max_tokens: int | None, model: str, on_truncate: Callable[[int], None]
+) -> Iterator[str]:
+    """
+    Yields blocks of text up to `max_tokens` tokens, without holding them in memory.
+
+    Calls `on_truncate` with the number of tokens read if the input is longer.
+    """
+    if max_tokens is None:
+        yield from blocks
+        return
+
+    tokens = 0
+    for block in blocks:
+        block_tokens = chunking.count_tokens(block, model)
+        if tokens + block_tokens > max_tokens:
+            head, _ = chunking.split_at_token(block, max_tokens - tokens, model)
+            yield head
+            on_truncate(tokens + chunking.count_tokens(head, model))
+            return
+        tokens += block_tokens
+        yield block
+
+
+def read_file(file: TextIO, max_tokens: int | None, model: str) -> BoundedInput:
+    """
+    Reads a text file (or `stdin`) incrementally, up to `max_tokens` tokens.
+    """
+    return read_bounded(iter_text_blocks(file), max_tokens, model)
@@ -0,0 +1,416 @@
+"""
+Usage metrics of the commands, for `lmtoolbox stats`.
+
+Each invocation of a command that sends requests (or fetches pages) appends a record to
+~/.cache/lmtoolbox/metrics.jsonl, one JSON object per line:
+
+    {"ts": 1760778000.1, "command": "summarize", "model": "gpt-4o", "requests": 3,
+     "input_tokens": 5210, "output_tokens": 612, "ttft_ms": 812.4, "latency_ms": 4210.7,
+     "bytes_fetched": 48213}
+
+The keys without a value are left out. The input tokens are counted locally, like the
+preflight check of the context window, and the cached responses count as cache hits, not as
+tokens.
+
+The log is rotated when it exceeds `max_bytes`, and `backups` rotated files are kept
+(metrics.jsonl.1 is the most recent). It can be disabled, in ~/.config/lmt/config.json:
+
+    "metrics": {"enabled": true, "max_bytes": 10000000, "backups": 3}
+
+The statistics are computed in one pass over the log, without loading it in memory: the
+percentiles come from a log-scale histogram with a relative error of at most 1%.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .storage import get_cache_dir
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 3
+
+# Relative accuracy of the percentiles.
+RELATIVE_ACCURACY = 0.01
+PERCENTILES = (50, 95, 99)
+
+
+def get_metrics_path() -> Path:
+    return get_cache_dir() / "metrics.jsonl"
+
+
+@dataclass
+class Invocation:
+    """
+    The metrics of the running command, filled by the requests and fetches it makes.
+    """
+
+    command: str
+    started: float = field(default_factory=time.perf_counter)
+    timestamp: float = field(default_factory=time.time)
+    model: str | None = None
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_hits: int = 0
+    first_token_at: float | None = None
+    bytes_fetched: int = 0
+
+    def to_record(self, error: bool = False) -> dict:
+        record = {
+            "ts": round(self.timestamp, 3),
+            "command": self.command,
+            "model": self.model,
+            "requests": self.requests,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_hits": self.cache_hits,
+            "ttft_ms": (
+                round((self.first_token_at - self.started) * 1000, 1)
+                if self.first_token_at is not None
+                else None
+            ),
+            "latency_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "bytes_fetched": self.bytes_fetched,
+            "error": error,
+        }
+        return {key: value for key, value in record.items() if value}
+
+
+_invocation: Invocation | None = None
+_lock = threading.Lock()
+
+
+def start(command: str) -> None:
+    """
+    Starts recording the metrics of a command.
+    """
+    global _invocation
+    _invocation = Invocation(command)
+
+
+def is_recording() -> bool:
+    return _invocation is not None
+
+
+def add_request(
+    model: str, input_tokens: int = 0, output_tokens: int = 0, cached: bool = False
+) -> None:
+    """
+    Records a request of the running command, or a response replayed from the cache.
+    """
+    if _invocation is None:
+        return
+    with _lock:
+        _invocation.model = _invocation.model or model
+        if cached:
+            _invocation.cache_hits += 1
+        else:
+            _invocation.requests += 1
+            _invocation.input_tokens += input_tokens
+            _invocation.output_tokens += output_tokens
+
+
+def mark_first_token() -> None:
+    """
+    Records the arrival of the first token of the first streamed response.
+    """
+    if _invocation is not None and _invocation.first_token_at is None:
+        _invocation.first_token_at = time.perf_counter()
+
+
+def add_fetched_bytes(size: int) -> None:
+    if _invocation is None:
+        return
+    with _lock:
+        _invocation.bytes_fetched += size
+
+
+def finish(error: bool = False) -> None:
+    """
+    Appends the record of the running command to the log, if it sent requests or fetched
+    pages. Never raises: the metrics must not break a command.
+    """
+    global _invocation
+    invocation, _invocation = _invocation, None
+    if invocation is None or not (
+        invocation.requests or invocation.cache_hits or invocation.bytes_fetched
+    ):
+        return
+
+    try:
+        from lmterminal.lib import load_config
+
+        config = load_config().get("metrics", {})
+        if not config.get("enabled", True):
+            return
+        append_record(
+            get_metrics_path(),
+            invocation.to_record(error),
+            max_bytes=config.get("max_bytes", DEFAULT_MAX_BYTES),
+            backups=config.get("backups", DEFAULT_BACKUPS),
+        )
+    except (OSError, ValueError):
+        pass
+
+
+def append_record(
+    path: Path, record: dict, max_bytes: int = DEFAULT_MAX_BYTES, backups: int = DEFAULT_BACKUPS
+) -> None:
+    """
+    Appends a record to the log, rotating it first if it has reached `max_bytes`.
+
+    The record is written with a single `write()` in append mode, so that the records of
+    concurrent commands are not interleaved.
+    """
+    line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+    try:
+        if path.stat().st_size + len(line) > max_bytes:
+            rotate(path, backups)
+    except FileNotFoundError:
+        pass
+
+    file_descriptor = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(file_descriptor, line)
+    finally:
+        os.close(file_descriptor)
+
+
+def rotate(path: Path, backups: int) -> None:
+    """
+    Renames metrics.jsonl to metrics.jsonl.1, metrics.jsonl.1 to metrics.jsonl.2, ... and
+    deletes the oldest file.
+    """
+    if backups < 1:
+        path.unlink(missing_ok=True)
+        return
+    for index in range(backups - 1, 0, -1):
+        source = path.with_name(f"{path.name}.{index}")
+        if source.exists():
+            os.replace(source, path.with_name(f"{path.name}.{index + 1}"))
+    # Another command may have rotated the log in the meantime.
+    try:
+        os.replace(path, path.with_name(f"{path.name}.1"))
+    except FileNotFoundError:
+        pass
+
+
+def get_log_paths(path: Path) -> list[Path]:
+    """
+    Returns the rotated files and the log, from the oldest to the most recent.
+    """
+    rotated = [
+        candidate
+        for candidate in path.parent.glob(f"{path.name}.*")
+        if candidate.suffix[1:].isdigit()
+    ]
+    rotated.sort(key=lambda candidate: int(candidate.suffix[1:]), reverse=True)
+    return [*rotated, path] if path.exists() else rotated
+
+
+def iter_records(paths: Iterable[Path], since: float | None = None) -> Iterator[dict]:
+    """
+    Reads the records of the log files, line by line. Invalid lines are skipped.
+    """
+    for path in paths:
+        try:
+            file = path.open(encoding="utf-8", errors="replace")
+        except FileNotFoundError:
+            continue
+        with file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if not isinstance(record, dict) or "command" not in record:
+                    continue
+                if since is not None and record.get("ts", 0) < since:
+                    continue
+                yield record
+
+
+class QuantileSketch:
+    """
+    Approximate quantiles of positive values in constant memory, with a relative error of at
+    most `RELATIVE_ACCURACY` (the values are counted in log-scale buckets, as in DDSketch).
+    """
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets: dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        if value <= 0:
+            self.zeros += 1
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def percentile(self, percent: float) -> float | None:
+        """
+        Returns the nearest-rank percentile, like `batch.percentile()`, or `None` if no value
+        was added.
+        """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(percent / 100 * self.count))
+        if rank <= self.zeros:
+            return 0.0
+        seen = self.zeros
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # The middle of the bucket, in relative terms.
+                return 2 * self.gamma**index / (self.gamma + 1)
+        return None
+
+
+@dataclass
+class Aggregate:
+    """
+    The statistics of the invocations of a command with a model.
+    """
+
+    invocations: int = 0
+    errors: int = 0
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_hits: int = 0
+    bytes_fetched: int = 0
+    latency: QuantileSketch = field(default_factory=QuantileSketch)
+    ttft: QuantileSketch = field(default_factory=QuantileSketch)
+
+    def add(self, record: dict) -> None:
+        self.invocations += 1
+        self.errors += bool(record.get("error"))
+        self.requests += record.get("requests", 0)
+        self.input_tokens += record.get("input_tokens", 0)
+        self.output_tokens += record.get("output_tokens", 0)
+        self.cache_hits += record.get("cache_hits", 0)
+        self.bytes_fetched += record.get("bytes_fetched", 0)
+        if "latency_ms" in record:
+            self.latency.add(record["latency_ms"])
+        if "ttft_ms" in record:
+            self.ttft.add(record["ttft_ms"])
+
+    @property
+    def output_tokens_per_second(self) -> float | None:
+        if not self.latency.sum:
+            return None
+        return self.output_tokens / (self.latency.sum / 1000)
+
+
+def aggregate(records: Iterable[dict]) -> dict[tuple[str, str], Aggregate]:
+    """
+    Aggregates the records by command and model, in one pass.
+    """
+    aggregates: dict[tuple[str, str], Aggregate] = {}
+    for record in records:
+        key = (record["command"], record.get("model") or "-")
+        aggregates.setdefault(key, Aggregate()).add(record)
+    return dict(sorted(aggregates.items()))
+
+
+def format_table(aggregates: dict[tuple[str, str], Aggregate]) -> str:
+    header = (
+        f"{'command':<14} {'model':<18} {'runs':>5} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8}"
+        f" {'p99 ms':>8} {'ttft p50':>8} {'in tokens':>10} {'out tokens':>10} {'tokens/s':>8}"
+        f" {'cached':>6} {'fetched':>9}"
+    )
+    lines = [header]
+
+    def ms(value: float | None) -> str:
+        return f"{value:8.0f}" if value is not None else f"{'-':>8}"
+
+    for (command, model), stats in aggregates.items():
+        rate = stats.output_tokens_per_second
+        lines.append(
+            f"{command:<14} {model:<18} {stats.invocations:>5} {stats.errors:>6}"
+            + "".join(f" {ms(stats.latency.percentile(percent))}" for percent in PERCENTILES)
+            + f" {ms(stats.ttft.percentile(50))} {stats.input_tokens:>10}"
+            f" {stats.output_tokens:>10} {f'{rate:.0f}' if rate is not None else '-':>8}"
+            f" {stats.cache_hits:>6} {format_bytes(stats.bytes_fetched):>9}"
+        )
+    return "\n".join(lines)
+
+
+def format_bytes(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+COUNTERS = (
+    ("invocations", "invocations", "Invocations of the command."),
+    ("errors", "errors", "Invocations that failed."),
+    ("requests", "requests", "Requests sent to the model."),
+    ("input_tokens", "input_tokens", "Tokens of the prompts."),
+    ("output_tokens", "output_tokens", "Tokens of the responses."),
+    ("cache_hits", "cache_hits", "Responses replayed from the cache."),
+    ("bytes_fetched", "fetched_bytes", "Bytes of the fetched pages."),
+)
+SUMMARIES = (
+    ("latency", "latency_seconds", "Duration of the invocations."),
+    ("ttft", "time_to_first_token_seconds", "Time to the first token of the response."),
+)
+
+
+def format_openmetrics(aggregates: dict[tuple[str, str], Aggregate]) -> str:
+    """
+    Formats the statistics in the OpenMetrics text format.
+    """
+    lines = []
+
+    def labels(command: str, model: str, **extra: str) -> str:
+        pairs = {"command": command, "model": model, **extra}
+        return ",".join(f'{key}="{escape_label(value)}"' for key, value in pairs.items())
+
+    for attribute, name, help_text in COUNTERS:
+        lines.append(f"# TYPE lmtoolbox_{name} counter")
+        if name.endswith("_bytes"):
+            lines.append(f"# UNIT lmtoolbox_{name} bytes")
+        lines.append(f"# HELP lmtoolbox_{name} {help_text}")
+        for (command, model), stats in aggregates.items():
+            value = getattr(stats, attribute)
+            lines.append(f"lmtoolbox_{name}_total{{{labels(command, model)}}} {value}")
+
+    for attribute, name, help_text in SUMMARIES:
+        lines.append(f"# TYPE lmtoolbox_{name} summary")
+        lines.append(f"# UNIT lmtoolbox_{name} seconds")
+        lines.append(f"# HELP lmtoolbox_{name} {help_text}")
+        for (command, model), stats in aggregates.items():
+            sketch: QuantileSketch = getattr(stats, attribute)
+            if not sketch.count:
+                continue
+            for percent in PERCENTILES:
+                quantile = labels(command, model, quantile=str(percent / 100))
+                lines.append(
+                    f"lmtoolbox_{name}{{{quantile}}} {sketch.percentile(percent) / 1000:.6g}"
+                )
+            lines.append(
+                f"lmtoolbox_{name}_sum{{{labels(command, model)}}} {sketch.sum / 1000:.6g}"
+            )
+            lines.append(f"lmtoolbox_{name}_count{{{labels(command, model)}}} {sketch.count}")
+
+    lines.append("# EOF")
+    return "\n".join(lines)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,296 @@
+"""
+Per-phase profiling of the commands, with `--profile` or `LMTOOLBOX_PROFILE=1`.
+
+The phases of a command (the imports, the installation of the templates, the fetch of a
+page, the extraction of its content, the retrieval of a transcript, the token counting, the
+wait for the first token, the rendering, ...) are wrapped in spans:
+
+    with profiling.span("fetch"):
+        ...
+
+or with the `@profiling.traced("fetch")` decorator.
+
+When profiling is off, `span()` returns a shared no-op context manager, and nothing is
+recorded. When it is on, a breakdown of the time spent in each phase is printed on `stderr`
+at the end of the command. The time of a span excludes the time of the spans nested in it
+(e.g. the imports done while fetching a page), so that the phases add up to the duration of
+the command.
+
+With `--profile-output` (or `LMTOOLBOX_PROFILE_OUTPUT`), the profile is also written to a
+file: a Chrome trace (`.json`, to open in `chrome://tracing` or https://ui.perfetto.dev),
+or a `cProfile` dump for `pstats` (any other extension).
+"""
+
+import builtins
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+PROFILE_ENV = "LMTOOLBOX_PROFILE"
+PROFILE_OUTPUT_ENV = "LMTOOLBOX_PROFILE_OUTPUT"
+# The values of `PROFILE_ENV` that Click parses as false (see `click.BOOL`).
+FALSE_VALUES = ("", "0", "false", "f", "no", "n", "off")
+
+# Before the command starts: the import of `lmtoolbox` and the parsing of the arguments.
+IMPORTED_AT = time.perf_counter()
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+@dataclass
+class Span:
+    """
+    A timed phase, with `time.perf_counter()` timestamps. `self_time` excludes the spans
+    nested in it, in the same thread.
+    """
+
+    name: str
+    start: float
+    end: float
+    thread_id: int
+    self_time: float = 0.0
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class Profiler:
+    """
+    Records the spans of a command, and the `cProfile` profile if one is written.
+    """
+
+    def __init__(self):
+        self.started = IMPORTED_AT
+        self.spans: list[Span] = []
+        self.output: Path | None = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cprofile = None
+        self._original_import = None
+        self.add("startup", IMPORTED_AT, time.perf_counter())
+
+    def add(self, name: str, start: float, end: float, self_time: float | None = None) -> None:
+        span = Span(name, start, end, threading.get_ident())
+        span.self_time = span.duration if self_time is None else self_time
+        with self._lock:
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        # The time of the nested spans, for each open span of this thread.
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            nested = stack.pop()
+            if stack:
+                stack[-1] += end - start
+            self.add(name, start, end, self_time=end - start - nested)
+
+    def record(self, name: str, start: float, end: float) -> None:
+        thread_id = threading.get_ident()
+        with self._lock:
+            nested = sum(
+                span.self_time
+                for span in self.spans
+                if span.thread_id == thread_id and span.start >= start and span.end <= end
+            )
+        self_time = end - start - nested
+        # The spans nested in this one have already been counted in the enclosing span.
+        stack = self._local.__dict__.get("stack")
+        if stack:
+            stack[-1] += self_time
+        self.add(name, start, end, self_time=self_time)
+
+    def set_output(self, path: Path) -> None:
+        self.output = path
+        if path.suffix != ".json" and self._cprofile is None:
+            import cProfile
+
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def trace_imports(self) -> None:
+        """
+        Records the imports of the modules not imported yet, as "imports" spans. The imports
+        done by an import are part of its span.
+        """
+        original_import = builtins.__import__
+        self._original_import = original_import
+        local = threading.local()
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if (level == 0 and name in sys.modules) or getattr(local, "importing", False):
+                return original_import(name, globals, locals, fromlist, level)
+            local.importing = True
+            try:
+                with self.span("imports"):
+                    return original_import(name, globals, locals, fromlist, level)
+            finally:
+                local.importing = False
+
+        builtins.__import__ = timed_import
+
+    def stop(self) -> None:
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+        if self._cprofile is not None:
+            self._cprofile.disable()
+
+    def breakdown(self) -> list[tuple[str, int, float, float]]:
+        """
+        Returns the name, the number of spans, the total time and the self time of each
+        phase, by decreasing self time. The time outside of the spans of the main thread is
+        counted as "other".
+        """
+        phases = {}
+        main_thread = threading.main_thread().ident
+        covered = 0.0
+        for span in self.spans:
+            count, total, self_time = phases.get(span.name, (0, 0.0, 0.0))
+            phases[span.name] = (count + 1, total + span.duration, self_time + span.self_time)
+            if span.thread_id == main_thread:
+                covered += span.self_time
+        other = time.perf_counter() - self.started - covered
+        if other > 0:
+            phases["other"] = (1, other, other)
+        return sorted(
+            ((name, *values) for name, values in phases.items()),
+            key=lambda phase: phase[3],
+            reverse=True,
+        )
+
+    def format(self) -> str:
+        elapsed = (time.perf_counter() - self.started) * 1000
+        lines = [
+            f"Profile: {elapsed:.1f} ms",
+            f"  {'phase':<20} {'calls':>6} {'total ms':>10} {'self ms':>10} {'self %':>7}",
+        ]
+        for name, count, total, self_time in self.breakdown():
+            lines.append(
+                f"  {name:<20} {count:>6} {total * 1000:>10.1f} {self_time * 1000:>10.1f}"
+                f" {self_time * 1000 / elapsed if elapsed else 0:>7.1%}"
+            )
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> dict:
+        """
+        Returns the spans in the Chrome trace event format.
+        """
+        pid = os.getpid()
+        return {
+            "displayTimeUnit": "ms",
+            "traceEvents": [
+                {
+                    "name": span.name,
+                    "cat": "lmtoolbox",
+                    "ph": "X",
+                    "ts": (span.start - self.started) * 1_000_000,
+                    "dur": span.duration * 1_000_000,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                }
+                for span in self.spans
+            ],
+        }
+
+    def write(self, path: Path) -> None:
+        if path.suffix == ".json":
+            path.write_text(json.dumps(self.chrome_trace()), encoding="utf-8")
+        elif self._cprofile is not None:
+            self._cprofile.dump_stats(str(path))
+
+
+_profiler: Profiler | None = None
+
+
+def span(name: str):
+    """
+    Returns a context manager that times a phase, or a no-op one when profiling is off.
+    """
+    if _profiler is None:
+        return _NULL_SPAN
+    return _profiler.span(name)
+
+
+def traced(name: str):
+    """
+    Decorator that times each call of a function as a span.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            with _profiler.span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record(name: str, start: float, end: float | None = None) -> None:
+    """
+    Records a phase that does not fit in a `with` block, e.g. the wait for the first token of
+    a response, from `start` to `end` (now by default), both from `time.perf_counter()`.
+    """
+    if _profiler is not None:
+        _profiler.record(name, start, time.perf_counter() if end is None else end)
+
+
+def is_enabled() -> bool:
+    return _profiler is not None
+
+
+def is_requested() -> bool:
+    """
+    Checks whether the environment or the command line asks for a profile, before the
+    arguments are parsed.
+    """
+    return bool(
+        os.environ.get(PROFILE_ENV, "").strip().lower() not in FALSE_VALUES
+        or os.environ.get(PROFILE_OUTPUT_ENV)
+        or any(arg == "--profile" or arg.startswith("--profile-output") for arg in sys.argv[1:])
+    )
+
+
+def enable() -> Profiler:
+    """
+    Starts profiling, if it has not started yet, and returns the profiler.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+        _profiler.trace_imports()
+    return _profiler
+
+
+def finish() -> None:
+    """
+    Stops profiling, prints the breakdown on `stderr`, and writes the profile file.
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is None:
+        return
+
+    import click
+
+    profiler.stop()
+    click.echo(profiler.format(), err=True)
+    if profiler.output is not None:
+        profiler.write(profiler.output)
+        click.echo(f"Profile written to {profiler.output}", err=True)
@@ -0,0 +1,226 @@
+"""
+Incremental rendering of a streamed Markdown response in the terminal.
+
+Re-rendering the whole response on each chunk, as `lmterminal` does, makes the cost of a
+response grow with the square of its length, and long responses visibly lag behind the
+model. `MarkdownStream` splits the response in top-level blocks as it arrives: a finished
+block (a paragraph followed by a blank line, a closed code fence, a heading, a list item
+followed by the next one) is rendered and printed once, and the live display below it only
+re-renders the open block at the end.
+
+The blocks are rendered separately, and joined with the blank lines that `rich` puts between
+them, so that the output is the same as rendering the whole response at once. The only
+difference is the alignment of the numbers of an ordered list whose items are printed before
+it reaches 10 items.
+"""
+
+import re
+import time
+
+from rich.console import Console, ConsoleOptions, RenderResult
+from rich.live import Live
+from rich.markdown import Markdown
+from rich.segment import Segment, Segments
+
+# Frequency of the updates of the live display.
+REFRESH_PER_SECOND = 25
+
+FENCE = re.compile(r"^( {0,3})(`{3,}|~{3,})")
+HEADING = re.compile(r"^#{1,6}(?:[ \t]|$)")
+THEMATIC_BREAK = re.compile(r"^(?:(?:\*[ \t]*){3,}|(?:-[ \t]*){3,}|(?:_[ \t]*){3,})$")
+LIST_ITEM = re.compile(r"^(?:([-+*])|\d{1,9}([.)]))(?:[ \t]|$)")
+
+
+def get_list_marker(line: str) -> str | None:
+    """
+    Returns the bullet of a list item at the start of a line, or the delimiter of the number
+    of an ordered one (`.` or `)`). Items with the same marker belong to the same list.
+    """
+    if THEMATIC_BREAK.match(line):
+        return None
+    match = LIST_ITEM.match(line)
+    if match is None:
+        return None
+    return match.group(1) or match.group(2)
+
+
+class MarkdownStream:
+    """
+    Renders a Markdown response as it is written, committing the finished blocks once.
+
+    Use it as a context manager, and call `write()` with each chunk of the response. The live
+    display is refreshed at most `refresh_per_second` times per second, or only by `refresh()`
+    if it is `None`.
+    """
+
+    def __init__(
+        self,
+        console: Console | None = None,
+        code_theme: str = "monokai",
+        refresh_per_second: float | None = REFRESH_PER_SECOND,
+    ):
+        self.console = console or Console()
+        self.code_theme = code_theme
+        self.refresh_interval = 1 / refresh_per_second if refresh_per_second else None
+        # The complete lines of the open block, and its last, incomplete line.
+        self._lines: list[str] = []
+        self._partial = ""
+        # The fence character and length of the open code block, if any, and whether it is
+        # at the top level.
+        self._fence: tuple[str, int, bool] | None = None
+        self._after_blank = False
+        # The marker of the list item that starts the open block, and whether the block
+        # continues the list of the previous one.
+        self._list_marker: str | None = None
+        self._continues_list = False
+        self._committed_blocks = 0
+        self._previous_new_line = False
+        self._last_refresh = 0.0
+        self._live = Live(
+            _OpenBlock(self), console=self.console, auto_refresh=False, transient=False
+        )
+
+    def __enter__(self):
+        self._live.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, chunk: str) -> None:
+        if "\n" in chunk:
+            *lines, self._partial = (self._partial + chunk).split("\n")
+            for line in lines:
+                self._add_line(line)
+        else:
+            self._partial += chunk
+
+        if self.refresh_interval is not None:
+            now = time.monotonic()
+            if now - self._last_refresh >= self.refresh_interval:
+                self._last_refresh = now
+                self.refresh()
+
+    def refresh(self) -> None:
+        """
+        Renders the open block in the live display.
+        """
+        self._live.refresh()
+
+    def close(self) -> None:
+        """
+        Renders the last block, and stops the live display.
+        """
+        self._live.stop()
+
+    @property
+    def committed_blocks(self) -> int:
+        return self._committed_blocks
+
+    def get_open_block(self) -> str:
+        return "\n".join([*self._lines, self._partial])
+
+    def _add_line(self, line: str) -> None:
+        if self._fence is not None:
+            self._lines.append(line)
+            character, length, top_level = self._fence
+            stripped = line.strip()
+            if len(stripped) >= length and stripped == character * len(stripped):
+                self._fence = None
+                if top_level:
+                    self._commit()
+            return
+
+        if not line.strip():
+            # The blank lines between two blocks are rendered by `rich`.
+            if self._lines:
+                self._lines.append(line)
+                self._after_blank = True
+            return
+
+        marker = None if line[0] in " \t" else get_list_marker(line)
+        if self._lines and self._starts_block(line, marker):
+            continues_list = marker is not None and marker == self._list_marker
+            self._commit()
+            self._continues_list = continues_list
+        if not self._lines:
+            self._list_marker = marker
+        self._lines.append(line)
+        self._after_blank = False
+
+        fence = FENCE.match(line)
+        if fence:
+            self._fence = (fence.group(2)[0], len(fence.group(2)), not fence.group(1))
+        elif HEADING.match(line):
+            self._commit()
+
+    def _starts_block(self, line: str, marker: str | None) -> bool:
+        """
+        Checks whether a line starts a new top-level block, so that the open block is
+        finished. In doubt, the line is part of the open block: rendering two blocks
+        together is always right.
+        """
+        if line[0] in " \t":
+            return False
+        if self._after_blank or HEADING.match(line) or FENCE.match(line):
+            return True
+        # The next item of a tight list.
+        return marker is not None and marker == self._list_marker
+
+    def _commit(self) -> None:
+        text = "\n".join(self._lines)
+        continues_list = self._continues_list
+        self._lines = []
+        self._after_blank = False
+        self._list_marker = None
+        self._continues_list = False
+
+        markdown = self._make_markdown(text)
+        segments = self.render(markdown, self.console.options, continues_list)
+        self._committed_blocks += 1
+        # A thematic break is not followed by a blank line.
+        self._previous_new_line = _ends_with_new_line(markdown)
+        self.console.print(Segments(segments), end="")
+
+    def render(
+        self, markdown: Markdown, options: ConsoleOptions, continues_list: bool = False
+    ) -> list[Segment]:
+        """
+        Renders a block, with the blank line that separates it from the previous block.
+        """
+        segments = list(self.console.render(markdown, options))
+        if not self._committed_blocks or not segments:
+            return segments
+        # The lists, quotes and tables start with a blank line of their own.
+        starts_with_new_line = segments[0].text == "\n"
+        if continues_list:
+            return segments[1:] if starts_with_new_line else segments
+        if self._previous_new_line and not starts_with_new_line:
+            return [Segment.line(), *segments]
+        return segments
+
+    def _make_markdown(self, text: str) -> Markdown:
+        return Markdown(text, code_theme=self.code_theme)
+
+
+class _OpenBlock:
+    """
+    The live display of the open block of a `MarkdownStream`.
+    """
+
+    def __init__(self, stream: MarkdownStream):
+        self.stream = stream
+
+    def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
+        text = self.stream.get_open_block()
+        if text.strip():
+            stream = self.stream
+            markdown = stream._make_markdown(text)
+            yield Segments(stream.render(markdown, options, stream._continues_list))
+
+
+def _ends_with_new_line(markdown: Markdown) -> bool:
+    if not markdown.parsed:
+        return False
+    element = markdown.elements.get(markdown.parsed[-1].type)
+    return getattr(element, "new_line", True)
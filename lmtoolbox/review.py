@@ -0,0 +1,413 @@
+"""
+Reviews of several files, of directories, or of the changes of a git revision range.
+
+The files to review are collected from the arguments of `codereview`, and split into
+token-budgeted parts if they are too large. The parts are reviewed concurrently, and each
+review is yielded as soon as it completes.
+
+Incremental reviews split the files into blocks (the functions and classes of Python files,
+hunks of lines otherwise), and keep the review of each block in an index keyed on its content.
+A new run only reviews the blocks that changed, and reuses the reviews of the others.
+"""
+
+import ast
+import fnmatch
+import os
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import chunking, diffs
+
+DEFAULT_CHUNK_TOKENS = 6000
+DEFAULT_WORKERS = 4
+
+# Bytes read to tell a binary file from a text file.
+BINARY_SNIFF_BYTES = 8192
+
+# Incremental reviews: the size of the blocks of the files that are not Python (and of the
+# classes whose methods are reviewed on their own), and the context around a block.
+HUNK_LINES = 50
+MAX_HUNK_LINES = 200
+CONTEXT_LINES = 5
+
+FILE_PROMPT = "File `{path}`:\n\n{text}"
+PART_PROMPT = "Part {index} of {count} of the file `{path}`:\n\n{text}"
+DIFF_PROMPT = "Changes to `{path}` in {revisions}:\n\n{text}"
+BLOCK_PROMPT = (
+    "Part of the file `{path}`: {name}, lines {start} to {end}. Review this part only: the"
+    " lines around it are only given for context."
+)
+OVERVIEW_PROMPT = (
+    "The following are the reviews of the files of a change, made separately. Write an"
+    " overview of them: the most important issues first, with the files they are in, then the"
+    " remarks that come up in several files. Leave out the minor details.\n\n{reviews}"
+)
+
+
+class ReviewError(Exception):
+    """
+    An argument of `codereview` is not a file, a directory or a revision range.
+    """
+
+
+@dataclass
+class Target:
+    """
+    A file to review, or its changes in a revision range.
+    """
+
+    path: str
+    text: str
+    revisions: str | None = None
+
+
+@dataclass
+class ReviewItem:
+    """
+    A piece of code sent in a single request: a file, a part of a file, or a diff.
+    """
+
+    name: str
+    prompt: str
+
+
+def is_revision_range(argument: str) -> bool:
+    return ".." in argument and not os.path.exists(argument)
+
+
+def matches(path: str, patterns: Sequence[str]) -> bool:
+    """
+    Checks whether a path matches one of the glob patterns, on its name or on the whole path.
+    """
+    if not patterns:
+        return True
+    name = os.path.basename(path)
+    return any(
+        fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern) for pattern in patterns
+    )
+
+
+def read_text_file(path: Path) -> str | None:
+    """
+    Returns the content of a text file, or `None` if it is binary.
+    """
+    data = path.read_bytes()
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        return None
+    return data.decode("utf-8", errors="replace")
+
+
+def iter_directory(directory: Path, patterns: Sequence[str]) -> Iterator[Path]:
+    """
+    Yields the files of a directory that match the patterns, in order, skipping the hidden
+    directories, the vendored code and the lock files.
+    """
+    for root, dirnames, filenames in os.walk(directory):
+        dirnames[:] = sorted(
+            name
+            for name in dirnames
+            if not name.startswith(".") and name not in diffs.GENERATED_DIRECTORIES
+        )
+        for name in sorted(filenames):
+            path = Path(root, name)
+            relative_path = path.relative_to(directory).as_posix()
+            if matches(relative_path, patterns) and not diffs.get_path_skip_reason(name):
+                yield path
+
+
+def collect_targets(arguments: Iterable[str], patterns: Sequence[str] = ()) -> list[Target]:
+    """
+    Collects the files to review from paths, directories (filtered by the glob patterns) and
+    revision ranges (e.g. `main..HEAD`, whose changed files are reviewed on their diff).
+
+    Raises `ReviewError` for an argument that is none of these.
+    """
+    targets = []
+    for argument in arguments:
+        path = Path(argument)
+        if path.is_file():
+            text = read_text_file(path)
+            if text is None:
+                raise ReviewError(f"{argument} is a binary file.")
+            targets.append(Target(argument, text))
+        elif path.is_dir():
+            for file_path in iter_directory(path, patterns):
+                text = read_text_file(file_path)
+                if text is not None and text.strip():
+                    targets.append(Target(str(file_path), text))
+        elif is_revision_range(argument):
+            targets.extend(collect_revision_range(argument, patterns))
+        else:
+            raise ReviewError(f"{argument} is not a file, a directory or a revision range.")
+    return targets
+
+
+def collect_revision_range(revisions: str, patterns: Sequence[str] = ()) -> list[Target]:
+    """
+    Returns the diffs of the files changed in a revision range, except the binary, lock and
+    generated files.
+    """
+    targets = []
+    for change in diffs.get_changes([revisions]):
+        if diffs.get_skip_reason(change) or not matches(change.path, patterns):
+            continue
+        diff = diffs.get_file_diff(change, [revisions])
+        if diff and not diffs.is_generated(diff):
+            targets.append(Target(change.path, diff, revisions))
+    return targets
+
+
+def split_target(target: Target, max_tokens: int, model: str) -> list[ReviewItem]:
+    """
+    Splits a file into parts of at most `max_tokens` tokens, on line boundaries.
+    """
+    if target.revisions is not None:
+        name = f"{target.path} ({target.revisions})"
+        template = DIFF_PROMPT
+    else:
+        name = target.path
+        template = FILE_PROMPT
+
+    if chunking.count_tokens(target.text, model) <= max_tokens:
+        return [
+            ReviewItem(
+                name,
+                template.format(path=target.path, text=target.text, revisions=target.revisions),
+            )
+        ]
+
+    parts = list(
+        chunking.split_into_chunks(target.text.splitlines(), max_tokens, model, separator="\n")
+    )
+    return [
+        ReviewItem(
+            f"{name} (part {index}/{len(parts)})",
+            PART_PROMPT.format(index=index, count=len(parts), path=name, text=part),
+        )
+        for index, part in enumerate(parts, start=1)
+    ]
+
+
+def review_items(
+    items: Sequence[ReviewItem], reviewer: Callable[[str], str], workers: int
+) -> Iterator[tuple[ReviewItem, str | None, Exception | None]]:
+    """
+    Reviews the items concurrently with at most `workers` requests in flight, and yields
+    `(item, review, error)` as soon as each one completes.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(reviewer, item.prompt): item for item in items}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as error:  # noqa: BLE001 - reported with the other reviews
+                yield futures[future], None, error
+
+
+@dataclass
+class Block:
+    """
+    A block of a file that is reviewed on its own: a function, a class, the code between
+    them, or a hunk of lines. `start` and `end` are line numbers, from 1, inclusive.
+    """
+
+    name: str
+    start: int
+    end: int
+    text: str
+
+
+@dataclass
+class BlockReview:
+    """
+    The review of a block, from the index or from a new request.
+    """
+
+    block: Block
+    review: str | None = None
+    error: Exception | None = None
+    cached: bool = False
+
+
+def split_blocks(path: str, text: str) -> list[Block]:
+    """
+    Splits a file into blocks: the functions and classes of a Python file (the methods of the
+    large classes on their own), or hunks of about `HUNK_LINES` lines cut at top-level
+    boundaries for the other files.
+    """
+    lines = text.splitlines(keepends=True)
+    ranges = None
+    if path.endswith(".py"):
+        try:
+            tree = ast.parse(text)
+        except (SyntaxError, ValueError):
+            pass
+        else:
+            ranges = _python_ranges(tree.body, 1, len(lines), prefix="")
+    if ranges is None:
+        ranges = _hunk_ranges(lines)
+
+    blocks = []
+    for name, start, end in ranges:
+        block_text = "".join(lines[start - 1 : end])
+        if block_text.strip():
+            blocks.append(Block(name, start, end, block_text))
+    return blocks
+
+
+def _python_ranges(
+    nodes: list[ast.stmt], start: int, end: int, prefix: str
+) -> list[tuple[str, int, int]]:
+    """
+    Partitions the lines `start` to `end` into the functions and classes among `nodes`, and
+    the code between them.
+    """
+    other_code = f"class {prefix[:-1]}" if prefix else "module code"
+    ranges = []
+    position = start
+    for node in nodes:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        node_start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+        if node_start > position:
+            ranges.append((other_code, position, node_start - 1))
+
+        name = f"{prefix}{node.name}"
+        if isinstance(node, ast.ClassDef) and node.end_lineno - node_start >= HUNK_LINES:
+            ranges.extend(_python_ranges(node.body, node_start, node.end_lineno, f"{name}."))
+        elif isinstance(node, ast.ClassDef):
+            ranges.append((f"class {name}", node_start, node.end_lineno))
+        else:
+            ranges.append((f"def {name}", node_start, node.end_lineno))
+        position = node.end_lineno + 1
+
+    if position <= end:
+        ranges.append((other_code, position, end))
+    return ranges
+
+
+def _hunk_ranges(lines: list[str]) -> list[tuple[str, int, int]]:
+    """
+    Partitions the lines into hunks of at least `HUNK_LINES` lines, cut before a line that
+    starts a top-level paragraph, so that an edit only changes the boundaries around it.
+    """
+    ranges = []
+    start = 0
+    for index, line in enumerate(lines):
+        size = index - start
+        is_boundary = (
+            index > 0 and not lines[index - 1].strip() and line.strip() and not line[0].isspace()
+        )
+        if (is_boundary and size >= HUNK_LINES) or size >= MAX_HUNK_LINES:
+            ranges.append(("hunk", start + 1, index))
+            start = index
+    if start < len(lines):
+        ranges.append(("hunk", start + 1, len(lines)))
+    return ranges
+
+
+def get_block_prompt(path: str, block: Block, lines: list[str]) -> str:
+    """
+    Returns the prompt to review a block, with `CONTEXT_LINES` lines around it.
+    """
+    before = "".join(lines[max(0, block.start - 1 - CONTEXT_LINES) : block.start - 1])
+    after = "".join(lines[block.end : block.end + CONTEXT_LINES])
+    parts = [BLOCK_PROMPT.format(path=path, name=block.name, start=block.start, end=block.end)]
+    if before.strip():
+        parts.append(f"Before, for context:\n```\n{before}```")
+    parts.append(f"To review:\n```\n{block.text}```")
+    if after.strip():
+        parts.append(f"After, for context:\n```\n{after}```")
+    return "\n\n".join(parts)
+
+
+class ReviewIndex:
+    """
+    The reviews of the blocks already reviewed, keyed on their path and content, and on the
+    request options. They are kept in the response cache.
+    """
+
+    def __init__(
+        self,
+        response_cache,
+        system: str,
+        model: str,
+        temperature: float,
+        emoji: bool,
+        refresh: bool = False,
+    ):
+        self.response_cache = response_cache
+        self.system = system
+        self.model = model
+        self.temperature = temperature
+        self.emoji = emoji
+        self.refresh = refresh
+
+    def make_key(self, path: str, block: Block) -> str:
+        from .cache import make_key
+
+        return make_key(
+            "codereview",
+            self.system,
+            self.model,
+            self.temperature,
+            self.emoji,
+            f"block of {path}\n{block.text}",
+        )
+
+    def get(self, path: str, block: Block) -> str | None:
+        if self.refresh:
+            return None
+        return self.response_cache.get(self.make_key(path, block), "codereview")
+
+    def set(self, path: str, block: Block, review: str) -> None:
+        self.response_cache.set(self.make_key(path, block), "codereview", self.model, review)
+
+
+def review_changed_blocks(
+    targets: Sequence[Target],
+    reviewer: Callable[[str], str],
+    index: ReviewIndex | None,
+    workers: int,
+) -> list[tuple[Target, list[BlockReview]]]:
+    """
+    Reviews the blocks of the files that are not in the index, concurrently, and returns the
+    reviews of all the blocks of each file.
+    """
+    files = []
+    pending = {}
+    for target in targets:
+        lines = target.text.splitlines(keepends=True)
+        reviews = []
+        for block in split_blocks(target.path, target.text):
+            cached = index.get(target.path, block) if index is not None else None
+            block_review = BlockReview(block, cached, cached=cached is not None)
+            reviews.append(block_review)
+            if cached is None:
+                item = ReviewItem(
+                    f"{target.path}: {block.name}", get_block_prompt(target.path, block, lines)
+                )
+                pending[id(item)] = (item, target.path, block_review)
+        files.append((target, reviews))
+
+    items = [item for item, _, _ in pending.values()]
+    for item, content, error in review_items(items, reviewer, workers):
+        _, path, block_review = pending[id(item)]
+        block_review.review, block_review.error = content, error
+        if content is not None and index is not None:
+            index.set(path, block_review.block, content)
+    return files
+
+
+def format_block_reviews(reviews: Sequence[BlockReview]) -> str:
+    """
+    Merges the reviews of the blocks of a file, in order.
+    """
+    return "\n\n".join(
+        f"### {block_review.block.name} (lines {block_review.block.start}-"
+        f"{block_review.block.end})\n\n{block_review.review.strip()}"
+        for block_review in reviews
+        if block_review.review is not None
+    )
@@ -0,0 +1,203 @@
+"""
+Sources of `summarize`: YouTube videos, web pages and files.
+
+A YouTube playlist or channel, or a file that lists YouTube videos, stands for all its videos.
+"""
+
+import time
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import profiling, video_summarization
+
+VIDEO = "video transcript"
+PLAYLIST = "playlist"
+WEB_PAGE = "web page"
+FILE = "document"
+
+# Media types of the web pages whose main content is extracted. An empty one is assumed to
+# be HTML.
+HTML_TYPES = ("text/html", "application/xhtml+xml", "")
+
+
+class SourceError(Exception):
+    """
+    A source could not be loaded.
+    """
+
+
+@dataclass
+class Source:
+    """
+    The text of a source, and how to summarize it.
+    """
+
+    argument: str
+    kind: str
+    text: str
+    template: str = "summarize"
+    # Natural boundaries to split the text on, if it must be chunked.
+    segments: list[str] | None = None
+    separator: str = "\n\n"
+    truncated: bool = False
+    # The HTML of a web page whose main content was extracted.
+    html: str | None = None
+
+
+def classify(argument: str) -> str | None:
+    """
+    Returns the kind of source an argument is, or `None` if it is not one (i.e. it is text).
+    """
+    import validators
+
+    if video_summarization.is_youtube_video(argument):
+        return VIDEO
+    if video_summarization.is_youtube_playlist(argument):
+        return PLAYLIST
+    if validators.url(argument):
+        return WEB_PAGE
+    if Path(argument).is_file():
+        return FILE
+    return None
+
+
+def is_collection(argument: str) -> bool:
+    """
+    Checks whether an argument stands for several videos: a playlist, a channel, or a file
+    that lists videos.
+    """
+    kind = classify(argument)
+    return kind == PLAYLIST or (kind == FILE and _read_video_list(argument) is not None)
+
+
+def expand_sources(arguments: Iterable[str]) -> tuple[list[str], list[tuple[str, SourceError]]]:
+    """
+    Replaces the playlists, channels and lists of videos with their videos.
+
+    Returns the sources, and the arguments that could not be expanded with their errors.
+    """
+    from . import fetch
+
+    expanded = []
+    errors = []
+    for argument in arguments:
+        kind = classify(argument)
+        if kind == PLAYLIST:
+            try:
+                videos = video_summarization.get_playlist_videos(argument)
+            except fetch.FetchError as error:
+                errors.append((argument, SourceError(str(error))))
+                continue
+            if not videos:
+                errors.append((argument, SourceError(f"No videos found in {argument}.")))
+            expanded.extend(videos)
+        elif kind == FILE and (videos := _read_video_list(argument)) is not None:
+            expanded.extend(videos)
+        else:
+            expanded.append(argument)
+    return expanded, errors
+
+
+def _read_video_list(path: str) -> list[str] | None:
+    try:
+        return video_summarization.read_video_list(path)
+    except OSError:
+        return None
+
+
+def load_source(argument: str, max_page_size: int | None = None, extract: bool = True) -> Source:
+    """
+    Fetches or reads the text of a source. Raises `SourceError` if it cannot be loaded.
+
+    The main content of the HTML pages is extracted (see `extraction`), unless `extract` is
+    false.
+    """
+    kind = classify(argument)
+
+    if kind == VIDEO:
+        try:
+            transcript = video_summarization.get_transcript(argument)
+        except video_summarization.TranscriptUnavailable as error:
+            raise SourceError(f"{argument} has no transcript.") from error
+        return Source(
+            argument,
+            kind,
+            video_summarization.format_transcript(transcript),
+            template="video_summarization",
+            segments=[line["text"] for line in transcript],
+            separator=" ",
+        )
+
+    if kind == WEB_PAGE:
+        from . import extraction, fetch
+
+        # Parsed while it is downloaded.
+        parser = extraction.MainContentParser() if extract else None
+        try:
+            page = fetch.fetch(
+                argument,
+                max_bytes=max_page_size or fetch.DEFAULT_MAX_BYTES,
+                http_cache=fetch.HTTPCache(),
+                feed=parser.feed if parser is not None else None,
+            )
+        except fetch.FetchError as error:
+            raise SourceError(str(error)) from error
+
+        if parser is not None and page.content_type in HTML_TYPES:
+            with profiling.span("extraction"):
+                parser.close()
+                text = parser.main_content()
+            if len(text) >= extraction.MIN_EXTRACTED_CHARS:
+                return Source(argument, kind, text, truncated=page.truncated, html=page.text)
+        return Source(
+            argument, kind, extraction.strip_all_tags(page.text), truncated=page.truncated
+        )
+
+    if kind == FILE:
+        try:
+            text = Path(argument).read_text(encoding="utf-8", errors="replace")
+        except OSError as error:
+            raise SourceError(f"{argument}: {error.strerror}") from error
+        return Source(argument, kind, text)
+
+    if kind == PLAYLIST:
+        raise SourceError(f"{argument} is a playlist: expand it with `expand_sources()`.")
+
+    raise SourceError(f"{argument} is not a YouTube video, a URL or a file.")
+
+
+def map_in_order(
+    function: Callable[[str], str],
+    arguments: Iterable[str],
+    workers: int,
+    on_done: Callable[[str, Exception | None, float], None] | None = None,
+) -> Iterator[tuple[str, str | None, Exception | None]]:
+    """
+    Runs `function` on the arguments concurrently, and yields `(argument, result, error)` in
+    the order of the arguments, each as soon as it and the previous ones are done.
+
+    `on_done` is called from the worker threads with each argument, its error (or `None`) and
+    its duration in seconds, as soon as it is done.
+    """
+
+    def run(argument: str) -> str:
+        start = time.perf_counter()
+        try:
+            result = function(argument)
+        except Exception as error:
+            if on_done is not None:
+                on_done(argument, error, time.perf_counter() - start)
+            raise
+        if on_done is not None:
+            on_done(argument, None, time.perf_counter() - start)
+        return result
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [(argument, executor.submit(run, argument)) for argument in arguments]
+        for argument, future in futures:
+            try:
+                yield argument, future.result(), None
+            except Exception as error:  # noqa: BLE001 - reported with the other results
+                yield argument, None, error
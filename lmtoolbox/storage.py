@@ -0,0 +1,56 @@
+import os
+import tempfile
+from pathlib import Path
+
+
+def get_config_dir() -> Path:
+    """
+    Returns the path to the configuration directory shared with `lmt`.
+    """
+    return Path.home() / ".config/lmt"
+
+
+def get_cache_dir() -> Path:
+    """
+    Returns the path to the cache directory of LMtoolbox, creating it if needed.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    cache_dir = Path(cache_home) / "lmtoolbox"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """
+    Writes `data` to `path` atomically.
+
+    The data is written to a temporary file in the same directory, which then replaces
+    the destination. Readers never see a partially written file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        mode = path.stat().st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+
+    file_descriptor, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(data)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """
+    Writes `text` to `path` atomically, encoded as UTF-8.
+    """
+    atomic_write_bytes(path, text.encode("utf-8"))
@@ -0,0 +1,103 @@
+"""
+Map-reduce summarization of inputs that do not fit in a single request.
+
+The input is split on natural boundaries into token-budgeted chunks, which are summarized
+concurrently (map). The summaries are then combined (reduce): if they still exceed the budget,
+they are summarized again, level by level, until they fit in a single request.
+
+The input can be a stream: the chunks are summarized as they are read, and only a bounded
+number of them is held in memory.
+"""
+
+import itertools
+from collections import deque
+from collections.abc import Callable, Iterable
+
+import click
+
+from . import chunking
+
+DEFAULT_CHUNK_TOKENS = 12_000
+DEFAULT_WORKERS = 4
+
+MAP_PROMPT = "This is part {index} of a longer {kind}.\n\n{chunk}"
+REDUCE_PROMPT = (
+    "The following are the summaries of the consecutive parts of a longer {kind}."
+    " Treat them as a single {kind}.\n\n{summaries}"
+)
+DIGEST_PROMPT = (
+    "The following are the summaries of several sources. Combine them into a single digest,"
+    " grouping what they have in common and pointing out where they differ.\n\n{summaries}"
+)
+
+Summarizer = Callable[[str], str]
+
+
+def summarize_chunks(
+    chunks: Iterable[str], summarizer: Summarizer, workers: int, kind: str = "document"
+) -> list[str]:
+    """
+    Summarizes the chunks concurrently with at most `workers` requests in flight.
+
+    At most `2 * workers` chunks are read ahead, so a streamed input is never fully loaded.
+    The summaries are returned in the order of the chunks.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    summaries = []
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index, chunk in enumerate(chunks, start=1):
+            if len(pending) >= 2 * workers:
+                summaries.append(pending.popleft().result())
+            prompt = MAP_PROMPT.format(index=index, kind=kind, chunk=chunk)
+            pending.append(executor.submit(summarizer, prompt))
+        summaries.extend(future.result() for future in pending)
+    return summaries
+
+
+def map_reduce(
+    segments: Iterable[str],
+    summarizer: Summarizer,
+    model: str,
+    chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+    workers: int = DEFAULT_WORKERS,
+    kind: str = "document",
+    separator: str = "\n\n",
+) -> str:
+    """
+    Reduces `segments` to a prompt that fits in `chunk_tokens`, summarizing it as needed.
+
+    Returns the prompt for the final summary: the input itself if it fits, or the combined
+    summaries of its chunks otherwise.
+    """
+    # Leave room for the instructions added to each chunk.
+    overhead = chunking.count_tokens(MAP_PROMPT.format(index=0, kind=kind, chunk=""), model)
+    budget = max(1, chunk_tokens - overhead)
+
+    chunks = chunking.split_into_chunks(segments, budget, model, separator)
+    first_chunks = list(itertools.islice(chunks, 2))
+    if len(first_chunks) <= 1:
+        return "".join(first_chunks)
+    chunks = itertools.chain(first_chunks, chunks)
+
+    level = 1
+    while True:
+        summaries = summarize_chunks(chunks, summarizer, workers, kind)
+        click.echo(
+            click.style("Summarized", fg="yellow")
+            + f" {len(summaries)} chunks of up to {chunk_tokens} tokens"
+            + f" with {min(workers, len(summaries))} workers (level {level}).",
+            err=True,
+        )
+        combined = REDUCE_PROMPT.format(kind=kind, summaries="\n\n".join(summaries))
+
+        if chunking.count_tokens(combined, model) <= chunk_tokens:
+            return combined
+
+        next_chunks = list(chunking.split_into_chunks(summaries, budget, model))
+        if len(next_chunks) >= len(summaries):
+            # The summaries do not get any shorter: let the final request deal with them.
+            return combined
+        chunks = next_chunks
+        level += 1
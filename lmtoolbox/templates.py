@@ -0,0 +1,377 @@
+import copy
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import click
+
+from . import profiling
+from .storage import atomic_write_bytes, atomic_write_text, get_cache_dir, get_config_dir
+
+BUNDLED_TEMPLATES_DIR = Path(__file__).parent / "tools/templates"
+
+MANIFEST_VERSION = 1
+INDEX_VERSION = 1
+
+# The last index loaded by this process, with the `stat()` of its file.
+_loaded_index: tuple[tuple, dict] | None = None
+
+
+def get_templates_dir() -> Path:
+    """
+    Returns the path to the directory where the templates are installed.
+    """
+    return get_config_dir() / "templates"
+
+
+def get_manifest_path() -> Path:
+    """
+    Returns the path to the manifest of the installed templates.
+    """
+    return get_config_dir() / "lmtoolbox-manifest.json"
+
+
+def ensure_templates() -> None:
+    """
+    Installs the templates in ~/.config/lmt/templates, unless they are up to date.
+
+    In the common case, this costs two `stat()` calls and the read of the small manifest file.
+    """
+    with profiling.span("install_templates"):
+        if is_manifest_stale(load_manifest()):
+            sync_templates()
+
+
+def sync_templates(force: bool = False) -> list[str]:
+    """
+    Installs the bundled templates that are missing or outdated, and updates the manifest.
+
+    A template that has been modified locally is never overwritten, unless `force` is set.
+
+    Returns the names of the installed or updated templates.
+    """
+    dest_dir = get_templates_dir()
+    dest_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = load_manifest()
+    previously_installed = manifest.get("templates", {})
+    installed = {}
+    changed = []
+
+    sources = sorted(BUNDLED_TEMPLATES_DIR.glob("*.yaml"))
+    for source in sources:
+        template_name = source.stem
+        content = source.read_bytes()
+        digest = hashlib.sha256(content).hexdigest()
+
+        destination = dest_dir / source.name
+        try:
+            current_digest = hashlib.sha256(destination.read_bytes()).hexdigest()
+        except FileNotFoundError:
+            current_digest = None
+
+        previous_digest = previously_installed.get(template_name)
+        is_missing = current_digest is None
+        # Only upgrade a template if it is still the version we installed.
+        is_outdated = current_digest != digest and (force or current_digest == previous_digest)
+
+        if is_missing or is_outdated:
+            atomic_write_bytes(destination, content)
+            changed.append(template_name)
+            action = "Installed" if is_missing else "Updated"
+            click.echo(click.style(f"{action} `{template_name}` template.", fg="green"), err=True)
+            installed[template_name] = digest
+        elif current_digest == digest:
+            installed[template_name] = digest
+        elif previous_digest is not None:
+            # Modified locally: remember what we installed to detect future upgrades.
+            installed[template_name] = previous_digest
+
+    register_templates(dest_dir, [source.stem for source in sources])
+
+    save_manifest(
+        {
+            "manifest_version": MANIFEST_VERSION,
+            "key": get_manifest_key(),
+            "templates": installed,
+        }
+    )
+
+    return changed
+
+
+def register_templates(dest_dir: Path, template_names: list[str]) -> None:
+    """
+    Records the installed templates in the `tools` key of ~/.config/lmt/config.json.
+
+    The config file is only rewritten if its content changes.
+    """
+    config_file = get_config_dir() / "config.json"
+
+    try:
+        config = json.loads(config_file.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        config = {}
+    except json.JSONDecodeError:
+        click.echo(click.style("Installing templates...", fg="yellow"), err=True)
+        config = {}
+
+    tools = config.setdefault("tools", {})
+    updated = False
+    for template_name in template_names:
+        template_path = str(dest_dir / f"{template_name}.yaml")
+        if tools.get(template_name) != template_path:
+            tools[template_name] = template_path
+            updated = True
+
+    if updated or not config_file.exists():
+        atomic_write_text(config_file, json.dumps(config, indent=4))
+
+
+def get_manifest_key() -> str:
+    """
+    Returns the key identifying the current state of the bundled and installed templates.
+
+    Reinstalling or upgrading the package recreates the bundled templates directory, or
+    rewrites the bundled templates in place (editable installs, some installers, file-level
+    deploys): both the directory and the files are part of the key. Adding or removing an
+    installed template touches the destination directory. Any of them changes the key, which
+    triggers a new sync.
+
+    This costs a `stat()` per bundled template. Reading the version of the package instead
+    would import `importlib.metadata`, which adds about 10 ms to each command.
+    """
+    bundled = BUNDLED_TEMPLATES_DIR.stat()
+    files = hashlib.sha256()
+    with os.scandir(BUNDLED_TEMPLATES_DIR) as entries:
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            stat = entry.stat()
+            files.update(f"{entry.name}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+    try:
+        installed = get_templates_dir().stat().st_mtime_ns
+    except FileNotFoundError:
+        installed = None
+    return f"{bundled.st_ino}:{bundled.st_mtime_ns}:{files.hexdigest()[:16]}:{installed}"
+
+
+def is_manifest_stale(manifest: dict) -> bool:
+    """
+    Checks whether the manifest is missing or does not match the current templates.
+    """
+    return (
+        manifest.get("manifest_version") != MANIFEST_VERSION
+        or manifest.get("key") != get_manifest_key()
+    )
+
+
+def load_manifest() -> dict:
+    """
+    Loads the manifest of the installed templates. Returns an empty dict if there is none.
+    """
+    try:
+        manifest = json.loads(get_manifest_path().read_bytes())
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def save_manifest(manifest: dict) -> None:
+    """
+    Saves the manifest of the installed templates atomically.
+    """
+    atomic_write_text(get_manifest_path(), json.dumps(manifest, indent=4))
+
+
+def get_index_path() -> Path:
+    """
+    Returns the path to the compiled index of the installed templates.
+    """
+    return get_cache_dir() / "templates-index.json"
+
+
+def get_template(name: str) -> dict:
+    """
+    Returns the content of an installed template, from the compiled index.
+
+    Loading a template costs a `stat()` of its file and the read of the index, without the
+    YAML parser. The template is only parsed again, and the index updated, when its file
+    has changed (a different mtime or size).
+    """
+    path = get_templates_dir() / f"{name}.yaml"
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        raise click.ClickException(f"The template '{name}' does not exist.") from None
+
+    index = load_index()
+    entry = index["templates"].get(name)
+    if not is_entry_current(entry, stat):
+        entry = index["templates"][name] = compile_template(path, stat)
+        save_index(index)
+    # The callers may update the content in place.
+    return copy.deepcopy(entry["content"])
+
+
+def list_templates() -> dict[str, dict]:
+    """
+    Returns the content of the installed templates, by name.
+
+    While no template is added or removed, this is one read of the index. Otherwise, the new
+    and modified templates are parsed again. A template modified in place may be listed with
+    its previous content, but `get_template()` always returns the current one.
+    """
+    return {name: copy.deepcopy(entry["content"]) for name, entry in load_entries().items()}
+
+
+def get_descriptions() -> dict[str, str]:
+    """
+    Returns the `description` of the installed templates that have one, by name. This costs
+    the same as `list_templates()`, without copying the templates.
+    """
+    descriptions = {}
+    for name, entry in load_entries().items():
+        description = get_description(entry["content"])
+        if description is not None:
+            descriptions[name] = description
+    return descriptions
+
+
+def get_description(content: dict) -> str | None:
+    description = content.get("description")
+    if isinstance(description, str) and description.strip():
+        return description
+    return None
+
+
+def load_entries() -> dict[str, dict]:
+    """
+    Returns the entries of the index for all the installed templates, after updating the
+    index if a template has been added or removed. The entries must not be modified.
+    """
+    templates_dir = get_templates_dir()
+    index = load_index()
+    try:
+        directory_mtime = templates_dir.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {}
+
+    if index["directory_mtime_ns"] != directory_mtime:
+        compiled = {}
+        for path in sorted(templates_dir.glob("*.yaml")):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entry = index["templates"].get(path.stem)
+            compiled[path.stem] = (
+                entry if is_entry_current(entry, stat) else compile_template(path, stat)
+            )
+        index["templates"] = compiled
+        index["directory_mtime_ns"] = directory_mtime
+        save_index(index)
+
+    return index["templates"]
+
+
+def list_template_names() -> list[str]:
+    """
+    Returns the names of the installed templates, without their content.
+
+    This is a `stat()` of the templates directory and the read of the index, or a listing of
+    the directory when a template has been added or removed since the index was updated. No
+    template is parsed.
+    """
+    templates_dir = get_templates_dir()
+    index = load_index()
+    try:
+        directory_mtime = templates_dir.stat().st_mtime_ns
+    except FileNotFoundError:
+        return []
+
+    if index["directory_mtime_ns"] == directory_mtime:
+        return sorted(index["templates"])
+    return sorted(path.stem for path in templates_dir.glob("*.yaml"))
+
+
+def template_exists(name: str) -> bool:
+    """
+    Checks whether a template is installed, with a `stat()` of its file.
+    """
+    # The name comes from the command line: it must not point outside of the directory.
+    if not name or name.startswith(".") or Path(name).name != name:
+        return False
+    return (get_templates_dir() / f"{name}.yaml").is_file()
+
+
+def is_entry_current(entry: dict | None, stat) -> bool:
+    return (
+        entry is not None
+        and entry.get("mtime_ns") == stat.st_mtime_ns
+        and entry.get("size") == stat.st_size
+    )
+
+
+def compile_template(path: Path, stat) -> dict:
+    """
+    Parses a template file into an entry of the index.
+    """
+    import yaml
+
+    try:
+        content = yaml.safe_load(path.read_text(encoding="utf-8"))
+    except yaml.YAMLError as error:
+        raise click.ClickException(f"The template '{path.stem}' is invalid: {error}") from error
+    if not isinstance(content, dict):
+        content = {}
+    # The index is JSON: dates and other YAML types are kept as strings.
+    content = json.loads(json.dumps(content, default=str))
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "content": content}
+
+
+def load_index() -> dict:
+    """
+    Loads the compiled index of the templates, or returns an empty one if it is missing,
+    outdated, or built for another templates directory.
+    """
+    global _loaded_index
+    path = get_index_path()
+    directory = str(get_templates_dir())
+    try:
+        stat = path.stat()
+        key = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if _loaded_index is not None and _loaded_index[0] == key:
+            index = _loaded_index[1]
+        else:
+            index = json.loads(path.read_bytes())
+            _loaded_index = (key, index)
+    except (OSError, ValueError):
+        index = None
+
+    if (
+        not isinstance(index, dict)
+        or index.get("index_version") != INDEX_VERSION
+        or index.get("directory") != directory
+    ):
+        return {
+            "index_version": INDEX_VERSION,
+            "directory": directory,
+            "directory_mtime_ns": None,
+            "templates": {},
+        }
+    return index
+
+
+def save_index(index: dict) -> None:
+    """
+    Saves the compiled index atomically. The index is only a cache: failing to save it is
+    not an error.
+    """
+    global _loaded_index
+    path = get_index_path()
+    try:
+        atomic_write_text(path, json.dumps(index, separators=(",", ":")))
+        stat = path.stat()
+    except OSError:
+        return
+    _loaded_index = ((path, stat.st_ino, stat.st_mtime_ns, stat.st_size), index)
@@ -2,11 +2,8 @@ import re
 import sys
 
 import click
-from youtube_transcript_api import (
-    NoTranscriptFound,
-    TranscriptsDisabled,
-    YouTubeTranscriptApi,
-)
+
+from . import profiling
 
 YOUTUBE_URL_PATTERN = re.compile(
     r"(http(s)?:\/\/)?"  # Optional protocol
@@ -16,6 +13,28 @@ YOUTUBE_URL_PATTERN = re.compile(
     r"(?P<video_id>[a-zA-Z0-9_-]{11})"  # Video ID capture group
 )
 
+YOUTUBE_PLAYLIST_PATTERN = re.compile(
+    r"(http(s)?:\/\/)?"  # Optional protocol
+    r"(www\.|m\.)?"  # Optional subdomain
+    r"youtube\.com\/playlist\?(.*&)?list=(?P<playlist_id>[a-zA-Z0-9_-]+)"
+)
+
+YOUTUBE_CHANNEL_PATTERN = re.compile(
+    r"(http(s)?:\/\/)?"  # Optional protocol
+    r"(www\.|m\.)?"  # Optional subdomain
+    r"youtube\.com\/(?P<channel>@[\w.-]+|channel\/[\w-]+|c\/[\w.-]+|user\/[\w.-]+)"
+    r"(\/(videos|streams|featured)?)?\/?$"
+)
+
+# The videos of a playlist or channel page, in the data embedded in its HTML.
+VIDEO_ID_IN_PAGE_PATTERN = re.compile(r'"videoId":"(?P<video_id>[a-zA-Z0-9_-]{11})"')
+
+
+class TranscriptUnavailable(Exception):
+    """
+    A YouTube video has no transcript: they are disabled, or not ready yet.
+    """
+
 
 def is_youtube_video(url: str) -> bool:
     """
@@ -30,6 +49,57 @@ def is_youtube_video(url: str) -> bool:
     return YOUTUBE_URL_PATTERN.match(url.strip()) is not None
 
 
+def is_youtube_playlist(url: str) -> bool:
+    """
+    Checks if the given URL is a YouTube playlist or channel.
+    """
+    url = url.strip()
+    return bool(YOUTUBE_PLAYLIST_PATTERN.match(url) or YOUTUBE_CHANNEL_PATTERN.match(url))
+
+
+def get_playlist_videos(url: str) -> list[str]:
+    """
+    Returns the URLs of the videos of a YouTube playlist or channel, in order.
+
+    The videos are read from the page of the playlist (or of the videos of the channel), so
+    only its first page is covered: about 100 videos for a playlist, 30 for a channel.
+
+    Raises `fetch.FetchError` if the page cannot be fetched.
+    """
+    from . import fetch
+
+    url = url.strip()
+    if match := YOUTUBE_PLAYLIST_PATTERN.match(url):
+        page_url = f"https://www.youtube.com/playlist?list={match.group('playlist_id')}"
+    else:
+        match = YOUTUBE_CHANNEL_PATTERN.match(url)
+        page_url = f"https://www.youtube.com/{match.group('channel')}/videos"
+
+    page = fetch.fetch(page_url)
+    video_ids = dict.fromkeys(
+        match.group("video_id") for match in VIDEO_ID_IN_PAGE_PATTERN.finditer(page.text)
+    )
+    return [f"https://www.youtube.com/watch?v={video_id}" for video_id in video_ids]
+
+
+def read_video_list(path: str) -> list[str] | None:
+    """
+    Returns the YouTube URLs listed in a file, one per line, or `None` if the file is not a
+    list of YouTube videos. Blank lines and lines starting with `#` are ignored.
+    """
+    urls = []
+    with open(path, encoding="utf-8", errors="replace") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if not is_youtube_video(line):
+                return None
+            urls.append(line)
+    return urls or None
+
+
+@profiling.traced("transcript")
 def get_transcript(youtube_url: str, languages: list[str] = ["en"]) -> list[dict] | None:
     """
     Gets the transcript of a YouTube video.
@@ -62,41 +132,73 @@ def get_transcript(youtube_url: str, languages: list[str] = ["en"]) -> list[dict
         ]
         ```
 
+    Raises `TranscriptUnavailable` if the video has no transcript.
+
+    The transcripts (and the absence of transcripts) are cached, see `cache.TranscriptCache`.
+
     Source for the YouTubeTranscriptApi library documentation:
     https://github.com/jdepoix/youtube-transcript-api?tab=readme-ov-file#api
     """
+    from .cache import TranscriptCache
+
     youtube_url = youtube_url.strip()
     video_id = YOUTUBE_URL_PATTERN.match(youtube_url).group("video_id")
 
-    try:
-        transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
+    with TranscriptCache() as transcript_cache:
+        is_cached, transcript = transcript_cache.get(video_id, languages)
+        if is_cached and transcript is None:
+            raise TranscriptUnavailable(video_id)
+        if is_cached:
+            return transcript
+
+        # Imported here, as only YouTube URLs need it.
+        from youtube_transcript_api import (
+            NoTranscriptFound,
+            TranscriptsDisabled,
+            YouTubeTranscriptApi,
+        )
 
-        # Select the subtitles for one of the specified languages:
-        # manually created if available, fallback to automatically generated.
-        transcript = transcript_list.find_transcript(languages)
+        try:
+            transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
 
-    except TranscriptsDisabled:
-        click.echo(
-            f"{click.style('Error', fg='red')}: No transcripts available for this video.",
-            err=True,
-        )
-        click.echo("", err=True)  # Empty line for better readability.
-        click.echo(
-            f"{click.style('Possible reasons', fg='yellow')}:\n"
-            "- The video owner has disabled transcripts.\n"
-            "- The video is too recent and automatic captions aren't ready yet (can take several hours).\n"
-            "- The video language isn't supported for automatic captions.",
-            err=True,
+            # Select the subtitles for one of the specified languages:
+            # manually created if available, fallback to automatically generated.
+            found_transcript = transcript_list.find_transcript(languages)
+
+        except TranscriptsDisabled as error:
+            transcript_cache.set(video_id, languages, None)
+            raise TranscriptUnavailable(video_id) from error
+
+        except NoTranscriptFound:
+            # If no subtitles are found for the specified languages,
+            # default to any generated transcript.
+            found_transcript = next((t for t in transcript_list))
+
+        transcript = found_transcript.fetch()
+        transcript_cache.set(
+            video_id, languages, transcript, getattr(found_transcript, "language_code", None)
         )
-        click.echo("", err=True)  # Empty line for better readability.
-        sys.exit(1)
+        return transcript
 
-    except NoTranscriptFound:
-        # If no subtitles are found for the specified languages,
-        # default to any generated transcript.
-        transcript = next((t for t in transcript_list))
 
-    return transcript.fetch()
+def exit_transcripts_disabled() -> None:
+    """
+    Explains that the video has no transcripts, and exits.
+    """
+    click.echo(
+        f"{click.style('Error', fg='red')}: No transcripts available for this video.",
+        err=True,
+    )
+    click.echo("", err=True)  # Empty line for better readability.
+    click.echo(
+        f"{click.style('Possible reasons', fg='yellow')}:\n"
+        "- The video owner has disabled transcripts.\n"
+        "- The video is too recent and automatic captions aren't ready yet (can take several hours).\n"
+        "- The video language isn't supported for automatic captions.",
+        err=True,
+    )
+    click.echo("", err=True)  # Empty line for better readability.
+    sys.exit(1)
 
 
 def format_transcript(transcript: dict, timecode: bool = False) -> str:
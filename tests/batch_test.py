@@ -0,0 +1,182 @@
+import io
+import json
+import sqlite3
+import threading
+import time
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from lmtoolbox import batch, cli
+
+MODEL = "gpt-5-nano"
+
+
+def make_jobs(*inputs):
+    lines = [json.dumps({"command": "translate", "input": text, "id": text}) for text in inputs]
+    return list(batch.parse_jobs(lines, MODEL, 1.0))
+
+
+def read_results(output):
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def slow_upper(job):
+    # The first jobs take the longest, so they complete last.
+    time.sleep(0.05 / len(job.input))
+    return job.input.upper(), False
+
+
+def test_parse_jobs():
+    lines = [
+        '{"command": "define", "input": "word", "model": "gpt-4o", "temperature": 0.2}',
+        "",
+        "not json",
+        '{"input": "no command"}',
+        '{"command": "define", "input": "word", "temperature": 3}',
+        '{"command": "define", "input": "word", "model": "4o"}',
+        '{"command": "define", "input": "word", "model": "gpt-unknown"}',
+    ]
+    jobs = list(batch.parse_jobs(lines, MODEL, 1.0))
+
+    assert [job.index for job in jobs] == [1, 3, 4, 5, 6, 7]
+    assert (jobs[0].command, jobs[0].model, jobs[0].temperature) == ("define", "gpt-4o", 0.2)
+    assert jobs[0].error is None
+    assert jobs[1].error.startswith("Invalid JSON")
+    assert jobs[2].error == "Missing `command`."
+    assert "temperature" in jobs[3].error
+    # The aliases of the models are resolved, like with `--model`.
+    assert (jobs[4].model, jobs[4].error) == ("gpt-4o", None)
+    assert jobs[5].error.startswith("Invalid `model`: gpt-unknown.")
+
+
+def test_input_order():
+    output = io.StringIO()
+    summary = batch.run_batch(make_jobs("a", "bb", "ccc", "dddd"), slow_upper, output, workers=4)
+
+    results = read_results(output)
+    assert [result["output"] for result in results] == ["A", "BB", "CCC", "DDDD"]
+    assert (summary.succeeded, summary.failed) == (4, 0)
+
+
+def test_completion_order():
+    output = io.StringIO()
+    batch.run_batch(
+        make_jobs("a", "bb", "ccc", "dddd"), slow_upper, output, workers=4, order="completion"
+    )
+
+    outputs = [result["output"] for result in read_results(output)]
+    assert sorted(outputs) == ["A", "BB", "CCC", "DDDD"]
+    assert outputs[-1] == "A"
+
+
+def test_runs_concurrently():
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def generate(job):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return job.input, False
+
+    batch.run_batch(make_jobs(*"abcdefgh"), generate, io.StringIO(), workers=3)
+    assert peak == 3
+
+
+def test_errors_do_not_stop_the_run():
+    def generate(job):
+        if job.input == "b":
+            raise click.ClickException("Rate limit reached.")
+        return job.input, False
+
+    output = io.StringIO()
+    jobs = [*make_jobs("a", "b", "c"), *batch.parse_jobs(["nope"], MODEL, 1.0)]
+    summary = batch.run_batch(jobs, generate, output, workers=2)
+
+    results = read_results(output)
+    assert [result["error"] for result in results[:3]] == [None, "Rate limit reached.", None]
+    assert results[3]["error"].startswith("Invalid JSON")
+    assert (summary.succeeded, summary.failed) == (2, 2)
+
+
+def test_unexpected_errors_are_recorded_per_job(tmp_path):
+    def generate(job):
+        if job.input == "b":
+            raise sqlite3.OperationalError("database is locked")
+        return job.input, False
+
+    output = io.StringIO()
+    with batch.Checkpoint(tmp_path / "checkpoint.jsonl") as checkpoint:
+        summary = batch.run_batch(make_jobs("a", "b", "c"), generate, output, checkpoint=checkpoint)
+
+    results = read_results(output)
+    assert [result["error"] for result in results] == [
+        None,
+        "OperationalError: database is locked",
+        None,
+    ]
+    assert (summary.succeeded, summary.failed) == (2, 1)
+
+
+def test_job_templates_stay_in_the_templates_directory(home, tmp_path):
+    (home / ".config" / "lmt").mkdir(parents=True)
+    (home / "secret.yaml").write_text("system: Not a template.\n")
+    jobs_file = tmp_path / "jobs.jsonl"
+    jobs_file.write_text(json.dumps({"command": "../../../secret", "input": "a"}) + "\n")
+
+    result = CliRunner().invoke(cli.cli, ["batch", str(jobs_file)])
+
+    assert result.exit_code == 1
+    assert "The template '../../../secret' does not exist." in result.output
+
+
+def test_checkpoint_resumes_without_repeating_jobs(tmp_path):
+    path = tmp_path / "jobs.checkpoint"
+    calls = []
+
+    def generate(job):
+        calls.append(job.input)
+        return job.input.upper(), False
+
+    def interrupted_jobs():
+        jobs = make_jobs("a", "b", "c", "d")
+        yield from jobs[:2]
+        time.sleep(0.05)
+        raise KeyboardInterrupt
+
+    with batch.Checkpoint(path) as checkpoint, pytest.raises(KeyboardInterrupt):
+        batch.run_batch(interrupted_jobs(), generate, io.StringIO(), 2, checkpoint=checkpoint)
+    assert calls == ["a", "b"]
+
+    output = io.StringIO()
+    with batch.Checkpoint(path) as checkpoint:
+        summary = batch.run_batch(
+            make_jobs("a", "b", "c", "d"), generate, output, 2, checkpoint=checkpoint
+        )
+
+    assert calls == ["a", "b", "c", "d"]
+    assert [result["output"] for result in read_results(output)] == ["A", "B", "C", "D"]
+    assert (summary.resumed, summary.succeeded) == (2, 2)
+
+
+def test_summary_format():
+    summary = batch.Summary(succeeded=3, cached=1, elapsed=2.0, latencies=[0.5, 1.0])
+    assert summary.format() == (
+        "3 jobs in 2.0s (1.50 jobs/s): 3 succeeded (1 cached), 0 failed,"
+        " 0 resumed from the checkpoint.\n"
+        "Latency: p50 0.50s, p95 1.00s, max 1.00s."
+    )
+
+
+def test_percentile():
+    values = [float(value) for value in range(1, 101)]
+    assert batch.percentile(values, 50) == 50
+    assert batch.percentile(values, 95) == 95
+    assert batch.percentile([3.0], 99) == 3
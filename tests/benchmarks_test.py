@@ -0,0 +1,132 @@
+import importlib.util
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import openai
+import pytest
+
+BENCHMARKS_DIR = Path(__file__).parent.parent / "benchmarks"
+
+
+def load_benchmark_module(name: str):
+    spec = importlib.util.spec_from_file_location(name, BENCHMARKS_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+mock_server = load_benchmark_module("mock_server")
+
+
+@pytest.fixture
+def server():
+    config = mock_server.ServerConfig(latency=0, token_rate=0, response_tokens=5)
+    server = mock_server.start_server(config)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(server):
+    return openai.OpenAI(api_key="sk-test", base_url=server.base_url, max_retries=0)
+
+
+def test_mock_server_completion(server):
+    response = make_client(server).chat.completions.create(
+        model="gpt-4o", messages=[{"role": "user", "content": "Hello"}]
+    )
+
+    assert response.choices[0].message.content == "the quick brown fox jumps "
+    assert response.usage.completion_tokens == 5
+    assert [record.status for record in server.stats.since(0)] == [200]
+
+
+def test_mock_server_stream(server):
+    stream = make_client(server).chat.completions.create(
+        model="gpt-4o",
+        messages=[{"role": "user", "content": "Hello"}],
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    chunks = list(stream)
+
+    content = "".join(chunk.choices[0].delta.content or "" for chunk in chunks if chunk.choices)
+    assert content == "the quick brown fox jumps "
+    assert chunks[-1].usage.completion_tokens == 5
+    assert server.stats.since(0)[0].stream
+
+
+def test_mock_server_error_injection(server):
+    server.config.error_rate = 1
+    server.config.error_status = 429
+
+    with pytest.raises(openai.RateLimitError):
+        make_client(server).chat.completions.create(
+            model="gpt-4o", messages=[{"role": "user", "content": "Hello"}]
+        )
+    assert server.stats.since(0)[0].status == 429
+
+
+@pytest.mark.benchmark
+def test_end_to_end_benchmark(tmp_path):
+    """
+    Run one command through the end-to-end benchmark, against the mock server.
+
+    Run `python benchmarks/end_to_end.py` for the full report.
+    """
+    results_path = tmp_path / "results.json"
+    result = subprocess.run(
+        [
+            sys.executable,
+            str(BENCHMARKS_DIR / "end_to_end.py"),
+            "--commands",
+            "translate",
+            "--runs",
+            "2",
+            "--latency",
+            "0",
+            "--json",
+            str(results_path),
+        ],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    results = json.loads(results_path.read_text())
+    translate = results["commands"]["translate"]
+    assert translate["requests"] == 2
+    assert translate["failed_runs"] == 0
+    assert translate["first_byte_ms"] <= translate["latency_ms"]
+    assert translate["peak_rss_mb"] > 0
+
+
+@pytest.mark.benchmark
+def test_rendering_benchmark(tmp_path):
+    """
+    Render a short response with both renderers of the rendering benchmark.
+
+    Run `python benchmarks/rendering.py` for the full report.
+    """
+    results_path = tmp_path / "results.json"
+    result = subprocess.run(
+        [
+            sys.executable,
+            str(BENCHMARKS_DIR / "rendering.py"),
+            "--lines",
+            "60",
+            "--json",
+            str(results_path),
+        ],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    run = json.loads(results_path.read_text())["runs"][0]
+    assert run["chunks"] > 0
+    assert run["incremental"]["total_ms"] < run["full"]["total_ms"]
@@ -0,0 +1,196 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from lmtoolbox import budget, cli, generation
+
+
+@pytest.mark.parametrize(
+    "model, expected",
+    [
+        ("gpt-4", 8_192),
+        ("gpt-4-0613", 8_192),
+        ("gpt-4-32k-0613", 32_768),
+        ("gpt-4o-mini", 128_000),
+        ("gpt-5-nano", 400_000),
+        ("unknown-model", None),
+    ],
+)
+def test_get_context_window(model, expected):
+    assert budget.get_context_window(model) == expected
+
+
+def test_context_window_from_config():
+    config = {"context": {"windows": {"my-model": 1000, "gpt-4": 9000}}}
+    assert budget.get_context_window("my-model", config) == 1000
+    assert budget.get_context_window("gpt-4-0613", config) == 9000
+
+
+def test_get_chunk_tokens():
+    config = {"context": {"windows": {"my-model": 1000}, "reserved_tokens": 100}}
+    assert budget.get_chunk_tokens("my-model", config) == 900
+    assert budget.get_chunk_tokens("gpt-4") == 8_192 - budget.DEFAULT_RESERVED_TOKENS
+    assert budget.get_chunk_tokens("unknown-model") is None
+
+
+def make_check(character_encoding, prompt_input, context_window=100):
+    return budget.preflight(
+        "System.",
+        f"Prompt: {prompt_input}",
+        prompt_input,
+        "my-model",
+        {"context": {"windows": {"my-model": context_window}, "reserved_tokens": 10}},
+    )
+
+
+def test_preflight(character_encoding):
+    check = make_check(character_encoding, "a" * 50)
+
+    # The messages have 3 tokens of overhead each, and the reply 3.
+    assert check.prompt_tokens == len("System.") + len("Prompt: ") + 50 + 9
+    assert check.input_budget == 100 - 10 - (check.prompt_tokens - 50)
+    assert check.fits
+    assert budget.fit("a" * 50, check, budget.FAIL) == "a" * 50
+
+
+def test_unknown_context_window_always_fits(character_encoding):
+    check = budget.preflight("System.", "Prompt", "Prompt", "unknown-model")
+    assert check.input_budget is None
+    assert check.fits
+
+
+@pytest.mark.parametrize(
+    "policy, expected",
+    [
+        (budget.TRUNCATE_TAIL, "0123456789" * 6 + "012345"),
+        (budget.TRUNCATE_HEAD, "456789" + "0123456789" * 6),
+    ],
+)
+def test_fit_truncates(character_encoding, policy, expected):
+    prompt_input = "0123456789" * 20
+    check = make_check(character_encoding, prompt_input)
+    assert not check.fits
+    assert check.input_budget == 66
+
+    assert budget.fit(prompt_input, check, policy) == expected
+
+
+def test_fit_fails_fast(character_encoding):
+    check = make_check(character_encoding, "a" * 200)
+    with pytest.raises(budget.ContextWindowExceeded, match="context window of 100 tokens"):
+        budget.fit("a" * 200, check, budget.FAIL)
+
+    # Even a truncated input cannot fit if the system prompt alone does not.
+    check = make_check(character_encoding, "a" * 200, context_window=20)
+    with pytest.raises(budget.ContextWindowExceeded):
+        budget.fit("a" * 200, check, budget.TRUNCATE_TAIL)
+
+
+def test_invalid_policy_in_config():
+    with pytest.raises(budget.click.ClickException, match="Invalid context policy"):
+        budget.get_policy({"context": {"policy": "drop"}})
+
+
+@pytest.fixture
+def small_context_window(home, character_encoding, monkeypatch):
+    """A model with a context window of 200 tokens, and a fake generation."""
+    config_path = home / ".config" / "lmt" / "config.json"
+    config_path.parent.mkdir(parents=True)
+    config_path.write_text(
+        json.dumps({"context": {"windows": {"gpt-5-nano": 200}, "reserved_tokens": 50}})
+    )
+
+    prompts = []
+
+    def fake_resolve_request(template, system, prompt_input, model, emoji):
+        return "System.", prompt_input, model
+
+    def fake_generate_with_cache(prompt_input, **kwargs):
+        prompts.append(prompt_input)
+
+    monkeypatch.setattr(generation, "resolve_request", fake_resolve_request)
+    monkeypatch.setattr(cli, "generate_with_cache", fake_generate_with_cache)
+    monkeypatch.setattr(cli, "ensure_templates", lambda: None)
+    return prompts
+
+
+def test_oversized_input_fails_before_any_request(small_context_window):
+    result = CliRunner().invoke(cli.define, ["word " * 100])
+
+    assert result.exit_code == 1
+    assert "context window of 200 tokens" in result.stderr
+    assert small_context_window == []
+
+
+def test_oversized_input_is_truncated(small_context_window):
+    result = CliRunner().invoke(cli.define, ["word " * 100, "--fit", "truncate-tail"])
+
+    assert result.exit_code == 0, result.output
+    assert "truncated" in result.stderr
+    # 200 tokens, minus 50 for the response and 16 for the system prompt and the overhead.
+    assert small_context_window[0] == ("word " * 100)[:134]
+
+
+def test_oversized_input_is_chunked(small_context_window, monkeypatch):
+    chunks = []
+
+    def fake_complete(template, prompt_input, model, temperature, emoji=False):
+        chunks.append(prompt_input)
+        return f"Summary {len(chunks)}."
+
+    monkeypatch.setattr(generation, "complete", fake_complete)
+
+    result = CliRunner().invoke(cli.study, ["word " * 100, "--fit", "chunk"])
+
+    assert result.exit_code == 0, result.output
+    assert len(chunks) > 1
+    assert small_context_window[0].startswith("The following are the summaries")
+
+
+def test_summarize_chunks_fit_in_the_context_window(small_context_window, monkeypatch):
+    chunks = []
+
+    def fake_complete(template, prompt_input, model, temperature, emoji=False):
+        chunks.append(prompt_input)
+        return f"Summary {len(chunks)}."
+
+    monkeypatch.setattr(generation, "complete", fake_complete)
+
+    result = CliRunner().invoke(cli.summarize, input="word " * 100)
+
+    assert result.exit_code == 0, result.output
+    # 200 tokens, minus 50 for the response.
+    assert "chunks of up to 150 tokens" in result.stderr
+    assert all(len(chunk) <= 150 for chunk in chunks)
+
+
+def test_only_summarizing_templates_are_chunked(small_context_window, monkeypatch):
+    chunks = []
+    monkeypatch.setattr(
+        generation, "complete", lambda template, prompt_input, *args: chunks.append(prompt_input)
+    )
+
+    result = CliRunner().invoke(cli.translate, ["word " * 100, "--fit", "chunk"])
+
+    assert result.exit_code == 2
+    assert "the `translate` template needs all of it" in result.stderr
+    assert chunks == small_context_window == []
+
+
+def test_configured_chunk_policy_falls_back_to_fail(small_context_window, home, monkeypatch):
+    config_path = home / ".config" / "lmt" / "config.json"
+    config = json.loads(config_path.read_text())
+    config["context"]["policy"] = "chunk"
+    config_path.write_text(json.dumps(config))
+    chunks = []
+    monkeypatch.setattr(
+        generation, "complete", lambda template, prompt_input, *args: chunks.append(prompt_input)
+    )
+
+    result = CliRunner().invoke(cli.translate, ["word " * 100])
+
+    assert result.exit_code == 1
+    assert "context window of 200 tokens" in result.stderr
+    # Neither the map nor the reduce prompt was sent.
+    assert chunks == small_context_window == []
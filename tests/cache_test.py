@@ -0,0 +1,205 @@
+import pytest
+
+from lmtoolbox import cache as cache_module
+from lmtoolbox import cli, generation
+from lmtoolbox.cache import DAY, ResponseCache, TranscriptCache, make_key
+
+
+@pytest.fixture
+def response_cache(home):
+    with ResponseCache() as response_cache:
+        yield response_cache
+
+
+def key_for(**overrides):
+    request = {
+        "template": "define",
+        "system": "Define the word.",
+        "model": "gpt-5-nano",
+        "temperature": 1.0,
+        "emoji": False,
+        "prompt_input": "serendipity",
+    }
+    request.update(overrides)
+    return make_key(**request)
+
+
+@pytest.mark.parametrize(
+    "override",
+    [
+        {"template": "thesaurus"},
+        {"system": "Define the word briefly."},
+        {"model": "gpt-5"},
+        {"temperature": 0.5},
+        {"emoji": True},
+        {"prompt_input": "serendipitous"},
+    ],
+)
+def test_make_key_depends_on_every_parameter(override):
+    assert key_for() != key_for(**override)
+
+
+def test_make_key_is_stable():
+    assert key_for() == key_for()
+
+
+def test_get_and_set(response_cache):
+    key = key_for()
+    assert response_cache.get(key, "define") is None
+
+    response_cache.set(key, "define", "gpt-5-nano", "A happy accident.")
+
+    assert response_cache.get(key, "define") == "A happy accident."
+    assert response_cache.stats()["hits"] == 1
+
+
+def test_entries_expire_after_ttl(response_cache, monkeypatch):
+    key = key_for()
+    response_cache.set(key, "define", "gpt-5-nano", "A happy accident.")
+
+    now = cache_module.time.time()
+    monkeypatch.setattr(
+        cache_module.time, "time", lambda: now + response_cache.get_ttl("define") + 1
+    )
+
+    assert response_cache.get(key, "define") is None
+    assert response_cache.stats()["entries"] == 0
+
+
+def test_ttl_from_config(home):
+    config = {"cache": {"ttl": {"define": DAY, "cheermeup": 60}}}
+    with ResponseCache(config=config) as response_cache:
+        assert response_cache.get_ttl("define") == DAY
+        assert response_cache.is_enabled("cheermeup")
+        assert response_cache.get_ttl("translate") == cache_module.DEFAULT_TTL
+
+
+def test_cheermeup_is_not_cached_by_default(response_cache):
+    assert not response_cache.is_enabled("cheermeup")
+
+
+def test_least_recently_used_entries_are_evicted(home):
+    with ResponseCache(config={"cache": {"max_size_mb": 25 / 1024**2}}) as response_cache:
+        first, second, third = key_for(prompt_input="1"), key_for(prompt_input="2"), key_for()
+        response_cache.set(first, "define", "gpt-5-nano", "x" * 10)
+        response_cache.set(second, "define", "gpt-5-nano", "y" * 10)
+        # Reading the first entry makes the second one the least recently used.
+        assert response_cache.get(first, "define") is not None
+
+        response_cache.set(third, "define", "gpt-5-nano", "z" * 10)
+
+        assert response_cache.get(first, "define") is not None
+        assert response_cache.get(second, "define") is None
+        assert response_cache.get(third, "define") is not None
+
+
+def test_prune(response_cache, monkeypatch):
+    response_cache.set(key_for(template="summarize"), "summarize", "gpt-5-nano", "Summary.")
+    response_cache.set(key_for(), "define", "gpt-5-nano", "Definition.")
+
+    # Older than the TTL of `summarize`, but not than the TTL of `define`.
+    now = cache_module.time.time()
+    monkeypatch.setattr(cache_module.time, "time", lambda: now + 8 * DAY)
+
+    assert response_cache.prune() == 1
+    assert list(response_cache.stats()["templates"]) == ["define"]
+
+    assert response_cache.prune(clear=True) == 1
+    assert response_cache.stats()["entries"] == 0
+
+
+@pytest.fixture
+def fake_generation(home, monkeypatch):
+    """Replace the template resolution and the API call, and record the requests."""
+    calls = []
+
+    def fake_resolve_request(template, system, prompt_input, model, emoji):
+        return f"System prompt of {template}.", prompt_input, model
+
+    def fake_prepare_and_generate_response(**kwargs):
+        calls.append(kwargs)
+        return f"Answer #{len(calls)}", 1.0, object()
+
+    monkeypatch.setattr(generation, "resolve_request", fake_resolve_request)
+    monkeypatch.setattr(
+        "lmterminal.lib.prepare_and_generate_response", fake_prepare_and_generate_response
+    )
+    return calls
+
+
+def generate(refresh=False, template="define"):
+    return cli.generate_with_cache(
+        template=template,
+        model="gpt-5-nano",
+        emoji=False,
+        prompt_input="serendipity",
+        temperature=1.0,
+        no_stream=False,
+        raw=True,
+        debug=False,
+        refresh=refresh,
+    )
+
+
+def test_cache_hit_replays_without_request(fake_generation, capsys):
+    content, _, response = generate()
+    assert content == "Answer #1"
+    assert response is not None
+
+    content, response_time, response = generate()
+
+    assert content == "Answer #1"
+    assert (response_time, response) == (0.0, None)
+    assert len(fake_generation) == 1
+    assert capsys.readouterr().out == "Answer #1\n"
+
+
+def test_refresh_bypasses_the_cached_response(fake_generation):
+    generate()
+    content, _, _ = generate(refresh=True)
+    assert content == "Answer #2"
+
+    content, _, _ = generate()
+    assert content == "Answer #2"
+    assert len(fake_generation) == 2
+
+
+def test_disabled_template_is_not_cached(fake_generation):
+    generate(template="cheermeup")
+    generate(template="cheermeup")
+    assert len(fake_generation) == 2
+
+
+@pytest.fixture
+def transcript_cache(home):
+    with TranscriptCache() as transcript_cache:
+        yield transcript_cache
+
+
+def test_transcript_round_trip(transcript_cache):
+    transcript = [
+        {"text": "Hello world!", "start": 0.0, "duration": 2.0},
+        {"text": "This is a test.", "start": 2.0, "duration": 4.0},
+    ]
+    transcript_cache.set("dQw4w9WgXcQ", ["en"], transcript, "en")
+
+    assert transcript_cache.get("dQw4w9WgXcQ", ["en"]) == (True, transcript)
+    assert transcript_cache.get("dQw4w9WgXcQ", ["fr"]) == (False, None)
+
+
+def test_transcript_negative_entries_expire_sooner(transcript_cache, monkeypatch):
+    transcript_cache.set("disabled000", ["en"], None)
+    transcript_cache.set("dQw4w9WgXcQ", ["en"], [{"text": "Hello"}])
+    assert transcript_cache.get("disabled000", ["en"]) == (True, None)
+
+    now = cache_module.time.time()
+    monkeypatch.setattr(cache_module.time, "time", lambda: now + 2 * 60 * 60)
+
+    assert transcript_cache.get("disabled000", ["en"]) == (False, None)
+    assert transcript_cache.get("dQw4w9WgXcQ", ["en"])[0]
+
+
+def test_transcript_eviction(home):
+    with TranscriptCache(max_size_mb=0) as transcript_cache:
+        transcript_cache.set("dQw4w9WgXcQ", ["en"], [{"text": "Hello"}])
+        assert transcript_cache.get("dQw4w9WgXcQ", ["en"]) == (False, None)
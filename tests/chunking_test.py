@@ -0,0 +1,98 @@
+import pytest
+
+from lmtoolbox import chunking
+from lmtoolbox.chunking import (
+    ApproximateEncoding,
+    count_tokens,
+    split_into_chunks,
+    split_paragraphs,
+)
+
+MODEL = "gpt-5-nano"
+
+
+def test_count_tokens(character_encoding):
+    assert count_tokens("hello", MODEL) == 5
+
+
+def test_approximate_encoding():
+    assert len(ApproximateEncoding().encode("a" * 9)) == 3
+
+
+def test_get_encoding_offline(monkeypatch):
+    import tiktoken
+
+    def offline(*args, **kwargs):
+        raise OSError("Network is unreachable")
+
+    chunking.get_encoding.cache_clear()
+    monkeypatch.setattr(tiktoken, "encoding_for_model", offline)
+    try:
+        assert isinstance(chunking.get_encoding("offline-model"), ApproximateEncoding)
+    finally:
+        chunking.get_encoding.cache_clear()
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("First paragraph.\n\nSecond\nparagraph.\n", ["First paragraph.", "Second\nparagraph.\n"]),
+        ("First line.\nSecond line.\n\n", ["First line.", "Second line."]),
+        ("Single line.", ["Single line."]),
+        ("", []),
+    ],
+)
+def test_split_paragraphs(text, expected):
+    assert split_paragraphs(text) == expected
+
+
+def test_segments_are_packed_up_to_the_budget(character_encoding):
+    segments = ["aaaa", "bbbb", "cccc", "dddd"]
+    # Two segments and the separator fit in 10 tokens, three do not.
+    chunks = list(split_into_chunks(segments, max_tokens=10, model=MODEL))
+    assert chunks == ["aaaa\n\nbbbb", "cccc\n\ndddd"]
+
+
+def test_chunks_respect_the_budget(character_encoding):
+    segments = [f"Paragraph number {index}." for index in range(50)]
+    chunks = list(split_into_chunks(segments, max_tokens=100, model=MODEL))
+
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert "\n\n".join(chunks) == "\n\n".join(segments)
+
+
+def test_large_segment_is_split_on_sentences(character_encoding):
+    segment = "One sentence. Another sentence. A third one."
+    chunks = list(split_into_chunks([segment], max_tokens=20, model=MODEL))
+    assert chunks == ["One sentence.", "Another sentence.", "A third one."]
+
+
+def test_large_sentence_is_split_on_tokens(character_encoding):
+    chunks = list(split_into_chunks(["x" * 25], max_tokens=10, model=MODEL))
+    assert chunks == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_transcript_lines_are_joined_with_spaces(character_encoding):
+    lines = ["hello world", "this is", "a transcript"]
+    chunks = list(split_into_chunks(lines, max_tokens=20, model=MODEL, separator=" "))
+    assert chunks == ["hello world this is", "a transcript"]
+
+
+def test_iter_paragraphs_across_blocks():
+    blocks = ["First para", "graph.\n", "\nSecond", " paragraph.\n\n\n", "Third."]
+    assert list(chunking.iter_paragraphs(blocks)) == [
+        "First paragraph.",
+        "Second paragraph.",
+        "Third.",
+    ]
+
+
+def test_iter_paragraphs_cuts_long_paragraphs(monkeypatch):
+    monkeypatch.setattr(chunking, "MAX_PARAGRAPH_CHARS", 10)
+    paragraphs = list(chunking.iter_paragraphs(["line one\nline two\nline", " three"]))
+    assert "".join(paragraphs) == "line one\nline two\nline three"
+    assert len(paragraphs) > 1
+
+
+def test_split_at_token(character_encoding):
+    assert chunking.split_at_token("hello world", 5, MODEL) == ("hello", " world")
@@ -0,0 +1,31 @@
+import pytest
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    """Isolated home directory, so that tests never touch the real ~/.config or ~/.cache."""
+    home_dir = tmp_path / "home"
+    home_dir.mkdir()
+    monkeypatch.setenv("HOME", str(home_dir))
+    monkeypatch.delenv("XDG_CACHE_HOME", raising=False)
+    return home_dir
+
+
+class CharacterEncoding:
+    """Offline stand-in for a `tiktoken` encoding: one token per character."""
+
+    def encode(self, text, **kwargs):
+        return [ord(character) for character in text]
+
+    def decode(self, tokens):
+        return "".join(chr(token) for token in tokens)
+
+
+@pytest.fixture
+def character_encoding(monkeypatch):
+    """Count one token per character, without loading a `tiktoken` encoding."""
+    from lmtoolbox import chunking
+
+    encoding = CharacterEncoding()
+    monkeypatch.setattr(chunking, "get_encoding", lambda model: encoding)
+    return encoding
@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from lmtoolbox import daemon
+
+
+@pytest.fixture
+def daemon_env(home, tmp_path, monkeypatch):
+    """Environment variables pointing the daemon and its clients to an isolated socket."""
+    runtime_dir = tmp_path / "run"
+    runtime_dir.mkdir()
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(runtime_dir))
+    monkeypatch.delenv(daemon.NO_DAEMON_ENV, raising=False)
+    return dict(os.environ)
+
+
+@pytest.fixture
+def running_daemon(daemon_env):
+    process = subprocess.Popen(
+        [sys.executable, "-c", "from lmtoolbox.cli import cli; cli(['serve'])"],
+        env=daemon_env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    socket_path = daemon.get_socket_path()
+    deadline = time.monotonic() + 30
+    while not socket_path.exists():
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            pytest.fail(f"The daemon did not start: {process.stderr.read()}")
+        time.sleep(0.05)
+
+    yield process
+
+    process.terminate()
+    process.wait(timeout=10)
+
+
+def run_command(command: str, *args: str, env: dict) -> subprocess.CompletedProcess:
+    """Run a console script of `lmtoolbox.cli` in a fresh interpreter."""
+    code = (
+        f"import sys; from lmtoolbox.cli import {command}; sys.argv[0] = {command!r}; {command}()"
+    )
+    return subprocess.run(
+        [sys.executable, "-c", code, *args],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+
+def test_forward_without_daemon(daemon_env):
+    assert daemon.forward("define", ["--help"], "define") is None
+
+
+def test_forward_with_stale_socket(daemon_env):
+    socket_path = daemon.get_socket_path()
+    socket_path.touch()
+    assert daemon.forward("define", ["--help"], "define") is None
+
+
+def test_forward_disabled(daemon_env, running_daemon, monkeypatch):
+    monkeypatch.setenv(daemon.NO_DAEMON_ENV, "1")
+    assert daemon.forward("define", ["--help"], "define") is None
+
+
+def test_command_runs_in_daemon(daemon_env, running_daemon):
+    result = run_command("define", "--help", env=daemon_env)
+
+    assert result.returncode == 0
+    assert "Usage: define [OPTIONS] [WORD]..." in result.stdout
+
+    running_daemon.terminate()
+    _, daemon_log = running_daemon.communicate(timeout=10)
+    assert "define --help -> 0" in daemon_log
+
+
+def test_exit_code_and_stderr_are_forwarded(daemon_env, running_daemon):
+    result = run_command("define", "--bogus", env=daemon_env)
+
+    assert result.returncode == 2
+    assert "No such option '--bogus'" in result.stderr
+
+
+def test_group_subcommand_runs_in_daemon(daemon_env, running_daemon):
+    result = run_command("cli", "templates", "sync", env=daemon_env)
+
+    assert result.returncode == 0
+    assert "Templates are up to date." in result.stdout
+
+
+def test_serve_refuses_to_start_twice(daemon_env, running_daemon):
+    result = run_command("cli", "serve", env=daemon_env)
+
+    assert result.returncode == 1
+    assert "already listening" in result.stderr
@@ -0,0 +1,227 @@
+import subprocess
+
+import pytest
+from click.testing import CliRunner
+
+from lmtoolbox import cli, diffs, generation
+
+
+def git(repository, *args):
+    subprocess.run(
+        ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+        cwd=repository,
+        check=True,
+        capture_output=True,
+    )
+
+
+@pytest.fixture
+def repository(tmp_path, monkeypatch):
+    """A git repository with a first commit, as the working directory."""
+    git(tmp_path, "init", "-q")
+    (tmp_path / "app.py").write_text("def main():\n    pass\n")
+    (tmp_path / "old name.txt").write_text("Some notes.\n" * 10)
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "First commit")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def stage_changes(repository):
+    (repository / "app.py").write_text("def main():\n    print('Hello!')\n")
+    (repository / "package-lock.json").write_text('{"lockfileVersion": 3}\n')
+    (repository / "logo.png").write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00")
+    (repository / "schema.py").write_text("# @generated by the schema compiler\nSCHEMA = {}\n")
+    (repository / "vendor").mkdir()
+    (repository / "vendor" / "library.js").write_text("var library = {};\n")
+    git(repository, "mv", "old name.txt", "new name.txt")
+    git(repository, "add", ".")
+
+
+def test_get_changes(repository):
+    stage_changes(repository)
+
+    changes = {change.path: change for change in diffs.get_changes(["--staged"])}
+
+    assert (changes["app.py"].added, changes["app.py"].deleted) == (1, 1)
+    assert changes["logo.png"].binary
+    assert changes["new name.txt"].old_path == "old name.txt"
+    assert changes["new name.txt"].format_stat() == "old name.txt => new name.txt (+0 -0)"
+
+
+def test_describe_changes_skips_binary_lock_and_generated_files(repository, capsys):
+    stage_changes(repository)
+
+    description = diffs.describe_changes(["--staged"], summarizer=None, model="gpt-4o")
+
+    assert "Left out the diffs of logo.png (binary), package-lock.json (lock file)" in (
+        capsys.readouterr().err
+    )
+
+    assert "+    print('Hello!')" in description
+    assert "lockfileVersion" not in description
+    assert "SCHEMA" not in description
+    assert "var library" not in description
+    assert "- package-lock.json (+1 -0): lock file" in description
+    assert "- logo.png (binary): binary" in description
+    assert "- schema.py (+2 -0): generated" in description
+    assert "- vendor/library.js (+1 -0): generated" in description
+
+
+def test_only_generated_headers_mark_generated_files(repository, capsys):
+    (repository / "api.go").write_text(
+        "// Code generated by protoc-gen-go. DO NOT EDIT.\n\npackage api\n"
+    )
+    (repository / "checks.py").write_text(
+        '"""\nSkip the files that start with "Code generated by ... DO NOT EDIT".\n"""\n'
+        "# The @generated marker is looked for too.\n"
+        "MARKERS = ['@generated', 'DO NOT EDIT']\n"
+    )
+    git(repository, "add", ".")
+
+    description = diffs.describe_changes(["--staged"], summarizer=None, model="gpt-4o")
+
+    assert "- api.go (+3 -0): generated" in description
+    assert "+MARKERS = ['@generated', 'DO NOT EDIT']" in description
+    assert "Left out the diffs of api.go (generated)." in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    "diff, expected",
+    [
+        ("@@ -0,0 +1,2 @@\n+# @generated by the compiler\n+X = 1\n", True),
+        ("@@ -1,3 +1,3 @@\n /* @generated */\n-a\n+b\n", True),
+        ("@@ -40,3 +40,3 @@\n # @generated\n-a\n+b\n", False),
+        ("@@ -0,0 +1,7 @@\n+a\n+b\n+c\n+d\n+e\n+# @generated\n", False),
+        ("@@ -0,0 +1 @@\n+print('@generated')\n", False),
+    ],
+)
+def test_is_generated(diff, expected):
+    assert diffs.is_generated(diff) is expected
+
+
+def test_describe_changes_summarizes_the_largest_diffs(repository, character_encoding):
+    (repository / "large.py").write_text(
+        "".join(f"line_{index} = {index}\n" for index in range(200))
+    )
+    (repository / "app.py").write_text("def main():\n    print('Hello!')\n")
+    git(repository, "add", ".")
+
+    prompts = []
+
+    def summarizer(prompt):
+        prompts.append(prompt)
+        return "- Adds many lines."
+
+    description = diffs.describe_changes(["--staged"], summarizer, "gpt-4o", max_tokens=1000)
+
+    assert "+    print('Hello!')" in description
+    assert "line_1 = 1" not in description
+    assert "Summary of the diff of large.py (+200 -0), too large to be shown:" in description
+    assert "- Adds many lines." in description
+    assert any(prompt.startswith("Diff of `large.py`") for prompt in prompts)
+
+
+def test_describe_changes_without_changes(repository):
+    assert diffs.describe_changes(["--staged"], summarizer=None, model="gpt-4o") is None
+
+
+def test_commitgen_prompt(repository, home, monkeypatch):
+    stage_changes(repository)
+    prompts = []
+
+    def fake_process_command(ctx, template, model, emoji, prompt_input, *args, **kwargs):
+        prompts.append(prompt_input)
+
+    monkeypatch.setattr(cli, "process_command", fake_process_command)
+    monkeypatch.setattr(
+        generation,
+        "resolve_request",
+        lambda template, system, prompt_input, model, emoji: ("", prompt_input, model),
+    )
+
+    result = CliRunner().invoke(cli.commitgen, [])
+
+    assert result.exit_code == 0, result.output
+    assert "+    print('Hello!')" in prompts[0]
+    assert "lockfileVersion" not in prompts[0]
+
+
+def test_commitgen_tokens_does_not_summarize_diffs(
+    repository, home, character_encoding, monkeypatch
+):
+    (repository / "large.py").write_text(
+        "".join(f"line_{index} = {index}\n" for index in range(200))
+    )
+    git(repository, "add", ".")
+    prompts = []
+
+    def fake_generate_content(*args):
+        pytest.fail("No diff should be summarized with `--tokens`.")
+
+    def fake_process_command(ctx, template, model, emoji, prompt_input, *args, **kwargs):
+        prompts.append(prompt_input)
+
+    monkeypatch.setattr(generation, "generate_content", fake_generate_content)
+    monkeypatch.setattr(cli, "process_command", fake_process_command)
+    monkeypatch.setattr(
+        generation,
+        "resolve_request",
+        lambda template, system, prompt_input, model, emoji: ("", prompt_input, model),
+    )
+
+    result = CliRunner().invoke(cli.commitgen, ["--tokens", "--max-diff-tokens", "500"])
+
+    assert result.exit_code == 0, result.output
+    assert "+line_199 = 199" in prompts[0]
+
+
+def test_fingerprint_staged_changes(repository):
+    assert diffs.fingerprint_staged_changes() is None
+
+    (repository / "app.py").write_text("def main():\n    print('Hello!')\n")
+    git(repository, "add", ".")
+    fingerprint = diffs.fingerprint_staged_changes()
+    assert fingerprint is not None
+    assert diffs.fingerprint_staged_changes() == fingerprint
+
+    # Unstaged changes do not change the fingerprint.
+    (repository / "app.py").write_text("def main():\n    print('Bye!')\n")
+    assert diffs.fingerprint_staged_changes() == fingerprint
+
+    git(repository, "add", ".")
+    assert diffs.fingerprint_staged_changes() != fingerprint
+
+
+def test_commitgen_reuses_the_message_of_the_same_staged_changes(repository, home, monkeypatch):
+    stage_changes(repository)
+    calls = []
+
+    def fake_process_command(ctx, template, model, emoji, prompt_input, *args, **kwargs):
+        calls.append(prompt_input)
+        print(f"Message #{len(calls)}")
+        return f"Message #{len(calls)}", 1.0, object()
+
+    monkeypatch.setattr(cli, "process_command", fake_process_command)
+    monkeypatch.setattr(
+        generation,
+        "resolve_request",
+        lambda template, system, prompt_input, model, emoji: ("System.", prompt_input, model),
+    )
+
+    first = CliRunner().invoke(cli.commitgen, [])
+    second = CliRunner().invoke(cli.commitgen, [])
+
+    assert (first.stdout, second.stdout) == ("Message #1\n", "Message #1\n")
+    assert "Reusing" in second.stderr
+    assert len(calls) == 1
+
+    # `--refresh` forces a new message, and a different model does not share it.
+    assert CliRunner().invoke(cli.commitgen, ["--refresh"]).stdout == "Message #2\n"
+    assert CliRunner().invoke(cli.commitgen, ["-m", "gpt-4o"]).stdout == "Message #3\n"
+    assert CliRunner().invoke(cli.commitgen, []).stdout == "Message #2\n"
+
+    # Staging another change invalidates the message.
+    (repository / "app.py").write_text("def main():\n    print('Bye!')\n")
+    git(repository, "add", ".")
+    assert CliRunner().invoke(cli.commitgen, []).stdout == "Message #4\n"
@@ -0,0 +1,180 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from lmtoolbox import engine
+from lmtoolbox.engine import AsyncEngine, Engine, RateLimits, Request, TokenBucket
+
+MODEL = "gpt-5-nano"
+
+
+class FakeClient:
+    """Stand-in for `openai.AsyncOpenAI`, answering with the prompt in upper case."""
+
+    def __init__(self, rate_limited=0, retry_after=None, delay=0.0):
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.delay = delay
+        self.calls = []
+        self.payloads = []
+        self.running = 0
+        self.peak = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, messages, model, **parameters):
+        self.calls.append(time.monotonic())
+        self.payloads.append({"messages": messages, "model": model, **parameters})
+        if self.rate_limited:
+            self.rate_limited -= 1
+            headers = {"retry-after": self.retry_after} if self.retry_after else {}
+            response = httpx.Response(
+                429, headers=headers, request=httpx.Request("POST", "https://api.openai.com")
+            )
+            raise openai.RateLimitError("Rate limit reached.", response=response, body=None)
+
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+
+        content = messages[-1]["content"].upper()
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(total_tokens=100),
+        )
+
+
+def test_token_bucket_waits_for_refill():
+    async def acquire():
+        bucket = TokenBucket(capacity=10, period=0.5)
+        start = time.monotonic()
+        await bucket.acquire(10)
+        await bucket.acquire(5)
+        return time.monotonic() - start
+
+    # 5 tokens at 20 tokens per second.
+    assert 0.2 <= asyncio.run(acquire()) < 0.5
+
+
+def test_token_bucket_clamps_large_amounts():
+    async def acquire():
+        bucket = TokenBucket(capacity=10)
+        await bucket.acquire(1000)
+        return bucket.tokens
+
+    assert asyncio.run(acquire()) == pytest.approx(0, abs=0.01)
+
+
+def test_token_bucket_adjust():
+    bucket = TokenBucket(capacity=10, period=3600)
+    bucket.adjust(15)
+    assert bucket.tokens == pytest.approx(-5, abs=0.01)
+    bucket.adjust(-100)
+    assert bucket.tokens == 10
+
+
+def test_estimate_tokens(character_encoding):
+    request = Request("system", "prompt", MODEL)
+    assert request.estimate_tokens() == 3 + 6 + 3 + 6 + 3
+
+
+def test_o1_requests_have_no_system_message_nor_temperature(character_encoding):
+    client = FakeClient()
+    request = Request("Be brief.", "prompt", "o1-mini", temperature=0.2)
+    assert asyncio.run(AsyncEngine(client, RateLimits()).generate(request)) == "BE BRIEF.\n\nPROMPT"
+    assert client.payloads == [
+        {"messages": [{"role": "user", "content": "Be brief.\n\nprompt"}], "model": "o1-mini"}
+    ]
+
+
+def test_requests_have_a_system_message_and_temperature(character_encoding):
+    client = FakeClient()
+    request = Request("Be brief.", "prompt", MODEL, temperature=0.2)
+    asyncio.run(AsyncEngine(client, RateLimits()).generate(request))
+    assert client.payloads == [
+        {
+            "messages": [
+                {"role": "system", "content": "Be brief."},
+                {"role": "user", "content": "prompt"},
+            ],
+            "model": MODEL,
+            "temperature": 0.2,
+        }
+    ]
+
+
+def test_rate_limits_from_config():
+    limits = RateLimits.from_config({"rate_limits": {"requests_per_minute": 60}})
+    assert limits.requests_per_minute == 60
+    assert limits.tokens_per_minute == engine.DEFAULT_TOKENS_PER_MINUTE
+
+
+def test_generate_many_in_order(character_encoding):
+    client = FakeClient(delay=0.01)
+
+    async def generate():
+        async_engine = AsyncEngine(client, RateLimits(max_concurrency=3))
+        requests = [Request("", text, MODEL) for text in ("a", "b", "c", "d", "e")]
+        return await async_engine.generate_many(requests)
+
+    assert asyncio.run(generate()) == ["A", "B", "C", "D", "E"]
+    assert client.peak == 3
+
+
+def test_requests_per_minute(character_encoding):
+    client = FakeClient()
+
+    async def generate():
+        # 2 requests at once, then one every 0.1 second.
+        async_engine = AsyncEngine(client, RateLimits(requests_per_minute=2))
+        for bucket in async_engine.get_buckets(MODEL):
+            bucket.rate = bucket.capacity / 0.2
+        await async_engine.generate_many([Request("", "a", MODEL)] * 4)
+
+    asyncio.run(generate())
+    assert client.calls[-1] - client.calls[0] >= 0.15
+
+
+def test_retries_rate_limited_requests(character_encoding):
+    client = FakeClient(rate_limited=2)
+
+    async def generate():
+        async_engine = AsyncEngine(client, backoff_base=0.01)
+        return await async_engine.generate(Request("", "a", MODEL))
+
+    assert asyncio.run(generate()) == "A"
+    assert len(client.calls) == 3
+
+
+def test_gives_up_after_max_retries(character_encoding):
+    client = FakeClient(rate_limited=10)
+
+    async def generate():
+        async_engine = AsyncEngine(client, max_retries=2, backoff_base=0.01)
+        return await async_engine.generate(Request("", "a", MODEL))
+
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(generate())
+    assert len(client.calls) == 3
+
+
+def test_backoff_honors_retry_after():
+    response = httpx.Response(
+        429, headers={"retry-after": "2"}, request=httpx.Request("POST", "https://x")
+    )
+    error = openai.RateLimitError("Rate limit reached.", response=response, body=None)
+    assert AsyncEngine(FakeClient()).get_backoff(0, error) == 2
+
+
+def test_synchronous_facade(character_encoding):
+    sync_engine = Engine("key", client=FakeClient())
+    try:
+        assert sync_engine.generate(Request("", "a", MODEL)) == "A"
+        assert sync_engine.submit(Request("", "b", MODEL)).result() == "B"
+        assert sync_engine.generate_many([Request("", "c", MODEL)]) == ["C"]
+    finally:
+        sync_engine.close()
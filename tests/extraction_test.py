@@ -0,0 +1,92 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from lmtoolbox import extraction, fetch, sources
+
+FIXTURES = Path(__file__).parent / "fixtures" / "html"
+EXPECTED = json.loads((FIXTURES / "expected.json").read_text(encoding="utf-8"))
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_extracts_main_content(name):
+    html = (FIXTURES / name).read_text(encoding="utf-8")
+    text = extraction.extract_main_content(html)
+
+    for phrase in EXPECTED[name]["keep"]:
+        assert phrase in text
+    for phrase in EXPECTED[name]["drop"]:
+        assert phrase not in text
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_streaming_gives_the_same_content(name):
+    html = (FIXTURES / name).read_text(encoding="utf-8")
+
+    parser = extraction.MainContentParser()
+    for start in range(0, len(html), 97):
+        parser.feed(html[start : start + 97])
+    parser.close()
+
+    assert parser.main_content() == extraction.extract_main_content(html)
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_fewer_tokens_than_strip_tags(name, character_encoding):
+    html = (FIXTURES / name).read_text(encoding="utf-8")
+    text = extraction.extract_main_content(html)
+
+    stripped_tokens, extracted_tokens = extraction.token_reduction(html, text, "gpt-4o")
+
+    assert extracted_tokens < stripped_tokens
+
+
+def test_keeps_preformatted_text_and_tables():
+    html = (FIXTURES / "documentation.html").read_text(encoding="utf-8")
+    text = extraction.extract_main_content(html)
+
+    assert "from fetchkit import Session, Retry\n\nsession = Session(" in text
+    assert "400 Bad Request | No | The request itself is wrong" in text
+
+
+def test_unclosed_paragraphs():
+    words = " ".join(["word"] * 30)
+    html = f"<body><p>First {words}<p>Second {words}<div class='sidebar'><p>Sidebar</div>"
+
+    blocks = extraction.extract_main_content(html).split("\n\n")
+
+    assert [block.split()[0] for block in blocks] == ["First", "Second"]
+
+
+def test_load_web_page(home, monkeypatch):
+    html = (FIXTURES / "blog_post.html").read_text(encoding="utf-8")
+
+    def fake_fetch(url, max_bytes, timeout=None, http_cache=None, feed=None):
+        if feed is not None:
+            feed(html)
+        return fetch.Page(url, html, "text/html")
+
+    monkeypatch.setattr(fetch, "fetch", fake_fetch)
+
+    source = sources.load_source("https://example.com/post")
+    assert "We use cookies" not in source.text
+    assert source.html == html
+
+    source = sources.load_source("https://example.com/post", extract=False)
+    assert "We use cookies" in source.text
+    assert source.html is None
+
+
+def test_load_web_page_without_main_content(home, monkeypatch):
+    html = "<body><nav><a href='/'>Home</a></nav><p>Loading...</p></body>"
+    monkeypatch.setattr(
+        fetch,
+        "fetch",
+        lambda url, max_bytes, http_cache=None, feed=None: fetch.Page(url, html, "text/html"),
+    )
+
+    # Too little is extracted: the whole text of the page is used.
+    source = sources.load_source("https://example.com/app")
+    assert "Home" in source.text
+    assert source.html is None
@@ -0,0 +1,180 @@
+import codecs
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from lmtoolbox import fetch
+
+# Headers of the requests received by the server.
+REQUESTS = []
+
+FRENCH = (
+    "<html><body><p>Il était une fois une fée très âgée qui habitait près de la forêt. Chaque été, elle"
+    " préparait des crêpes pour les enfants du village, qui étaient ravis.</p></body></html>"
+)
+
+PAGE = "<html><body><p>Héllo, world!</p></body></html>".encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        REQUESTS.append((self.path, dict(self.headers)))
+        if self.path == "/image":
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", "100000")
+            self.end_headers()
+            return
+
+        if self.path == "/large":
+            body = b"a" * 100_000
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if self.path == "/latin-1":
+            body = '<html><head><meta charset="iso-8859-1"></head><p>Héllo</p></html>'
+            body = body.encode("latin-1")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = gzip.compress(PAGE)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        if self.path == "/cached":
+            self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+@pytest.fixture
+def http_cache(tmp_path):
+    REQUESTS.clear()
+    return fetch.HTTPCache(tmp_path / "http")
+
+
+def test_fetch_decompresses_and_decodes(server, http_cache):
+    page = fetch.fetch(f"{server}/page", http_cache=http_cache)
+
+    assert page.text == PAGE.decode()
+    assert page.content_type == "text/html"
+    assert "gzip" in REQUESTS[0][1]["Accept-Encoding"]
+    # Without validators, the page is not cached.
+    assert http_cache.get(f"{server}/page") is None
+
+
+def test_fetch_feeds_the_text_as_it_is_received(server, http_cache):
+    chunks = []
+    page = fetch.fetch(f"{server}/cached", http_cache=http_cache, feed=chunks.append)
+    assert "".join(chunks) == page.text
+
+    # From the cache too.
+    chunks.clear()
+    fetch.fetch(f"{server}/cached", http_cache=http_cache, feed=chunks.append)
+    assert "".join(chunks) == page.text
+
+
+def test_unchanged_page_costs_a_304(server, http_cache):
+    first = fetch.fetch(f"{server}/cached", http_cache=http_cache)
+    second = fetch.fetch(f"{server}/cached", http_cache=http_cache)
+
+    assert not first.from_cache
+    assert second.from_cache
+    assert second.text == first.text
+    assert REQUESTS[1][1]["If-None-Match"] == '"v1"'
+
+
+def test_rejects_non_text_documents(server, http_cache):
+    with pytest.raises(fetch.FetchError, match="not a text document"):
+        fetch.fetch(f"{server}/image", http_cache=http_cache)
+
+
+def test_truncates_large_documents(server, http_cache):
+    page = fetch.fetch(f"{server}/large", max_bytes=1000, http_cache=http_cache)
+    assert page.truncated
+    assert page.text == "a" * 1000
+
+
+def test_fetch_decodes_with_the_declared_charset(server, http_cache):
+    page = fetch.fetch(f"{server}/latin-1", http_cache=http_cache)
+    assert "<p>Héllo</p>" in page.text
+
+
+@pytest.mark.parametrize(
+    "charset, head, expected",
+    [
+        ("ISO-8859-1", b"<p>Hello</p>", "iso8859-1"),
+        (None, codecs.BOM_UTF8 + b"<p>Hello</p>", "utf-8-sig"),
+        ("ISO-8859-1", codecs.BOM_UTF16_LE + "<p>".encode("utf-16-le"), "utf-16"),
+        (None, b'<?xml version="1.0" encoding="windows-1252"?><feed>', "cp1252"),
+        (
+            None,
+            b"<meta http-equiv='Content-Type' content='text/html; charset=latin-1'>",
+            "iso8859-1",
+        ),
+        (None, "<p>Héllo</p>".encode()[:-6], "utf-8"),
+        ("unknown", b"", "utf-8"),
+    ],
+)
+def test_get_codec(charset, head, expected):
+    assert fetch.get_codec(charset, head) == expected
+
+
+def test_get_codec_guesses_undeclared_charsets():
+    head = FRENCH.encode("latin-1")
+    assert head.decode(fetch.get_codec(None, head)) == FRENCH
+
+
+def test_connection_errors():
+    with pytest.raises(fetch.FetchError):
+        fetch.fetch("http://127.0.0.1:9/unreachable", timeout=1)
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("text/html; charset=ISO-8859-1", ("text/html", "ISO-8859-1")),
+        ('Application/XHTML+XML; charset="utf-8"', ("application/xhtml+xml", "utf-8")),
+        ("", ("", None)),
+    ],
+)
+def test_parse_content_type(header, expected):
+    assert fetch.parse_content_type(header) == expected
+
+
+def test_http_cache_eviction(tmp_path):
+    http_cache = fetch.HTTPCache(tmp_path, max_size=15)
+    http_cache.set("https://a", {"etag": "a"}, b"0123456789")
+    http_cache.set("https://b", {"etag": "b"}, b"0123456789")
+
+    assert http_cache.get("https://b") is not None
+    assert http_cache.clear() == 1
+    assert http_cache.get("https://b") is None
@@ -0,0 +1,103 @@
+import io
+
+import pytest
+
+from lmtoolbox import cli, generation
+
+
+class Pipe(io.StringIO):
+    """A non-interactive `stdout` that records what was visible at each flush."""
+
+    def __init__(self):
+        super().__init__()
+        self.flushed = []
+
+    def isatty(self):
+        return False
+
+    def flush(self):
+        self.flushed.append(self.getvalue())
+
+
+@pytest.fixture
+def fake_stream(home, monkeypatch):
+    """Stream a response in three chunks, and record the requests."""
+    calls = []
+
+    def fake_chatgpt_request(api_key, prompt, model, stream, temperature, update_markdown_stream):
+        calls.append({"prompt": prompt, "model": model, "stream": stream})
+        if stream:
+            for chunk in ("Hello", ", ", "world!"):
+                update_markdown_stream(chunk)
+        return "Hello, world!", 0.1, object()
+
+    def fake_resolve_request(template, system, prompt_input, model, emoji):
+        return f"System prompt of {template}.", prompt_input, model
+
+    monkeypatch.setattr("lmterminal.lib.get_api_key", lambda: "key")
+    monkeypatch.setattr("lmterminal.gpt_integration.chatgpt_request", fake_chatgpt_request)
+    monkeypatch.setattr(generation, "resolve_request", fake_resolve_request)
+    return calls
+
+
+def test_stream_response_flushes_each_chunk(fake_stream, monkeypatch):
+    pipe = Pipe()
+    monkeypatch.setattr("sys.stdout", pipe)
+
+    content, _, _ = generation.stream_response("System.", "Hi", "gpt-5-nano", 1.0)
+
+    assert content == "Hello, world!\n"
+    assert pipe.flushed == ["Hello", "Hello, ", "Hello, world!", "Hello, world!\n"]
+    assert fake_stream[0]["stream"]
+
+
+def test_pipe_is_streamed_then_cached(fake_stream, monkeypatch):
+    pipe = Pipe()
+    monkeypatch.setattr("sys.stdout", pipe)
+
+    for _ in range(2):
+        cli.generate_with_cache(
+            template="define",
+            model="gpt-5-nano",
+            emoji=False,
+            prompt_input="serendipity",
+            temperature=1.0,
+            no_stream=True,
+            raw=False,
+            debug=False,
+            refresh=False,
+            to_pipe=True,
+        )
+
+    assert pipe.getvalue() == "Hello, world!\n" * 2
+    assert len(fake_stream) == 1
+
+
+@pytest.mark.parametrize("to_pipe", [False, True])
+def test_models_that_cannot_stream_are_not_streamed(fake_stream, monkeypatch, capsys, to_pipe):
+    content, _, _ = generation.generate_response("System.", "Hi", "o1-mini", 1.0, to_pipe=to_pipe)
+
+    assert content == "Hello, world!\n"
+    assert "Hello, world!" in capsys.readouterr().out
+    # Without the system message, that `o1` models reject.
+    assert fake_stream == [
+        {"prompt": [{"role": "user", "content": "Hi"}], "model": "o1-mini", "stream": False}
+    ]
+
+
+def test_stream_response_explains_authentication_errors(home, monkeypatch, capsys):
+    import httpx
+    import openai
+
+    def fake_chatgpt_request(**kwargs):
+        response = httpx.Response(401, request=httpx.Request("POST", "https://api.openai.com"))
+        raise openai.AuthenticationError("Invalid key.", response=response, body=None)
+
+    monkeypatch.setattr("lmterminal.lib.get_api_key", lambda: "key")
+    monkeypatch.setattr("lmterminal.gpt_integration.chatgpt_request", fake_chatgpt_request)
+
+    with pytest.raises(SystemExit) as excinfo:
+        generation.stream_response("System.", "Hi", "gpt-5-nano", 1.0)
+
+    assert excinfo.value.code == 1
+    assert "lmt key set" in capsys.readouterr().err
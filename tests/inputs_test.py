@@ -0,0 +1,70 @@
+import io
+
+from lmtoolbox import inputs
+
+MODEL = "gpt-5-nano"
+
+
+def test_iter_text_blocks_regular_file(tmp_path):
+    path = tmp_path / "input.txt"
+    path.write_text("é" * 10 + "end", encoding="utf-8")
+
+    with path.open(encoding="utf-8") as file:
+        # Blocks of 3 bytes cut the 2-byte characters in half.
+        blocks = list(inputs.iter_text_blocks(file, block_size=3))
+        assert file.read() == ""
+
+    assert "".join(blocks) == "é" * 10 + "end"
+    assert len(blocks) > 1
+
+
+def test_iter_text_blocks_from_current_position(tmp_path):
+    path = tmp_path / "input.txt"
+    path.write_text("skipped\nkept", encoding="utf-8")
+
+    with path.open(encoding="utf-8") as file:
+        file.readline()
+        assert "".join(inputs.iter_text_blocks(file)) == "kept"
+
+
+def test_iter_text_blocks_stream():
+    blocks = list(inputs.iter_text_blocks(io.StringIO("abcdefg"), block_size=3))
+    assert blocks == ["abc", "def", "g"]
+
+
+def test_read_bounded_within_budget(character_encoding):
+    bounded = inputs.read_bounded(["abc", "def"], 10, MODEL)
+    assert (bounded.text, bounded.tokens, bounded.exhausted) == ("abcdef", 6, True)
+
+
+def test_read_bounded_over_budget(character_encoding):
+    read = []
+
+    def blocks():
+        for block in ["abc", "def", "ghi", "jkl"]:
+            read.append(block)
+            yield block
+
+    bounded = inputs.read_bounded(blocks(), 5, MODEL)
+
+    assert (bounded.text, bounded.tokens, bounded.exhausted) == ("abcde", 5, False)
+    # The rest of the input is only read on demand.
+    assert read == ["abc", "def"]
+    assert bounded.read_all() == "abcdefghijkl"
+
+
+def test_read_bounded_without_budget(character_encoding):
+    bounded = inputs.read_bounded(["abc", "def"], None, MODEL)
+    assert (bounded.text, bounded.tokens, bounded.exhausted) == ("abcdef", None, True)
+
+
+def test_truncate_blocks(character_encoding):
+    truncated = []
+    blocks = inputs.truncate_blocks(["abc", "def", "ghi"], 4, MODEL, truncated.append)
+    assert list(blocks) == ["abc", "d"]
+    assert truncated == [4]
+
+
+def test_truncate_blocks_without_budget(character_encoding):
+    blocks = inputs.truncate_blocks(["abc", "def"], None, MODEL, on_truncate=print)
+    assert list(blocks) == ["abc", "def"]
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from lmtoolbox import cli, generation
+from lmtoolbox.templates import get_templates_dir
+
+
+@pytest.fixture
+def fake_generation(home, monkeypatch):
+    """Record the system prompts instead of sending the requests."""
+    prompts = []
+
+    def fake_generate_response(system, prompt_input, model, temperature, *args):
+        prompts.append(system)
+        return "A message.", 1.0, object()
+
+    monkeypatch.setattr(generation, "generate_response", fake_generate_response)
+    return prompts
+
+
+def run_life(*args, input=None):
+    result = CliRunner().invoke(cli.cli, ["life", *args], input=input)
+    assert result.exit_code == 0, result.output
+    return result
+
+
+def test_life_saves_the_state_apart_from_the_template(fake_generation):
+    run_life(input="Ada\n1990-12-10\n")
+    template = (get_templates_dir() / "life.yaml").read_bytes()
+    state_path = cli.get_life_state_path()
+
+    assert json.loads(state_path.read_text()) == {"name": "Ada", "date_of_birth": "1990-12-10"}
+    assert "Ada" in fake_generation[0]
+
+    # Not written again while the name and the date of birth do not change.
+    modified = state_path.stat().st_mtime_ns
+    run_life()
+    assert state_path.stat().st_mtime_ns == modified
+    assert (get_templates_dir() / "life.yaml").read_bytes() == template
+
+    run_life("--reset", input="Grace\n1906-12-09\n")
+    assert json.loads(state_path.read_text())["name"] == "Grace"
+
+
+def test_life_reads_the_state_saved_in_the_template(fake_generation):
+    cli.ensure_templates()
+    template_path = get_templates_dir() / "life.yaml"
+    template_path.write_text(
+        template_path.read_text()
+        .replace("  name:\n", "  name: Ada\n")
+        .replace("  date_of_birth:\n", "  date_of_birth: '1990-12-10'\n")
+    )
+
+    run_life()
+
+    assert "Ada" in fake_generation[0]
+    assert json.loads(cli.get_life_state_path().read_text())["date_of_birth"] == "1990-12-10"
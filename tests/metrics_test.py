@@ -0,0 +1,158 @@
+import json
+import random
+
+import pytest
+from click.testing import CliRunner
+
+from lmtoolbox import batch, cli, generation, metrics
+
+
+@pytest.fixture
+def log_path(home):
+    return metrics.get_metrics_path()
+
+
+def test_append_record_writes_one_line_per_record(log_path):
+    metrics.append_record(log_path, {"command": "define", "requests": 1})
+    metrics.append_record(log_path, {"command": "explain", "requests": 2})
+
+    records = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert records == [
+        {"command": "define", "requests": 1},
+        {"command": "explain", "requests": 2},
+    ]
+
+
+def test_log_is_rotated_and_read_in_order(log_path):
+    for index in range(10):
+        metrics.append_record(log_path, {"command": "define", "ts": index}, max_bytes=80, backups=2)
+
+    paths = metrics.get_log_paths(log_path)
+    assert [path.name for path in paths] == ["metrics.jsonl.2", "metrics.jsonl.1", "metrics.jsonl"]
+    timestamps = [record["ts"] for record in metrics.iter_records(paths)]
+    # The oldest records were dropped with the oldest file.
+    assert timestamps == sorted(timestamps)
+    assert timestamps[-1] == 9
+    assert len(timestamps) < 10
+
+
+def test_iter_records_skips_invalid_lines_and_old_records(log_path):
+    log_path.write_text(
+        '{"command": "define", "ts": 10}\nnot json\n{"ts": 20}\n{"command": "explain", "ts": 30}\n'
+    )
+
+    assert [record["command"] for record in metrics.iter_records([log_path])] == [
+        "define",
+        "explain",
+    ]
+    assert [record["ts"] for record in metrics.iter_records([log_path], since=20)] == [30]
+
+
+def test_sketch_percentiles_are_within_the_relative_accuracy():
+    values = [random.Random(index).lognormvariate(6, 1) for index in range(5000)]
+    sketch = metrics.QuantileSketch()
+    for value in values:
+        sketch.add(value)
+
+    for percent in (50, 95, 99):
+        exact = batch.percentile(values, percent)
+        assert sketch.percentile(percent) == pytest.approx(exact, rel=metrics.RELATIVE_ACCURACY)
+    assert sketch.count == len(values)
+    assert metrics.QuantileSketch().percentile(50) is None
+
+
+def test_aggregate_by_command_and_model():
+    records = [
+        {"command": "define", "model": "gpt-4o", "requests": 1, "output_tokens": 10,
+         "latency_ms": 1000},
+        {"command": "define", "model": "gpt-4o", "cache_hits": 1, "latency_ms": 100},
+        {"command": "summarize", "bytes_fetched": 2048, "latency_ms": 50, "error": True},
+    ]  # fmt: skip
+
+    aggregates = metrics.aggregate(records)
+
+    define = aggregates[("define", "gpt-4o")]
+    assert (define.invocations, define.requests, define.cache_hits) == (2, 1, 1)
+    assert define.output_tokens_per_second == pytest.approx(10 / 1.1)
+    summarize = aggregates[("summarize", "-")]
+    assert (summarize.errors, summarize.bytes_fetched) == (1, 2048)
+    assert summarize.ttft.percentile(50) is None
+
+
+def test_format_openmetrics():
+    aggregates = metrics.aggregate(
+        [{"command": "define", "model": 'gpt"4o', "requests": 1, "latency_ms": 1500}]
+    )
+
+    text = metrics.format_openmetrics(aggregates)
+
+    lines = text.splitlines()
+    assert lines[-1] == "# EOF"
+    assert "# TYPE lmtoolbox_requests counter" in lines
+    assert 'lmtoolbox_requests_total{command="define",model="gpt\\"4o"} 1' in lines
+    assert "# UNIT lmtoolbox_latency_seconds seconds" in lines
+    assert 'lmtoolbox_latency_seconds_count{command="define",model="gpt\\"4o"} 1' in lines
+    quantile = next(line for line in lines if 'quantile="0.5"' in line)
+    assert float(quantile.split()[-1]) == pytest.approx(1.5, rel=metrics.RELATIVE_ACCURACY)
+    # No time to first token was recorded.
+    assert not any(line.startswith("lmtoolbox_time_to_first_token_seconds{") for line in lines)
+
+
+@pytest.fixture
+def fake_generation(home, character_encoding, monkeypatch):
+    """Replace the template resolution and the API call of the commands piped to a file."""
+    (home / ".config" / "lmt").mkdir(parents=True)
+    (home / ".config" / "lmt" / "key.env").write_text("sk-test")
+
+    def fake_resolve_request(template, system, prompt_input, model, emoji):
+        return "Define the word.", prompt_input, model
+
+    def fake_stream_response(system, prompt_input, model, temperature, debug=False, markdown=False):
+        metrics.mark_first_token()
+        return "A happy accident.", 1.0, object()
+
+    monkeypatch.setattr(generation, "resolve_request", fake_resolve_request)
+    monkeypatch.setattr(generation, "stream_response", fake_stream_response)
+    monkeypatch.setattr("lmterminal.lib.load_config", dict)
+
+
+def test_commands_record_their_invocations(fake_generation, log_path):
+    runner = CliRunner()
+    for _ in range(2):
+        result = runner.invoke(cli.cli, ["define", "--raw", "-m", "gpt-4o", "serendipity"])
+        assert result.exit_code == 0, result.output
+
+    first, second = metrics.iter_records([log_path])
+    assert first["command"] == "define"
+    assert first["model"] == "gpt-4o"
+    assert first["requests"] == 1
+    assert first["output_tokens"] == len("A happy accident.")
+    assert first["input_tokens"] > 0
+    assert first["latency_ms"] >= first["ttft_ms"] > 0
+    # The second response is replayed from the cache.
+    assert second["cache_hits"] == 1
+    assert "requests" not in second
+
+    result = runner.invoke(cli.cli, ["stats"])
+    assert result.exit_code == 0
+    assert "define" in result.output and "gpt-4o" in result.output
+
+    result = runner.invoke(cli.cli, ["stats", "--format", "openmetrics"])
+    assert 'lmtoolbox_cache_hits_total{command="define",model="gpt-4o"} 1' in result.output
+
+
+def test_commands_without_requests_are_not_recorded(home, log_path):
+    result = CliRunner().invoke(cli.cli, ["stats"])
+
+    assert result.exit_code == 0
+    assert "No invocation recorded yet." in result.stderr
+    assert not log_path.exists()
+
+
+def test_metrics_can_be_disabled(fake_generation, log_path, monkeypatch):
+    monkeypatch.setattr("lmterminal.lib.load_config", lambda: {"metrics": {"enabled": False}})
+
+    result = CliRunner().invoke(cli.cli, ["define", "--raw", "serendipity"])
+
+    assert result.exit_code == 0, result.output
+    assert not log_path.exists()
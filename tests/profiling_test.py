@@ -0,0 +1,120 @@
+import json
+import sys
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from lmtoolbox import cli, profiling
+
+
+@pytest.fixture
+def profiler():
+    profiler = profiling.enable()
+    yield profiler
+    profiler.stop()
+    profiling._profiler = None
+
+
+def test_span_is_a_no_op_when_profiling_is_off():
+    assert not profiling.is_enabled()
+    assert profiling.span("fetch") is profiling.span("extraction")
+    with profiling.span("fetch"):
+        pass
+    profiling.record("first_token", time.perf_counter())
+
+
+def test_nested_spans_are_excluded_from_self_time(profiler):
+    with profiling.span("outer"):
+        time.sleep(0.02)
+        with profiling.span("inner"):
+            time.sleep(0.02)
+
+    spans = {span.name: span for span in profiler.spans}
+    assert spans["outer"].duration >= 0.04
+    assert spans["outer"].self_time == pytest.approx(
+        spans["outer"].duration - spans["inner"].duration
+    )
+
+
+def test_record_excludes_the_spans_in_its_window(profiler):
+    started = time.perf_counter()
+    with profiling.span("imports"):
+        time.sleep(0.02)
+    profiling.record("first_token", started)
+
+    spans = {span.name: span for span in profiler.spans}
+    assert spans["first_token"].self_time == pytest.approx(
+        spans["first_token"].duration - spans["imports"].duration
+    )
+
+
+def test_traced_function(profiler):
+    @profiling.traced("token_counting")
+    def count(text):
+        return len(text)
+
+    assert count("abc") == 3
+    assert [span.name for span in profiler.spans].count("token_counting") == 1
+
+
+def test_breakdown_adds_up_to_the_duration(profiler):
+    with profiling.span("fetch"):
+        time.sleep(0.01)
+    time.sleep(0.01)
+
+    breakdown = {
+        name: (count, total, self_time) for name, count, total, self_time in profiler.breakdown()
+    }
+    assert breakdown["fetch"][0] == 1
+    assert "other" in breakdown
+    elapsed = time.perf_counter() - profiler.started
+    assert sum(self_time for _, _, self_time in breakdown.values()) == pytest.approx(
+        elapsed, rel=0.05
+    )
+    assert "fetch" in profiler.format()
+
+
+def test_chrome_trace(profiler, tmp_path):
+    with profiling.span("fetch"):
+        pass
+    path = tmp_path / "trace.json"
+
+    profiler.write(path)
+
+    events = json.loads(path.read_text())["traceEvents"]
+    assert {"startup", "fetch"} <= {event["name"] for event in events}
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+
+
+def test_profile_option(home, tmp_path):
+    trace = tmp_path / "trace.json"
+
+    result = CliRunner().invoke(
+        cli.cli, ["--profile", "--profile-output", str(trace), "cache", "stats"]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Profile:" in result.stderr
+    assert "startup" in result.stderr
+    assert json.loads(trace.read_text())["traceEvents"]
+    assert not profiling.is_enabled()
+
+
+def test_profile_environment_variable(home, monkeypatch):
+    monkeypatch.setenv(profiling.PROFILE_ENV, "1")
+
+    result = CliRunner().invoke(cli.cli, ["cache", "stats"])
+
+    assert result.exit_code == 0, result.output
+    assert "Profile:" in result.stderr
+    assert profiling.is_requested()
+
+
+@pytest.mark.parametrize("value", ["", "0", "false", "No", "off"])
+def test_profile_environment_variable_off(value, monkeypatch):
+    monkeypatch.setenv(profiling.PROFILE_ENV, value)
+    monkeypatch.delenv(profiling.PROFILE_OUTPUT_ENV, raising=False)
+    monkeypatch.setattr(sys, "argv", ["summarize", "text"])
+
+    assert not profiling.is_requested()
@@ -0,0 +1,119 @@
+import io
+import random
+
+import pytest
+from rich.console import Console
+from rich.markdown import Markdown
+
+from lmtoolbox.rendering import MarkdownStream, get_list_marker
+
+RESPONSE = """# Review
+
+Some **intro** paragraph
+that wraps over two lines.
+
+## Findings
+
+1. First item
+2. Second item with `code`
+   continued lazily
+
+3. Loose third item
+
+- bullet a
+- bullet b
+  - nested
+* another list
+
+```python
+def f():
+
+    return 1
+```
+After the fence.
+
+> quoted
+text
+
+| a | b |
+|---|---|
+| 1 | 2 |
+
+---
+Final words.
+    indented continuation
+"""
+
+
+def render_at_once(text: str) -> list[str]:
+    console = Console(file=io.StringIO(), width=70)
+    console.print(Markdown(text))
+    return normalize(console.file.getvalue())
+
+
+def render_streamed(text: str, seed: int) -> tuple[list[str], MarkdownStream]:
+    console = Console(file=io.StringIO(), width=70)
+    chunks = random.Random(seed)
+    position = 0
+    with MarkdownStream(console, refresh_per_second=None) as stream:
+        while position < len(text):
+            size = chunks.randint(1, 12)
+            stream.write(text[position : position + size])
+            position += size
+    return normalize(console.file.getvalue()), stream
+
+
+def normalize(output: str) -> list[str]:
+    # The live display does not pad its last lines.
+    return [line.rstrip() for line in output.rstrip("\n").splitlines()]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        RESPONSE,
+        "para\n\n---\n\n# Title\n- a\n- b\n\n1. x\n\ntext\n",
+        "a\n\n\n\nb\n\n> first quote\n\n> second quote\n",
+        "- a\n\n  paragraph of a\n- b\n\n```\nx\n```\n\n~~~~\n```\n~~~~\n",
+        "```\nunclosed\n\nstill code",
+    ],
+)
+def test_streamed_output_is_the_same_as_rendering_at_once(text):
+    expected = render_at_once(text)
+    for seed in range(10):
+        assert render_streamed(text, seed)[0] == expected
+
+
+def test_finished_blocks_are_committed_as_they_arrive():
+    console = Console(file=io.StringIO(), width=70)
+    with MarkdownStream(console, refresh_per_second=None) as stream:
+        stream.write("# Title\n\nA paragraph")
+        assert stream.committed_blocks == 1
+        assert stream.get_open_block() == "A paragraph"
+
+        stream.write(" that ends.\n\n- a\n")
+        assert stream.committed_blocks == 2
+        stream.write("- b\n")
+        assert stream.committed_blocks == 3
+        assert stream.get_open_block() == "- b\n"
+
+
+def test_code_blocks_are_not_split_on_blank_lines():
+    console = Console(file=io.StringIO(), width=70)
+    with MarkdownStream(console, refresh_per_second=None) as stream:
+        stream.write("```\nfirst\n\nsecond\n")
+        assert stream.committed_blocks == 0
+        stream.write("```\n")
+        assert stream.committed_blocks == 1
+
+
+@pytest.mark.parametrize(
+    ("line", "marker"),
+    [("- item", "-"), ("* item", "*"), ("12. item", "."), ("3) item", ")"), ("-item", None)],
+)
+def test_get_list_marker(line, marker):
+    assert get_list_marker(line) == marker
+
+
+def test_thematic_break_is_not_a_list_item():
+    assert get_list_marker("- - -") is None
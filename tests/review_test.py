@@ -0,0 +1,244 @@
+import subprocess
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from lmtoolbox import cli, generation, review
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "app.py").write_text("def main():\n    pass\n")
+    (tmp_path / "src" / "utils.py").write_text("def helper():\n    return 1\n")
+    (tmp_path / "src" / "style.css").write_text("body { margin: 0; }\n")
+    (tmp_path / "src" / "logo.png").write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00")
+    (tmp_path / "node_modules").mkdir()
+    (tmp_path / "node_modules" / "library.py").write_text("x = 1\n")
+    (tmp_path / ".venv").mkdir()
+    (tmp_path / ".venv" / "site.py").write_text("x = 1\n")
+    (tmp_path / "poetry.lock").write_text("[[package]]\n")
+    return tmp_path
+
+
+def test_collect_directory(project):
+    targets = review.collect_targets([str(project)], patterns=["*.py"])
+    assert [target.path for target in targets] == [
+        str(project / "src" / "app.py"),
+        str(project / "src" / "utils.py"),
+    ]
+
+    targets = review.collect_targets([str(project)])
+    assert [target.path for target in targets] == [
+        str(project / "src" / "app.py"),
+        str(project / "src" / "style.css"),
+        str(project / "src" / "utils.py"),
+    ]
+
+
+def test_collect_invalid_argument(project):
+    with pytest.raises(review.ReviewError, match="binary"):
+        review.collect_targets([str(project / "src" / "logo.png")])
+    with pytest.raises(review.ReviewError, match="not a file"):
+        review.collect_targets([str(project / "missing.py")])
+
+
+def test_collect_revision_range(tmp_path, monkeypatch):
+    def git(*args):
+        subprocess.run(
+            ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+            cwd=tmp_path,
+            check=True,
+            capture_output=True,
+        )
+
+    git("init", "-q")
+    (tmp_path / "app.py").write_text("def main():\n    pass\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "First commit")
+    git("branch", "base")
+    (tmp_path / "app.py").write_text("def main():\n    print('Hello!')\n")
+    (tmp_path / "README.md").write_text("# App\n")
+    (tmp_path / "uv.lock").write_text("version = 1\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "Second commit")
+    monkeypatch.chdir(tmp_path)
+
+    targets = review.collect_targets(["base..HEAD"], patterns=["*.py"])
+
+    assert [(target.path, target.revisions) for target in targets] == [("app.py", "base..HEAD")]
+    assert "+    print('Hello!')" in targets[0].text
+    assert [target.path for target in review.collect_targets(["base..HEAD"])] == [
+        "README.md",
+        "app.py",
+    ]
+
+
+def test_split_target(character_encoding):
+    text = "".join(f"line {index:03}\n" for index in range(100))
+
+    items = review.split_target(review.Target("big.py", text), max_tokens=300, model="gpt-4o")
+
+    assert [item.name for item in items] == [f"big.py (part {index}/4)" for index in range(1, 5)]
+    assert items[0].prompt.startswith("Part 1 of 4 of the file `big.py`:\n\nline 000\n")
+    assert all(len(item.prompt) < 300 + 50 for item in items)
+
+    (item,) = review.split_target(review.Target("small.py", "x = 1\n"), 300, "gpt-4o")
+    assert (item.name, item.prompt) == ("small.py", "File `small.py`:\n\nx = 1\n")
+
+
+def test_review_items_in_completion_order():
+    items = [review.ReviewItem(name, name) for name in ("slow", "error", "fast")]
+
+    def reviewer(prompt):
+        if prompt == "error":
+            raise ValueError("Failed.")
+        time.sleep(0.1 if prompt == "slow" else 0)
+        return f"Review of {prompt}"
+
+    results = list(review.review_items(items, reviewer, workers=3))
+
+    assert results[-1] == (items[0], "Review of slow", None)
+    assert {item.name for item, _, _ in results} == {"slow", "error", "fast"}
+    assert isinstance({item.name: error for item, _, error in results}["error"], ValueError)
+
+
+def test_codereview_several_files(project, home, monkeypatch):
+    def fake_complete(template, prompt_input, model, temperature, emoji=False):
+        return f"Review of {prompt_input.splitlines()[0]}"
+
+    overviews = []
+
+    def fake_process_command(ctx, template, model, emoji, prompt_input, *args):
+        overviews.append(prompt_input)
+
+    monkeypatch.setattr(generation, "complete", fake_complete)
+    monkeypatch.setattr(cli, "process_command", fake_process_command)
+
+    result = CliRunner().invoke(cli.codereview, [str(project / "src"), "--include", "*.py"])
+
+    assert result.exit_code == 0, result.output
+    assert f"Review of File `{project / 'src' / 'app.py'}`:" in result.stdout
+    assert "Overview" in result.stdout
+    assert overviews[0].index("app.py") < overviews[0].index("utils.py")
+
+
+PYTHON_FILE = """import os
+
+CONSTANT = 1
+
+
+@decorator
+def first():
+    return 1
+
+
+class Small:
+    value = 2
+
+
+async def second():
+    return 2
+"""
+
+
+def test_split_python_blocks():
+    blocks = review.split_blocks("module.py", PYTHON_FILE)
+
+    assert [(block.name, block.start, block.end) for block in blocks] == [
+        ("module code", 1, 5),
+        ("def first", 6, 8),
+        ("class Small", 11, 12),
+        ("def second", 15, 16),
+    ]
+
+
+def test_split_large_class_by_method(monkeypatch):
+    monkeypatch.setattr(review, "HUNK_LINES", 3)
+    text = "class Large:\n    x = 1\n\n    def a(self):\n        pass\n\n    def b(self):\n        pass\n"
+
+    blocks = review.split_blocks("module.py", text)
+
+    assert [block.name for block in blocks] == ["class Large", "def Large.a", "def Large.b"]
+
+
+def test_split_hunks_at_top_level_boundaries(monkeypatch):
+    monkeypatch.setattr(review, "HUNK_LINES", 4)
+    paragraphs = ["a {\n  x: 1;\n}\n"] * 4
+    text = "\n".join(paragraphs)
+
+    blocks = review.split_blocks("style.css", text)
+    assert [(block.start, block.end) for block in blocks] == [(1, 4), (5, 8), (9, 12), (13, 15)]
+
+    # Inserting a line only changes the hunk where it is.
+    edited = text.replace("  x: 1;\n", "  x: 1;\n  y: 2;\n", 1)
+    edited_blocks = review.split_blocks("style.css", edited)
+    assert [block.text for block in edited_blocks[1:]] == [block.text for block in blocks[1:]]
+
+
+def test_split_invalid_python_falls_back_to_hunks():
+    blocks = review.split_blocks("broken.py", "def broken(:\n    pass\n")
+    assert [block.name for block in blocks] == ["hunk"]
+
+
+def test_block_prompt_has_context(monkeypatch):
+    monkeypatch.setattr(review, "CONTEXT_LINES", 1)
+    block = review.split_blocks("module.py", PYTHON_FILE)[1]
+
+    prompt = review.get_block_prompt("module.py", block, PYTHON_FILE.splitlines(keepends=True))
+
+    assert "def first, lines 6 to 8" in prompt
+    assert "Before, for context:\n```\n\n```" not in prompt
+    assert "To review:\n```\n@decorator\ndef first():\n    return 1\n```" in prompt
+    assert "After, for context:" not in prompt
+
+
+def test_codereview_incremental(tmp_path, home, monkeypatch):
+    prompts = []
+
+    def fake_complete(template, prompt_input, model, temperature, emoji=False):
+        prompts.append(prompt_input)
+        return f"Review of {prompt_input.splitlines()[0].split(': ')[1]}"
+
+    monkeypatch.setattr(generation, "complete", fake_complete)
+    monkeypatch.setattr(
+        generation,
+        "resolve_request",
+        lambda template, system, prompt_input, model, emoji: ("Review code.", prompt_input, model),
+    )
+    module = tmp_path / "module.py"
+    module.write_text(PYTHON_FILE)
+
+    result = CliRunner().invoke(cli.codereview, ["--incremental", str(module)])
+
+    assert result.exit_code == 0, result.output
+    assert len(prompts) == 4
+    assert "Reviewed 4 changed blocks of 4 (0 from the index)." in result.stderr
+    assert "### def first (lines 6-8)\n\nReview of def first, lines 6 to 8." in result.stdout
+
+    prompts.clear()
+    module.write_text(PYTHON_FILE.replace("return 2", "return 3"))
+    result = CliRunner().invoke(cli.codereview, ["--incremental", str(module)])
+
+    assert result.exit_code == 0, result.output
+    assert len(prompts) == 1
+    assert "async def second():\n    return 3" in prompts[0]
+    assert "Reviewed 1 changed blocks of 4 (3 from the index)." in result.stderr
+    assert "Review of def first, lines 6 to 8." in result.stdout
+    assert result.stdout.index("def first") < result.stdout.index("def second")
+
+    prompts.clear()
+    result = CliRunner().invoke(cli.codereview, ["--incremental", "--refresh", str(module)])
+    assert len(prompts) == 4
+
+
+def test_codereview_incremental_rejects_revision_ranges(monkeypatch):
+    monkeypatch.setattr(
+        review, "collect_targets", lambda *args: [review.Target("a.py", "", "a..b")]
+    )
+
+    result = CliRunner().invoke(cli.codereview, ["--incremental", "a..b"])
+
+    assert result.exit_code == 2
+    assert "does not support revision ranges" in result.output
@@ -0,0 +1,137 @@
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from lmtoolbox import cli, generation, sources, video_summarization
+
+
+@pytest.mark.parametrize(
+    "argument, expected",
+    [
+        ("https://www.youtube.com/watch?v=dQw4w9WgXcQ", sources.VIDEO),
+        ("https://example.com/article", sources.WEB_PAGE),
+        ("some text to summarize", None),
+    ],
+)
+def test_classify(argument, expected):
+    assert sources.classify(argument) == expected
+
+
+def test_classify_file(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("Notes.")
+    assert sources.classify(str(path)) == sources.FILE
+
+
+def test_load_file(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("Notes.")
+
+    source = sources.load_source(str(path))
+    assert (source.kind, source.text, source.template) == (sources.FILE, "Notes.", "summarize")
+
+
+def test_load_invalid_source():
+    with pytest.raises(sources.SourceError):
+        sources.load_source("not a source")
+
+
+@pytest.fixture
+def video_without_transcript(home, monkeypatch):
+    def fake_get_transcript(url):
+        raise video_summarization.TranscriptUnavailable(url)
+
+    monkeypatch.setattr(video_summarization, "get_transcript", fake_get_transcript)
+    return "https://youtu.be/_Tp8HQ7eVx0"
+
+
+def test_load_video_without_transcript(video_without_transcript, capsys):
+    with pytest.raises(sources.SourceError, match="has no transcript"):
+        sources.load_source(video_without_transcript)
+    # Nothing is printed from the worker threads: the caller reports the error.
+    assert capsys.readouterr().err == ""
+
+
+def test_summarize_video_without_transcript(video_without_transcript):
+    result = CliRunner().invoke(cli.summarize, [video_without_transcript])
+
+    assert result.exit_code == 1
+    assert "No transcripts available for this video." in result.stderr
+    assert "Possible reasons" in result.stderr
+
+
+def test_map_in_order():
+    def function(argument):
+        if argument == "error":
+            raise ValueError("Failed.")
+        # The first arguments take the longest.
+        time.sleep(0.01 * (3 - len(argument)))
+        return argument.upper()
+
+    results = list(sources.map_in_order(function, ["a", "error", "bc"], workers=3))
+
+    assert [(argument, result) for argument, result, _ in results] == [
+        ("a", "A"),
+        ("error", None),
+        ("bc", "BC"),
+    ]
+    assert isinstance(results[1][2], ValueError)
+
+
+def test_summarize_several_files(home, tmp_path, monkeypatch):
+    paths = []
+    for name in ("first", "second"):
+        path = tmp_path / f"{name}.txt"
+        path.write_text(f"The {name} document.")
+        paths.append(str(path))
+
+    def fake_complete(template, prompt_input, model, temperature, emoji=False):
+        return f"Summary of: {prompt_input}"
+
+    digests = []
+
+    def fake_process_command(ctx, template, model, emoji, prompt_input, *args):
+        digests.append(prompt_input)
+
+    monkeypatch.setattr(generation, "complete", fake_complete)
+    monkeypatch.setattr(cli, "process_command", fake_process_command)
+
+    result = CliRunner().invoke(cli.summarize, [*paths, "--digest"])
+
+    assert result.exit_code == 0, result.output
+    assert result.stdout.index("first.txt") < result.stdout.index("Summary of: The first")
+    assert result.stdout.index("Summary of: The first") < result.stdout.index("second.txt")
+    assert "[2/2] done" in result.stderr
+    assert "Source: " in digests[0]
+    assert "Summary of: The second document." in digests[0]
+
+    # A missing file is not a source: the arguments are summarized as text.
+    CliRunner().invoke(cli.summarize, [*paths, str(tmp_path / "missing.txt")])
+    assert "missing.txt" in digests[1]
+
+
+def test_expand_sources(tmp_path, monkeypatch):
+    video_list = tmp_path / "videos.txt"
+    video_list.write_text("# Talks\nhttps://youtu.be/aaaaaaaaaaa\n\nhttps://youtu.be/bbbbbbbbbbb\n")
+    document = tmp_path / "notes.txt"
+    document.write_text("https://youtu.be/aaaaaaaaaaa\nNot a video.\n")
+
+    monkeypatch.setattr(
+        "lmtoolbox.video_summarization.get_playlist_videos",
+        lambda url: ["https://www.youtube.com/watch?v=ccccccccccc"],
+    )
+
+    arguments, errors = sources.expand_sources(
+        [str(video_list), "https://www.youtube.com/playlist?list=PL123", str(document)]
+    )
+
+    assert arguments == [
+        "https://youtu.be/aaaaaaaaaaa",
+        "https://youtu.be/bbbbbbbbbbb",
+        "https://www.youtube.com/watch?v=ccccccccccc",
+        str(document),
+    ]
+    assert errors == []
+    assert sources.is_collection(str(video_list))
+    assert not sources.is_collection(str(document))
@@ -0,0 +1,91 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BENCHMARK_SCRIPT = Path(__file__).parent.parent / "benchmarks/startup.py"
+
+HEAVY_MODULES = [
+    "lmterminal.lib",
+    "lmterminal.templates",
+    "openai",
+    "requests",
+    "strip_tags",
+    "tiktoken",
+    "validators",
+    "yaml",
+    "youtube_transcript_api",
+]
+
+
+def imported_modules(code: str) -> set[str]:
+    """Run `code` in a fresh interpreter, and return the heavy modules it imported."""
+    check = (
+        f"{code}\n"
+        "import sys\n"
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules), file=sys.stderr)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", check], check=True, capture_output=True, text=True
+    )
+    return set(result.stderr.split())
+
+
+def test_cli_import_is_lazy():
+    assert imported_modules("import lmtoolbox.cli") == set()
+
+
+def test_help_is_lazy():
+    code = (
+        "from lmtoolbox.cli import summarize\n"
+        "try:\n"
+        "    summarize(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass"
+    )
+    assert imported_modules(code) == set()
+
+
+def test_compiled_templates_are_loaded_without_yaml(home):
+    from lmtoolbox import templates
+
+    templates.sync_templates()
+    templates.list_templates()
+
+    # The environment, with the isolated home directory, is inherited.
+    code = "from lmtoolbox import templates\ntemplates.get_template('define')"
+    assert imported_modules(code) == set()
+
+
+def test_help_only_parses_the_new_templates(home):
+    from lmtoolbox import templates
+
+    templates.sync_templates()
+    templates.list_templates()
+    (templates.get_templates_dir() / "haiku.yaml").write_text("system: Write a haiku.\n")
+
+    code = "from lmtoolbox.cli import cli\ntry:\n    cli(['--help'])\nexcept SystemExit:\n    pass"
+    assert imported_modules(code) == {"yaml"}
+    # The new template was compiled for its help, and is now in the index.
+    assert imported_modules(code) == set()
+
+
+def test_youtube_transcript_api_is_imported_on_demand():
+    assert imported_modules("import lmtoolbox.video_summarization") == set()
+
+
+@pytest.mark.benchmark
+def test_startup_budget():
+    """
+    Fail when the cold start of the console scripts regresses past the budgets.
+
+    Run `python benchmarks/startup.py` for the detailed report.
+    """
+    result = subprocess.run(
+        [sys.executable, str(BENCHMARK_SCRIPT), "--runs", "3"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
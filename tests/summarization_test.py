@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from lmtoolbox import summarization
+from lmtoolbox.summarization import map_reduce, summarize_chunks
+
+MODEL = "gpt-5-nano"
+
+
+def test_summarize_chunks_keeps_the_order():
+    def summarizer(prompt):
+        # The first chunks finish last.
+        time.sleep(0.05 if "part 1 " in prompt else 0)
+        return prompt.split("\n\n", 1)[1].upper()
+
+    summaries = summarize_chunks(["a", "b", "c"], summarizer, workers=3)
+    assert summaries == ["A", "B", "C"]
+
+
+def test_summarize_chunks_is_bounded_by_workers():
+    running = 0
+    max_running = 0
+    lock = threading.Lock()
+
+    def summarizer(prompt):
+        nonlocal running, max_running
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.01)
+        with lock:
+            running -= 1
+        return "summary"
+
+    summarize_chunks([str(index) for index in range(12)], summarizer, workers=3)
+    assert max_running <= 3
+
+
+def test_map_reduce_without_chunking(character_encoding):
+    def summarizer(prompt):
+        pytest.fail("A short input must not be summarized in chunks.")
+
+    assert map_reduce(["short", "input"], summarizer, MODEL, chunk_tokens=100) == "short\n\ninput"
+
+
+def test_map_reduce_summarizes_each_chunk(character_encoding, capsys):
+    prompts = []
+
+    def summarizer(prompt):
+        prompts.append(prompt)
+        return "S"
+
+    segments = ["x" * 80, "y" * 80, "z" * 80]
+    combined = map_reduce(segments, summarizer, MODEL, chunk_tokens=150, workers=2)
+
+    assert len(prompts) == 3
+    assert "This is part 1 of a longer document." in prompts[0]
+    assert combined.endswith("S\n\nS\n\nS")
+    assert "Summarized 3 chunks of up to 150 tokens with 2 workers (level 1)." in (
+        capsys.readouterr().err
+    )
+
+
+def test_map_reduce_is_hierarchical(character_encoding, monkeypatch, capsys):
+    monkeypatch.setattr(summarization, "REDUCE_PROMPT", "{summaries}")
+
+    def summarizer(prompt):
+        # Summaries of the first level are still too long to be combined at once.
+        return "s" * 100 if "part" in prompt and "x" in prompt else "t"
+
+    segments = ["x" * 200] * 6
+    combined = map_reduce(segments, summarizer, MODEL, chunk_tokens=300, workers=4)
+
+    assert "level 2" in capsys.readouterr().err
+    assert set(combined.replace("\n", "")) == {"t"}
@@ -0,0 +1,293 @@
+import json
+import os
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from lmtoolbox import cli, daemon, templates
+from lmtoolbox.templates import (
+    BUNDLED_TEMPLATES_DIR,
+    ensure_templates,
+    get_manifest_path,
+    get_templates_dir,
+    is_manifest_stale,
+    load_manifest,
+    sync_templates,
+)
+
+BUNDLED_NAMES = sorted(path.stem for path in BUNDLED_TEMPLATES_DIR.glob("*.yaml"))
+
+
+def test_sync_installs_all_templates(home):
+    changed = sync_templates()
+
+    assert changed == BUNDLED_NAMES
+    for name in BUNDLED_NAMES:
+        assert (get_templates_dir() / f"{name}.yaml").exists()
+
+    config = json.loads((home / ".config/lmt/config.json").read_text())
+    assert sorted(config["tools"]) == BUNDLED_NAMES
+
+
+def test_sync_is_incremental(home):
+    sync_templates()
+    assert sync_templates() == []
+
+
+def test_sync_reinstalls_deleted_template(home):
+    sync_templates()
+    (get_templates_dir() / "define.yaml").unlink()
+
+    assert is_manifest_stale(load_manifest())
+    assert sync_templates() == ["define"]
+
+
+def test_sync_keeps_local_changes(home):
+    sync_templates()
+    local_template = get_templates_dir() / "define.yaml"
+    local_template.write_text("system: My own definition prompt.\n")
+
+    # Simulate an upgrade of the bundled templates.
+    manifest = load_manifest()
+    manifest["templates"]["define"] = "outdated"
+    get_manifest_path().write_text(json.dumps(manifest))
+
+    assert "define" not in sync_templates()
+    assert local_template.read_text() == "system: My own definition prompt.\n"
+
+    assert "define" in sync_templates(force=True)
+    assert local_template.read_bytes() == (BUNDLED_TEMPLATES_DIR / "define.yaml").read_bytes()
+
+
+def test_sync_upgrades_unmodified_template(home):
+    sync_templates()
+    local_template = get_templates_dir() / "define.yaml"
+    local_template.write_text("system: Previous bundled version.\n")
+
+    # The manifest says we installed the previous version: it is safe to upgrade.
+    manifest = load_manifest()
+    manifest["templates"]["define"] = templates.hashlib.sha256(
+        local_template.read_bytes()
+    ).hexdigest()
+    get_manifest_path().write_text(json.dumps(manifest))
+
+    assert sync_templates() == ["define"]
+
+
+def test_sync_follows_bundled_templates_updated_in_place(home, tmp_path, monkeypatch):
+    import shutil
+
+    bundled_dir = tmp_path / "bundled"
+    shutil.copytree(BUNDLED_TEMPLATES_DIR, bundled_dir)
+    monkeypatch.setattr(templates, "BUNDLED_TEMPLATES_DIR", bundled_dir)
+    sync_templates()
+
+    # An upgrade that rewrites a file, but keeps the inode and the mtime of the directory.
+    directory_stat = bundled_dir.stat()
+    (bundled_dir / "define.yaml").write_text("system: The new bundled version.\n")
+    os.utime(bundled_dir, ns=(directory_stat.st_atime_ns, directory_stat.st_mtime_ns))
+
+    assert is_manifest_stale(load_manifest())
+    ensure_templates()
+    assert (get_templates_dir() / "define.yaml").read_text() == (
+        "system: The new bundled version.\n"
+    )
+
+
+def test_sync_preserves_existing_config(home):
+    config_file = home / ".config/lmt/config.json"
+    config_file.parent.mkdir(parents=True)
+    config_file.write_text(json.dumps({"code_block_theme": "monokai"}))
+
+    sync_templates()
+
+    config = json.loads(config_file.read_text())
+    assert config["code_block_theme"] == "monokai"
+    assert "define" in config["tools"]
+
+
+def test_ensure_templates_skips_sync_when_up_to_date(home, monkeypatch):
+    ensure_templates()
+
+    def fail_sync(*args, **kwargs):
+        pytest.fail("`sync_templates()` should not be called when the manifest is up to date.")
+
+    monkeypatch.setattr(templates, "sync_templates", fail_sync)
+    ensure_templates()
+
+
+def test_ensure_templates_syncs_without_manifest(home):
+    ensure_templates()
+    get_manifest_path().unlink()
+
+    ensure_templates()
+
+    assert not is_manifest_stale(load_manifest())
+
+
+@pytest.fixture
+def yaml_loads(monkeypatch):
+    """Count the templates parsed with the YAML parser."""
+    import yaml
+
+    parsed = []
+    safe_load = yaml.safe_load
+
+    def counting_safe_load(stream):
+        parsed.append(stream)
+        return safe_load(stream)
+
+    monkeypatch.setattr(yaml, "safe_load", counting_safe_load)
+    return parsed
+
+
+def test_get_template_is_compiled_once(home, yaml_loads):
+    sync_templates()
+
+    define = templates.get_template("define")
+    assert define["system"]
+    assert templates.get_index_path().exists()
+
+    # Loaded again from the index, without the YAML parser.
+    templates._loaded_index = None
+    assert templates.get_template("define") == define
+    assert len(yaml_loads) == 1
+
+
+def test_get_template_is_compiled_again_when_it_changes(home, yaml_loads):
+    sync_templates()
+    templates.get_template("define")
+
+    (get_templates_dir() / "define.yaml").write_text("system: My own definition prompt.\n")
+
+    assert templates.get_template("define") == {"system": "My own definition prompt."}
+    assert len(yaml_loads) == 2
+
+
+def test_get_missing_template(home):
+    with pytest.raises(click.ClickException, match="'nonexistent' does not exist"):
+        templates.get_template("nonexistent")
+
+
+def test_get_template_returns_a_copy(home):
+    sync_templates()
+    templates.get_template("life")["user_info"]["name"] = "Ada"
+
+    assert templates.get_template("life")["user_info"]["name"] is None
+
+
+def test_list_templates_follows_the_templates_directory(home, yaml_loads):
+    sync_templates()
+    assert sorted(templates.list_templates()) == BUNDLED_NAMES
+    assert len(yaml_loads) == len(BUNDLED_NAMES)
+
+    (get_templates_dir() / "haiku.yaml").write_text("system: Write a haiku.\nmodel: gpt-4o\n")
+    (get_templates_dir() / "define.yaml").unlink()
+
+    listed = templates.list_templates()
+    assert listed["haiku"] == {"system": "Write a haiku.", "model": "gpt-4o"}
+    assert "define" not in listed
+    # Only the new template was parsed.
+    assert len(yaml_loads) == len(BUNDLED_NAMES) + 1
+
+
+def test_resolve_request_matches_lmterminal(home, monkeypatch):
+    import lmterminal.templates
+
+    from lmtoolbox.generation import resolve_request
+
+    sync_templates()
+    monkeypatch.setattr(lmterminal.templates, "TEMPLATES_DIR", get_templates_dir())
+
+    for name in BUNDLED_NAMES:
+        expected = lmterminal.templates.handle_template(name, "", "some input", "gpt-4o")
+        system, prompt_input, _ = resolve_request(name, "", "some input", "gpt-4o", False)
+        assert (system, prompt_input) == expected[:2]
+
+
+def test_list_template_names_does_not_parse_templates(home, yaml_loads):
+    assert templates.list_template_names() == []
+
+    sync_templates()
+    (get_templates_dir() / "haiku.yaml").write_text("system: Write a haiku.\n")
+
+    assert templates.list_template_names() == sorted([*BUNDLED_NAMES, "haiku"])
+    assert yaml_loads == []
+
+
+@pytest.mark.parametrize("name", ["define", "haiku", "", ".hidden", "../templates/define"])
+def test_template_exists(home, name):
+    sync_templates()
+    (get_templates_dir() / ".hidden.yaml").write_text("system: Hidden.\n")
+
+    assert templates.template_exists(name) == (name == "define")
+
+
+@pytest.fixture
+def commands(home, monkeypatch):
+    """Record the templates and the inputs sent by the commands."""
+    sent = []
+
+    def fake_process_command(ctx, template, model, emoji, prompt_input, *args):
+        sent.append((template, prompt_input))
+
+    monkeypatch.setattr(cli, "process_command", fake_process_command)
+    sync_templates()
+    return sent
+
+
+def test_installed_templates_are_commands(commands):
+    (get_templates_dir() / "haiku.yaml").write_text(
+        "description: Write a haiku about the input.\nsystem: Write a haiku.\n"
+    )
+    (get_templates_dir() / "shout.yaml").write_text("system: Shout.\n")
+    runner = CliRunner()
+
+    result = runner.invoke(cli.cli, ["--help"])
+    assert "haiku        Write a haiku about the input." in result.output
+    assert "shout        Send the input, from the arguments or stdin, to the" in result.output
+    assert "define       Get a definition for a word." in result.output
+    assert "video_summarization" not in result.output
+
+    result = runner.invoke(cli.cli, ["haiku", "the", "sea"])
+    assert result.exit_code == 0, result.output
+    assert runner.invoke(cli.cli, ["define", "serendipity"]).exit_code == 0
+    assert commands == [("haiku", ("the", "sea")), ("define", ("serendipity",))]
+
+
+def test_internal_and_missing_templates_are_not_commands(commands):
+    for name in ["video_summarization", "haiku", "../templates/define"]:
+        result = CliRunner().invoke(cli.cli, [name])
+        assert result.exit_code == 2
+        assert "No such command" in result.output
+    assert commands == []
+
+
+def test_template_commands_are_console_scripts(commands):
+    result = CliRunner().invoke(cli.define, ["--help"])
+    assert "[WORD]..." in result.output
+    assert "Get a definition for a word." in result.output
+
+    with pytest.raises(AttributeError):
+        cli.haiku  # noqa: B018
+
+
+def test_daemon_runs_installed_templates(commands):
+    (get_templates_dir() / "haiku.yaml").write_text("system: Write a haiku.\n")
+
+    assert daemon._run("haiku", ["the", "sea"], "lmtoolbox") == 0
+    assert commands == [("haiku", ("the", "sea"))]
+
+
+def test_template_commands_are_completed(commands):
+    (get_templates_dir() / "haiku.yaml").write_text(
+        "description: Write a haiku about the input.\nsystem: Write a haiku.\n"
+    )
+    ctx = cli.cli.make_context("lmtoolbox", [], resilient_parsing=True)
+
+    completions = cli.cli.shell_complete(ctx, "h")
+
+    assert [(item.value, item.help) for item in completions] == [
+        ("haiku", "Write a haiku about the input.")
+    ]
@@ -1,14 +1,24 @@
 import pytest
 from youtube_transcript_api import NoTranscriptFound, TranscriptsDisabled
 
+from lmtoolbox import fetch
 from lmtoolbox.video_summarization import (
     YOUTUBE_URL_PATTERN,
+    TranscriptUnavailable,
+    exit_transcripts_disabled,
     format_transcript,
+    get_playlist_videos,
     get_transcript,
+    is_youtube_playlist,
     is_youtube_video,
 )
 
 
+@pytest.fixture(autouse=True)
+def isolated_cache(home):
+    """Do not share the cached transcripts between tests."""
+
+
 # Test cases for is_youtube_video function
 @pytest.mark.parametrize(
     "url, expected",
@@ -30,6 +40,47 @@ def test_is_youtube_video(url, expected):
     assert is_youtube_video(url) == expected
 
 
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://www.youtube.com/playlist?list=PLlrxD0HtieHhS8VzuMCfQD4uJ9yne1mE6", True),
+        ("https://youtube.com/playlist?si=abc&list=PL123", True),
+        ("https://www.youtube.com/@PyConUS", True),
+        ("https://www.youtube.com/@PyConUS/videos", True),
+        ("https://www.youtube.com/channel/UCMjMBMGt0WJQLeluw6qNJuA", True),
+        ("https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PL123", False),
+        ("https://www.youtube.com", False),
+    ],
+)
+def test_is_youtube_playlist(url, expected):
+    assert is_youtube_playlist(url) == expected
+
+
+def test_get_playlist_videos(monkeypatch):
+    fetched = []
+
+    def mock_fetch(url):
+        fetched.append(url)
+        text = (
+            '{"videoId":"aaaaaaaaaaa"},{"videoId":"bbbbbbbbbbb"},'
+            '{"videoId":"aaaaaaaaaaa"},{"videoId":"ccccccccccc"}'
+        )
+        return fetch.Page(url, text, "text/html")
+
+    monkeypatch.setattr(fetch, "fetch", mock_fetch)
+
+    assert get_playlist_videos("https://www.youtube.com/@PyConUS") == [
+        "https://www.youtube.com/watch?v=aaaaaaaaaaa",
+        "https://www.youtube.com/watch?v=bbbbbbbbbbb",
+        "https://www.youtube.com/watch?v=ccccccccccc",
+    ]
+    get_playlist_videos("https://youtube.com/playlist?list=PL123")
+    assert fetched == [
+        "https://www.youtube.com/@PyConUS/videos",
+        "https://www.youtube.com/playlist?list=PL123",
+    ]
+
+
 def test_is_youtube_video_none_input():
     with pytest.raises(AttributeError):
         is_youtube_video(None)
@@ -94,10 +145,17 @@ def youtube_video_url_with_transcripts_disabled():
 
 
 def assert_transcript_disabled(capsys, excinfo):
-    # Ensure `TranscriptsDisabled` was raised before `SystemExit`.
-    assert isinstance(excinfo.value.__context__, TranscriptsDisabled)
+    # Ensure `TranscriptsDisabled` was raised before `TranscriptUnavailable`.
+    assert isinstance(excinfo.value.__cause__, TranscriptsDisabled)
+
+    # The caller explains the error, if it has to.
+    assert capsys.readouterr().err == ""
+
+
+def test_exit_transcripts_disabled(capsys):
+    with pytest.raises(SystemExit) as excinfo:
+        exit_transcripts_disabled()
 
-    # Check the error message is as expected.
     captured = capsys.readouterr()
     expected_error = (
         "Error: No transcripts available for this video.\n"
@@ -109,8 +167,6 @@ def assert_transcript_disabled(capsys, excinfo):
         "\n"
     )
     assert captured.err == expected_error
-
-    # Check that the exit code is `1`.
     assert excinfo.value.code == 1
 
 
@@ -122,8 +178,8 @@ def test_youtube_transcript_disabled_real(youtube_video_url_with_transcripts_dis
     This test uses the real `youtube_transcript_api` package.
     Therefore, this test takes more time to run.
     """
-    # Call `get_transcript()` and expect it to raise `SystemExit`.
-    with pytest.raises(SystemExit) as excinfo:
+    # Call `get_transcript()` and expect it to raise `TranscriptUnavailable`.
+    with pytest.raises(TranscriptUnavailable) as excinfo:
         get_transcript(youtube_video_url_with_transcripts_disabled)
     assert_transcript_disabled(capsys, excinfo)
 
@@ -148,8 +204,8 @@ def test_youtube_transcript_disabled_mocked(
         mock_get_transcript,
     )
 
-    # Call `get_transcript()` and expect it to raise `SystemExit`.
-    with pytest.raises(SystemExit) as excinfo:
+    # Call `get_transcript()` and expect it to raise `TranscriptUnavailable`.
+    with pytest.raises(TranscriptUnavailable) as excinfo:
         get_transcript(youtube_video_url_with_transcripts_disabled)
     assert_transcript_disabled(capsys, excinfo)
 
@@ -241,3 +297,51 @@ def test_format_transcript_with_timecode():
     ]
     expected = "|0.0| Hello world! |2.0| This is a test."
     assert expected == format_transcript(transcript, timecode=True)
+
+
+def test_get_transcript_is_cached(monkeypatch):
+    calls = []
+
+    def mock_list_transcripts(video_id):
+        calls.append(video_id)
+
+        class MockTranscriptList:
+            def find_transcript(self, _):
+                class MockTranscript:
+                    language_code = "en"
+
+                    def fetch(self):
+                        return [{"text": "Mocked transcript", "start": 0.0, "duration": 1.5}]
+
+                return MockTranscript()
+
+        return MockTranscriptList()
+
+    monkeypatch.setattr(
+        "youtube_transcript_api.YouTubeTranscriptApi.list_transcripts",
+        mock_list_transcripts,
+    )
+
+    first = get_transcript("https://youtu.be/dQw4w9WgXcQ")
+    second = get_transcript("https://www.youtube.com/watch?v=dQw4w9WgXcQ")
+
+    assert first == second == [{"text": "Mocked transcript", "start": 0.0, "duration": 1.5}]
+    assert calls == ["dQw4w9WgXcQ"]
+
+
+def test_transcripts_disabled_is_cached(monkeypatch):
+    calls = []
+
+    def mock_list_transcripts(video_id):
+        calls.append(video_id)
+        raise TranscriptsDisabled(video_id)
+
+    monkeypatch.setattr(
+        "youtube_transcript_api.YouTubeTranscriptApi.list_transcripts",
+        mock_list_transcripts,
+    )
+
+    for _ in range(2):
+        with pytest.raises(TranscriptUnavailable):
+            get_transcript("https://youtu.be/_Tp8HQ7eVx0")
+    assert calls == ["_Tp8HQ7eVx0"]